@@ -3,9 +3,12 @@ import sys
 import logging
 import socket
 import select
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, make_response
+import codecs
+import json
+import queue
+import posixpath
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_from_directory, make_response, Response
 from flask_socketio import SocketIO, emit
-from flask_session import Session
 import yaml
 import os
 import paramiko
@@ -14,26 +17,93 @@ import time
 import subprocess
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash
-from functools import wraps
+from functools import partial, wraps
 from datetime import datetime, timedelta
 import shutil
-import requests
-import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from urllib.parse import quote
 
 # セッションマネージャーをインポート
 from session_manager import initialize_session_manager, get_session_manager
+from config_store import ConfigStore, create_backend
+from server_registry import ServerRegistry
+from ping_engine import PROBE_MODES, PingEngine, PingScheduler, PingStatusBroadcaster, ProbeTarget
+from ping_history import PingHistory
+from icmp_prober import IcmpProber
+from tcp_prober import TcpProber
+from ssh_reactor import SshReactor
+from scrollback_buffer import ScrollbackBuffer
+from ssh_transport_pool import SshTransportPool, transport_pool_key
+from ssh_key_cache import SshKeyCache
+from ssh_fanout import SshFanout
+from sftp_transfer import TransferProgress, iter_remote_file, write_remote_file
+from http_client import HttpClient
+from dns_cache import DnsCache
+from extra_import import (DEFAULT_SOURCE_ID, ExtraImportScheduler, HostListFetcher, is_http_url, load_sources,
+                          merge_extra_sources, release_extra_servers)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_FILE_DIR"] = os.path.join(os.path.dirname(__file__), 'config', 'flask_session')
+# セッションの保存先: "sqlite"（メモリのキャッシュ + config/sessions.db。再起動後もログインを維持）または "memory"（プロセス内のみ）
+app.config["SESSION_BACKEND"] = "sqlite"
+app.config["SESSION_DB_PATH"] = os.path.join(os.path.dirname(__file__), 'config', 'sessions.db')
+app.config["SESSION_CACHE_SIZE"] = 10000  # メモリに保持するセッションの最大数（memory の場合は超えた分が古い順にログアウトされる）
+app.config["SESSION_TOUCH_INTERVAL"] = 60  # 内容が変わらないリクエストでのセッション有効期限の延長をDBに書き込む最小間隔（秒）
+app.config["SESSION_FILE_DIR"] = os.path.join(os.path.dirname(__file__), 'config', 'flask_session')  # SSHタブ状態ファイルの保存先
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(hours=1)
 app.config["SESSION_COOKIE_SECURE"] = False  # HTTPでも動作するように
 app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 app.config["SESSION_CLEANUP_INTERVAL"] = 3600  # 1時間ごとにクリーンアップ
-Session(app)
+# サーバー/SSH鍵設定の保存先: "yaml"（servers.yaml / ssh_keys.yaml）または "sqlite"（config/serverdeck.db）
+app.config["CONFIG_STORAGE_BACKEND"] = "yaml"
+app.config["PING_INTERVAL"] = 10  # Ping監視の基本間隔（秒）
+app.config["PING_MIN_INTERVAL"] = 5  # 状態が変化した直後の間隔（秒）
+app.config["PING_MAX_STABLE_INTERVAL"] = 60  # 安定しているホストの最大間隔（秒）
+app.config["PING_MAX_DOWN_INTERVAL"] = 300  # ダウンし続けるホストのバックオフ上限（秒）
+app.config["PING_SYNC_INTERVAL"] = 5  # 監視対象の設定変更を反映する間隔（秒）
+app.config["PING_BROADCAST_INTERVAL"] = 1  # Ping結果をまとめてクライアントに送る間隔（秒）
+app.config["PING_HISTORY_SIZE"] = 2880  # ホストごとに保持するPing履歴の件数
+app.config["PING_CONCURRENCY"] = 64  # 同時に実行するPingの最大数
+app.config["PING_METHOD"] = "auto"  # "auto": 可能ならネイティブICMPソケット / "subprocess": 常にpingコマンド
+app.config["PING_TCP_TIMEOUT"] = 2  # TCP/SSHプローブの接続待ち時間（秒）
+app.config["PING_TCP_MAX_IN_FLIGHT"] = 1024  # 同時に接続を試みるTCP/SSHプローブの最大数
+app.config["SSH_KEEPALIVE_INTERVAL"] = 30  # SSH接続のkeepalive送信間隔（秒、0で無効）
+app.config["SSH_OUTPUT_FLUSH_BYTES"] = 65536  # SSH出力をまとめて送るサイズのしきい値（バイト）
+app.config["SSH_OUTPUT_FLUSH_DELAY"] = 0.008  # 連続するSSH出力をまとめる最大遅延（秒）
+app.config["SSH_OUTPUT_BINARY"] = True  # 対応クライアントにはSSH出力をバイナリ（生バイト列）のまま送る
+# SSHセッションのフロー制御。1セッションがサーバー側で保持する出力は概ね
+# SSH_FLOW_WINDOW + SSH_CHANNEL_WINDOW バイトまでに制限される
+app.config["SSH_FLOW_WINDOW"] = 1024 * 1024  # ブラウザの受信確認なしに送る最大バイト数
+app.config["SSH_CHANNEL_WINDOW"] = 1024 * 1024  # SSHチャネルの受信ウィンドウ（読み取り停止中にリモートから受け取る上限）
+app.config["SSH_DETACH_GRACE_PERIOD"] = 300  # ブラウザ切断後もマルチタブSSHセッションを維持する時間（秒、0で即時切断）
+app.config["SSH_SCROLLBACK_BYTES"] = 256 * 1024  # 再接続時に再送するタブごとの出力履歴（バイト）
+app.config["SSH_TRANSPORT_IDLE_TIMEOUT"] = 60  # タブがすべて閉じられたSSH接続を再利用のために維持する時間（秒、0で即時切断）
+app.config["SSH_CONNECT_WORKERS"] = 16  # 並行して確立するSSH接続の最大数（接続処理はSocket.IOハンドラーの外で行う）
+app.config["SSH_RESTORE_CONCURRENCY"] = 8  # タブの一括復元で同時に接続するタブの最大数
+app.config["SSH_EXEC_PARALLELISM"] = 16  # 一括実行で同時にコマンドを実行するサーバー数の既定値
+app.config["SSH_EXEC_MAX_PARALLELISM"] = 64  # 一括実行で指定できる同時実行数の上限
+app.config["SSH_EXEC_TIMEOUT"] = 60  # 一括実行のサーバーごとのタイムアウト（秒）の既定値
+app.config["SSH_EXEC_MAX_OUTPUT"] = 1024 * 1024  # 一括実行でサーバーごとに返す出力の上限（バイト）
+app.config["SSH_TRANSPORT_MAX_CHANNELS"] = 8  # 1つのSSH接続で共有するタブの最大数（SFTP転送の分を残してサーバーの MaxSessions より小さくする）
+app.config["SFTP_CHUNK_SIZE"] = 256 * 1024  # SFTP転送で1回に読み書きするサイズ（バイト）
+app.config["SFTP_READ_AHEAD"] = 4 * 1024 * 1024  # SFTPダウンロードで先行して要求する最大バイト数（回線の帯域×遅延以上にする）
+app.config["SFTP_WINDOW_SIZE"] = 4 * 1024 * 1024  # SFTPチャネルの受信ウィンドウ（バイト）
+app.config["SFTP_PROGRESS_INTERVAL"] = 0.25  # SFTP転送の進捗を通知する間隔（秒）
+app.config["EXTRA_IMPORT_INTERVAL"] = 300  # Extra import の取り込み元ごとの取得間隔の既定値（秒）
+app.config["EXTRA_IMPORT_TIMEOUT"] = 10  # Extra import の取り込み元ごとの取得全体のタイムアウトの既定値（秒）
+app.config["EXTRA_IMPORT_WORKERS"] = 8  # 同時に取得する Extra import の取り込み元の最大数
+app.config["EXTRA_IMPORT_RELOAD_INTERVAL"] = 60  # extra_import.yaml の取り込み元の変更を反映する間隔（秒）
+app.config["HTTP_MAX_CONNECTIONS_PER_HOST"] = 8  # 外部へのHTTPリクエストで接続先ごとに同時に開く最大接続数
+app.config["HTTP_RETRIES"] = 3  # 外部へのHTTPリクエストの接続エラー・一時的なエラー応答での再試行回数
+app.config["HTTP_RETRY_BACKOFF"] = 0.5  # 再試行の待ち時間の基準（秒、ジッター付きで再試行ごとに倍増）
+app.config["HTTP_TIMEOUT"] = 10  # 外部へのHTTPリクエストの既定のタイムアウト（秒）
+app.config["DNS_CACHE_TTL"] = 300  # 解決できたホスト名をキャッシュする時間（秒）
+app.config["DNS_NEGATIVE_TTL"] = 30  # 解決できなかったホスト名をキャッシュする時間（秒）
+app.config["DNS_RESOLVER_WORKERS"] = 16  # 並列に名前解決を行うスレッド数
+app.config["EXTRA_IMPORT_REQUIRE_DNS"] = False  # True の場合、名前解決できない Extra import のホストは追加しない
 
 socketio = SocketIO(app)
 
@@ -41,7 +111,37 @@ socketio = SocketIO(app)
 initialize_session_manager(app)
 
 # --- Ping Utility ---
+# Ping監視・TCPプローブ・SSH接続・Extra import で共有する名前解決キャッシュ
+dns_cache = DnsCache(ttl=app.config["DNS_CACHE_TTL"], negative_ttl=app.config["DNS_NEGATIVE_TTL"],
+                     workers=app.config["DNS_RESOLVER_WORKERS"])
+
+icmp_prober = IcmpProber()
+
+def start_icmp_prober():
+    """ネイティブICMPプローバーを開始（使えない環境ではpingコマンドを使い続ける）"""
+    if app.config["PING_METHOD"] != "auto":
+        return
+    try:
+        icmp_prober.start()
+    except OSError as e:
+        app.logger.info(f"Native ICMP socket not available ({e}); falling back to the ping command.")
+
 def ping_host(host, count=1, timeout=1):
+    # 名前解決はキャッシュで行い、解決できない名前はpingコマンドを起動せずにオフラインとする
+    try:
+        addresses = dns_cache.lookup(host)
+    except socket.gaierror as e:
+        app.logger.debug(f"Could not resolve {host}: {e}")
+        return {'status': 'offline', 'response_time': None, 'packet_loss': 100.0}
+    # ネイティブICMPプローバーはIPv4のみ対応のため、IPv4アドレスを優先する
+    address = next((sockaddr[0] for family, sockaddr in addresses if family == socket.AF_INET), addresses[0][1][0])
+    if icmp_prober.available:
+        result_data = icmp_prober.ping(address, count=count, timeout=timeout)
+        if result_data is not None:
+            return result_data
+    return _ping_host_subprocess(address, count=count, timeout=timeout)
+
+def _ping_host_subprocess(host, count=1, timeout=1):
     param = '-n' if sys.platform.startswith('win') else '-c'
     command = ['ping', param, str(count), '-W' if sys.platform != 'win32' else '-w', str(timeout * 1000 if sys.platform.startswith('win') else timeout), host]
     
@@ -84,6 +184,12 @@ def ping_host(host, count=1, timeout=1):
     
     return result_data
 
+# ICMPを遮断しているホスト向けのTCPポート/SSHバナーによるプローブ
+tcp_prober = TcpProber(timeout=app.config["PING_TCP_TIMEOUT"], max_in_flight=app.config["PING_TCP_MAX_IN_FLIGHT"],
+                       getaddrinfo=dns_cache.getaddrinfo)
+
+ping_engine = PingEngine(ping_host, concurrency=app.config["PING_CONCURRENCY"], tcp_prober=tcp_prober)
+
 # --- Logging Configuration ---
 app.logger.setLevel(logging.DEBUG)
 handler = logging.StreamHandler(sys.stdout)
@@ -106,16 +212,36 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 BACKUP_DIR = os.path.join(CONFIG_DIR, 'backup')
 os.makedirs(BACKUP_DIR, exist_ok=True)
+CONFIG_DB_PATH = os.path.join(CONFIG_DIR, 'serverdeck.db')
 
 active_ssh_sessions = {}
 ssh_connection_status = {}  # 接続状態を追跡するための辞書
 multitab_ssh_sessions = {}  # マルチタブSSHセッション管理
+# 全SSHチャネルの受信を待ち受けるI/Oリアクター（出力はチャネルごとにまとめて送る）
+ssh_reactor = SshReactor(flush_bytes=app.config["SSH_OUTPUT_FLUSH_BYTES"],
+                         flush_delay=app.config["SSH_OUTPUT_FLUSH_DELAY"])
+# 同じ接続先・認証情報のマルチタブSSHで共有するトランスポートのプール
+ssh_transport_pool = SshTransportPool(idle_timeout=app.config["SSH_TRANSPORT_IDLE_TIMEOUT"],
+                                      max_channels=app.config["SSH_TRANSPORT_MAX_CHANNELS"])
+ssh_key_cache = SshKeyCache()  # パース済みSSH秘密鍵（鍵ファイルの変更時に再読み込み）
+# SSH接続（鍵交換・認証・シェル作成）を行うワーカー
+ssh_connect_executor = ThreadPoolExecutor(max_workers=app.config["SSH_CONNECT_WORKERS"], thread_name_prefix='ssh-connect')
+ssh_connecting_tabs = {}  # 接続処理中のタブID -> {'cancel': キャンセル要求（threading.Event）, 'owner': ログインセッションID, 'sid': 要求したクライアント}
+ssh_connecting_lock = threading.Lock()
+SSH_POOL_CONNECT_WAIT = 15  # 同じ接続先への他のタブの接続完了を待つ最大時間（秒）
+# 複数サーバーでのコマンド一括実行（プール済みのトランスポートを再利用する）
+ssh_fanout = SshFanout(lambda server_info, timeout: _open_pooled_ssh(server_info, timeout=timeout),
+                       parallelism=app.config["SSH_EXEC_PARALLELISM"],
+                       max_parallelism=app.config["SSH_EXEC_MAX_PARALLELISM"],
+                       timeout=app.config["SSH_EXEC_TIMEOUT"],
+                       max_output=app.config["SSH_EXEC_MAX_OUTPUT"])
 server_ping_status = {}
 
 # --- Config Loading/Saving ---
-def backup_config_file(file_path):
+def backup_config_file(file_path, config_data=None):
+    """設定ファイルをバックアップ（config_data を渡した場合はその内容をYAMLとして書き出す）"""
     try:
-        if not os.path.exists(file_path):
+        if config_data is None and not os.path.exists(file_path):
             app.logger.warning(f"Backup failed: Source file does not exist: {file_path}")
             return
 
@@ -125,7 +251,11 @@ def backup_config_file(file_path):
         backup_file_name = f"{base_name.split('_')[0]}_{timestamp}{ext}"
         backup_path = os.path.join(BACKUP_DIR, backup_file_name)
 
-        shutil.copy2(file_path, backup_path)
+        if config_data is None:
+            shutil.copy2(file_path, backup_path)
+        else:
+            with open(backup_path, 'w') as f:
+                yaml.dump(config_data, f, indent=2, sort_keys=False)
         app.logger.info(f"Backed up {file_name} to {backup_path}")
 
         all_backups = []
@@ -143,47 +273,45 @@ def backup_config_file(file_path):
     except Exception as e:
         app.logger.error(f"Error backing up {file_path}: {e}")
 
+def _normalize_server_entry(server):
+    if 'ping_enabled' not in server:
+        server['ping_enabled'] = True
+    if 'is_extra' not in server:
+        server['is_extra'] = False
+    # tagsフィールドの正規化
+    if 'tags' in server:
+        if isinstance(server['tags'], str):
+            if server['tags'].strip():
+                server['tags'] = [tag.strip() for tag in server['tags'].split(',')]
+            else:
+                server['tags'] = []
+        elif not isinstance(server['tags'], list):
+            server['tags'] = []
+    else:
+        server['tags'] = []
+
+# 設定ファイルはパース済みの状態でキャッシュし、ファイル変更時のみ再読み込みする
+# SQLiteバックエンドでは1件単位の追加・更新・削除が行単位の書き込みになり、
+# バックアップは文書全体の保存（インポート等）時のみ作成される
+servers_store = ConfigStore(
+    SERVERS_CONFIG_PATH, 'servers', normalizer=_normalize_server_entry, on_save=backup_config_file,
+    registry_class=ServerRegistry,
+    backend=create_backend(app.config["CONFIG_STORAGE_BACKEND"], SERVERS_CONFIG_PATH, 'servers', CONFIG_DB_PATH))
+ssh_keys_store = ConfigStore(
+    SSH_KEYS_CONFIG_PATH, 'ssh_keys', on_save=backup_config_file,
+    backend=create_backend(app.config["CONFIG_STORAGE_BACKEND"], SSH_KEYS_CONFIG_PATH, 'ssh_keys', CONFIG_DB_PATH))
+
 def load_servers_config():
-    if os.path.exists(SERVERS_CONFIG_PATH):
-        with open(SERVERS_CONFIG_PATH, 'r') as f:
-            config = yaml.safe_load(f) or {"servers": []}
-            for server in config.get('servers', []):
-                if 'ping_enabled' not in server:
-                    server['ping_enabled'] = True
-                if 'is_extra' not in server:
-                    server['is_extra'] = False
-                # tagsフィールドの正規化
-                if 'tags' in server:
-                    if isinstance(server['tags'], str):
-                        if server['tags'].strip():
-                            server['tags'] = [tag.strip() for tag in server['tags'].split(',')]
-                        else:
-                            server['tags'] = []
-                    elif not isinstance(server['tags'], list):
-                        server['tags'] = []
-                else:
-                    server['tags'] = []
-                
-            return config
-    return {"servers": []}
+    return servers_store.load()
 
 def save_servers_config(config_data):
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    with open(SERVERS_CONFIG_PATH, 'w') as f:
-        yaml.dump(config_data, f, indent=2, sort_keys=False)
-    backup_config_file(SERVERS_CONFIG_PATH)
+    servers_store.save(config_data)
 
 def load_ssh_keys_config():
-    if os.path.exists(SSH_KEYS_CONFIG_PATH):
-        with open(SSH_KEYS_CONFIG_PATH, 'r') as f:
-            return yaml.safe_load(f) or {"ssh_keys": []}
-    return {"ssh_keys": []}
+    return ssh_keys_store.load()
 
 def save_ssh_keys_config(config_data):
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    with open(SSH_KEYS_CONFIG_PATH, 'w') as f:
-        yaml.dump(config_data, f, indent=2, sort_keys=False)
-    backup_config_file(SSH_KEYS_CONFIG_PATH)
+    ssh_keys_store.save(config_data)
 
 def load_users_config():
     if os.path.exists(USERS_CONFIG_PATH):
@@ -213,6 +341,26 @@ def save_extra_import_config(config_data):
     with open(EXTRA_IMPORT_CONFIG_PATH, 'w') as f:
         yaml.dump(config_data, f, indent=2, sort_keys=False)
 
+def load_extra_import_sources():
+    """extra_import.yaml の url と sources から取り込み元の一覧を作成"""
+    return load_sources(load_extra_import_config(), default_interval=app.config["EXTRA_IMPORT_INTERVAL"],
+                        default_timeout=app.config["EXTRA_IMPORT_TIMEOUT"])
+
+# 外部へのHTTPリクエストはすべてこのクライアントを使う（キープアライブ・再試行・接続先ごとの接続数の上限）
+http_client = HttpClient(max_per_host=app.config["HTTP_MAX_CONNECTIONS_PER_HOST"],
+                         retries=app.config["HTTP_RETRIES"],
+                         backoff=app.config["HTTP_RETRY_BACKOFF"],
+                         timeout=app.config["HTTP_TIMEOUT"])
+
+# 取り込み元ごとに前回のレスポンスの ETag / Last-Modified を保持し、変更がなければ取得を省略する
+extra_import_fetcher = HostListFetcher(get=http_client.get)
+extra_import_scheduler = ExtraImportScheduler(extra_import_fetcher, lambda: merge_extra_import(),
+                                              load_sources=load_extra_import_sources,
+                                              workers=app.config["EXTRA_IMPORT_WORKERS"],
+                                              reload_interval=app.config["EXTRA_IMPORT_RELOAD_INTERVAL"])
+extra_import_merge_lock = threading.Lock()
+extra_import_applied_urls = {}  # 取り込み元ID -> 最後に反映した時のURL（URLが変わった取り込み元はフラグをリセット）
+
 
 # Type display names mapping
 TYPE_DISPLAY_NAMES = {
@@ -222,116 +370,149 @@ TYPE_DISPLAY_NAMES = {
     'kvm': 'KVM',
 }
 
-def run_extra_import():
-    with app.app_context():
-        app.logger.info("Running extra import...")
-        extra_import_config = load_extra_import_config()
-        url = extra_import_config.get('url')
-        previous_url = extra_import_config.get('previous_url', '')
-
-        if not url:
-            app.logger.info("Extra import URL not configured. Skipping.")
-            config = load_servers_config()
-            servers = config.get('servers', [])
-            updated_servers = []
-            for server in servers:
-                if server.get('is_extra'):
-                    server['is_extra'] = False
-                    server['is_new'] = False
-                    server['is_deleted'] = False
-                updated_servers.append(server)
-            config['servers'] = updated_servers
-            save_servers_config(config)
-            return
-
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            imported_hosts = []
-            for line in response.text.splitlines():
-                stripped_line = line.strip()
-                if stripped_line:
-                    host_part = stripped_line.split()[0]
-                    if host_part.endswith('.'):
-                        host_part = host_part[:-1]
-                    imported_hosts.append(host_part)
-
-            config = load_servers_config()
-            servers = config.get('servers', [])
-            
-            # URLが変更された場合、またはprevious_urlが空でurlが設定されている場合のみis_newをリセット
-            if url != previous_url or (previous_url == "" and url != ""):
-                for server in servers:
-                    if server.get('is_extra'):
-                        server['is_new'] = False
-                        server['is_deleted'] = False
-                extra_import_config['previous_url'] = url
-                save_extra_import_config(extra_import_config)
-                app.logger.info(f"Extra import URL changed from '{previous_url}' to '{url}'. Resetting is_new flags.")
-
-            existing_hosts_map = {s.get('host'): s for s in servers if s.get('host')}
-            
-            newly_added_servers = []
-            for host in imported_hosts:
-                if host not in existing_hosts_map:
-                    new_server = {
-                        'id': f"server-{int(time.time() * 1000)}-{random.randint(1000, 9999)}",
-                        'name': host.split('.')[0],
-                        'type': 'node',
-                        'port': 22,
-                        'host': host,
-                        'is_extra': True,
-                        'is_new': True, # 新規追加なのでTrue
-                        'ping_enabled': True
-                    }
-                    servers.append(new_server)
-                    newly_added_servers.append(new_server)
-                    app.logger.info(f"Added new server from extra import: {host}")
-                else:
-                    # 既存のextra importされたサーバーが引き続き存在する場合
-                    # is_newは既にFalseにリセットされているか、元々Falseなので何もしない
-                    pass
+def run_extra_import(force=False):
+    """
+    取り込み元の設定を読み直し、すべての取り込み元を即時に取得する
 
-            # 削除されたextra importサーバーのマーク
-            for server in servers:
-                if server.get('is_extra') and server.get('host') not in imported_hosts:
-                    server['is_deleted'] = True
-                    server.pop('is_new', None) # 削除されるものはis_newを削除
+    取得は取り込み元ごとにワーカーで並行して行い、結果は取得が完了したものから
+    merge_extra_import() でまとめて反映する。前回から変更がない（304）取り込み元は何もしない。
 
-            save_servers_config(config)
-            app.logger.info("Extra import finished.")
-            socketio.emit('extra_import_finished')
+    Args:
+        force: 前回の取得結果に関係なく一覧全体を取得する（設定変更などのユーザー操作の直後）
+    """
+    app.logger.info("Running extra import...")
+    sources = load_extra_import_sources()
+    extra_import_scheduler.sync(sources)
+    if not sources:
+        merge_extra_import()
+        return
+    extra_import_scheduler.refresh(force=force)
+
+def merge_extra_import():
+    """全取り込み元の最新のホスト一覧を1回の保存でサーバー設定に反映する（差分がなければ保存しない）"""
+    with extra_import_merge_lock, app.app_context():
+        sources = extra_import_scheduler.sources()
+        if not sources:
+            changed = release_extra_servers(servers_store.snapshot())
+            if changed:
+                servers_store.apply_changes(changed)
+                app.logger.info(f"Extra import URL not configured. Released {len(changed)} extra imported servers.")
+                socketio.emit('extra_import_finished')
+            else:
+                app.logger.info("Extra import URL not configured. Skipping.")
+            return
 
-        except requests.RequestException as e:
-            app.logger.error(f"Error during extra import: {e}")
+        results = extra_import_scheduler.results()
+        extra_import_config = load_extra_import_config()
+        applied_urls = dict(extra_import_applied_urls)
+        applied_urls.setdefault(DEFAULT_SOURCE_ID, extra_import_config.get('previous_url', ''))
+        # URLが変更された取り込み元（previous_urlが空の場合を含む）は既存の取り込み済みサーバーのフラグをリセット
+        reset = {source.id for source in sources
+                 if source.id in results and source.id in applied_urls and applied_urls[source.id] != source.url}
+
+        added, changed = merge_extra_sources(servers_store.snapshot(), results, [source.id for source in sources], reset)
+        # 追加するホストを並列に名前解決して検証する（結果はPing監視とSSH接続でも使われる）
+        resolved = dns_cache.resolve_many(host for host, _source_id in added)
+        new_servers = []
+        for host, source_id in added:
+            if resolved.get(host) is None:
+                if app.config["EXTRA_IMPORT_REQUIRE_DNS"]:
+                    app.logger.warning(f"Skipped extra import host {host} from source {source_id}: name could not be resolved.")
+                    continue
+                app.logger.warning(f"Extra import host {host} from source {source_id} could not be resolved.")
+            new_servers.append({
+                'id': f"server-{uuid.uuid4().hex}",  # 一括追加でも衝突しないID
+                'name': host.split('.')[0],
+                'type': 'node',
+                'port': 22,
+                'host': host,
+                'is_extra': True,
+                'is_new': True, # 新規追加なのでTrue
+                'extra_source': source_id,  # 取り込み元ID
+                'ping_enabled': True
+            })
+            app.logger.info(f"Added new server from extra import source {source_id}: {host}")
+
+        # 全取り込み元の差分を1回で保存する（差分がなければ設定ファイルの書き込みとバックアップを行わない）
+        count = servers_store.apply_changes(changed + new_servers)
+
+        for source in sources:
+            if source.id in results:
+                extra_import_applied_urls[source.id] = source.url
+                if source.id in reset:
+                    app.logger.info(f"Extra import source {source.id} URL changed to '{source.url}'. Resetting is_new flags.")
+        default_source = next((source for source in sources if source.id == DEFAULT_SOURCE_ID), None)
+        if (default_source is not None and default_source.id in results
+                and extra_import_config.get('previous_url') != default_source.url):
+            extra_import_config['previous_url'] = default_source.url
+            save_extra_import_config(extra_import_config)
+
+        if not count:
+            app.logger.info("Extra import finished. No changes.")
+            return
+        app.logger.info(f"Extra import finished. {len(new_servers)} added, {len(changed)} updated "
+                        f"from {len(results)} of {len(sources)} sources.")
+        socketio.emit('extra_import_finished')
 
 def schedule_extra_import():
+    """取り込み元ごとの間隔での定期取得を開始（設定ファイルの変更は EXTRA_IMPORT_RELOAD_INTERVAL ごとに反映）"""
     run_extra_import()
-    threading.Timer(300, schedule_extra_import).start()
+    extra_import_scheduler.start()
 
 # Ping monitoring background task
+def _probe_target(server):
+    """サーバー設定からプローブ対象を作成（probe_mode: 'icmp' / 'tcp' / 'ssh'）"""
+    mode = server.get('probe_mode') or 'icmp'
+    if mode not in PROBE_MODES:
+        mode = 'icmp'
+    try:
+        port = int(server.get('port') or 22)
+    except (TypeError, ValueError):
+        port = 22
+    return ProbeTarget(server['host'], mode, port)
+
+# Ping結果は変化のあったものだけをまとめて送信する
+ping_broadcaster = PingStatusBroadcaster(socketio.emit, flush_interval=app.config["PING_BROADCAST_INTERVAL"])
+
+ping_history = PingHistory(capacity=app.config["PING_HISTORY_SIZE"])
+
+def _handle_ping_result(server_id, ping_result):
+    server_ping_status[server_id] = ping_result
+    ping_history.record(server_id, ping_result)
+    ping_broadcaster.publish(server_id, ping_result)
+
+ping_scheduler = PingScheduler(
+    ping_engine, _handle_ping_result,
+    base_interval=app.config["PING_INTERVAL"],
+    min_interval=app.config["PING_MIN_INTERVAL"],
+    max_stable_interval=app.config["PING_MAX_STABLE_INTERVAL"],
+    max_down_interval=app.config["PING_MAX_DOWN_INTERVAL"])
+
 def run_ping_monitoring():
+    """監視対象をスケジューラーに同期し続ける（プローブの発行はスケジューラーが行う）"""
     with app.app_context():
         app.logger.info("Starting ping monitoring thread...")
+        ping_scheduler.start()
+        ping_broadcaster.start()
         while True:
-            config = load_servers_config()
-            servers = config.get('servers', [])
-            for server in servers:
+            targets = {}
+            for server in servers_store.snapshot():
                 server_id = server.get('id')
                 host = server.get('host')
                 ping_enabled = server.get('ping_enabled', False)
 
                 if server_id and host and ping_enabled:
-                    app.logger.debug(f"Pinging {host} (ID: {server_id}) for monitoring...")
-                    ping_result = ping_host(host)
-                    server_ping_status[server_id] = ping_result
-                    socketio.start_background_task(socketio.emit, 'ping_status_update', {'server_id': server_id, 'status': ping_result['status'], 'response_time': ping_result['response_time'], 'packet_loss': ping_result['packet_loss']})
-                elif server_id and server_id in server_ping_status:
-                    del server_ping_status[server_id]
-                    socketio.start_background_task(socketio.emit, 'ping_status_update', {'server_id': server_id, 'status': 'disabled', 'response_time': None, 'packet_loss': None})
-
-            time.sleep(10)
+                    targets[server_id] = _probe_target(server)
+
+            ping_scheduler.sync(targets)
+            # 監視を無効にしたサーバーと削除されたサーバーの状態・履歴を破棄する
+            for server_id in [server_id for server_id in list(server_ping_status) if server_id not in targets]:
+                server_ping_status.pop(server_id, None)
+                ping_history.forget(server_id)
+                ping_broadcaster.remove(server_id)
+            # 監視対象の名前解決を期限切れの前に済ませておく（プローブが名前解決を待たないように）
+            dns_cache.prefetch(target.host for target in targets.values())
+            time.sleep(app.config["PING_SYNC_INTERVAL"])
 
 # --- Authentication ---
 def login_required(f):
@@ -553,8 +734,7 @@ def ssh_multitab():
 @login_required
 def get_servers():
     try:
-        config = load_servers_config()
-        return jsonify(config.get('servers', []))
+        return jsonify(list(servers_store.snapshot()))
     except Exception as e:
         app.logger.error(f"Error getting servers: {e}")
         return jsonify({"error": f"Failed to get servers: {e}"}), 500
@@ -563,10 +743,11 @@ def get_servers():
 @login_required
 def get_server(server_id):
     try:
-        config = load_servers_config()
-        server = next((s for s in config.get('servers', []) if s['id'] == server_id), None)
+        server = servers_store.get(server_id)
         if not server:
             return jsonify({"error": "Server not found"}), 404
+        # 詳細を開いたサーバーは最新の状態を見せるため即時にPingする
+        ping_scheduler.request_priority(server_id)
         return jsonify(server)
     except Exception as e:
         app.logger.error(f"Error getting server {server_id}: {e}")
@@ -591,12 +772,8 @@ def add_server():
     else:
         new_server['tags'] = []
     
-    config = load_servers_config()
-    servers = config.get('servers', [])
-    if any(s['id'] == new_server['id'] for s in servers):
+    if servers_store.add(new_server) is None:
         return jsonify({"error": f"Server with ID '{new_server['id']}' already exists"}), 409
-    servers.append(new_server)
-    save_servers_config(config)
     return jsonify(new_server), 201
 
 @app.route('/api/servers/<server_id>', methods=['PUT'])
@@ -613,33 +790,17 @@ def update_server(server_id):
         elif not isinstance(updated_data['tags'], list):
             updated_data['tags'] = []
     
-    config = load_servers_config()
-    servers = config.get('servers', [])
-    found = False
-    for i, server in enumerate(servers):
-        if server['id'] == server_id:
-            servers[i] = {**server, **updated_data}
-            servers[i]['is_new'] = False
-            servers[i]['is_deleted'] = False
-            # is_extraフラグはそのまま維持（Extra Import管理から外さない）
-            found = True
-            break
-    if not found:
+    # is_extraフラグはそのまま維持（Extra Import管理から外さない）
+    server = servers_store.update(server_id, {**updated_data, 'is_new': False, 'is_deleted': False})
+    if server is None:
         return jsonify({"error": "Server not found"}), 404
-    save_servers_config(config)
-    return jsonify(servers[i])
+    return jsonify(server)
 
 @app.route('/api/servers/<server_id>', methods=['DELETE'])
 @login_required
 def delete_server(server_id):
-    config = load_servers_config()
-    servers = config.get('servers', [])
-    original_len = len(servers)
-    servers = [s for s in servers if s['id'] != server_id]
-    if len(servers) == original_len:
+    if not servers_store.delete([server_id]):
         return jsonify({"error": "Server not found"}), 404
-    config['servers'] = servers
-    save_servers_config(config)
     return jsonify({"message": "Server deleted"}), 204
 
 @app.route('/bulk_delete_servers', methods=['POST'])
@@ -655,20 +816,14 @@ def bulk_delete_servers():
             app.logger.debug("No server IDs provided for deletion (bulk_delete_servers).")
             return jsonify({"status": "error", "message": "No server IDs provided for deletion."}), 400
 
-        config = load_servers_config()
-        servers = config.get('servers', [])
-        original_len = len(servers)
+        deleted_count = len(servers_store.delete(server_ids_to_delete))
         
-        servers = [s for s in servers if s['id'] not in server_ids_to_delete]
-        
-        if len(servers) == original_len:
+        if not deleted_count:
             app.logger.debug("No matching servers found for deletion (bulk_delete_servers).")
             return jsonify({"status": "error", "message": "No matching servers found for deletion."}), 404
         
-        config['servers'] = servers
-        save_servers_config(config)
-        app.logger.info(f"Successfully deleted {original_len - len(servers)} servers via bulk delete.")
-        return jsonify({"status": "success", "message": f"{original_len - len(servers)} servers deleted."}), 200
+        app.logger.info(f"Successfully deleted {deleted_count} servers via bulk delete.")
+        return jsonify({"status": "success", "message": f"{deleted_count} servers deleted."}), 200
     except Exception as e:
         app.logger.error(f"Error during bulk_delete_servers: {e}")
         return jsonify({"status": "error", "message": f"Failed to delete servers: {e}"}), 500
@@ -679,11 +834,32 @@ def get_extra_import_url():
     config = load_extra_import_config()
     return jsonify(config)
 
+@app.route('/api/extra_import/sources', methods=['GET'])
+@login_required
+def get_extra_import_sources():
+    """取り込み元ごとの取得状態（最終取得時刻・結果・ホスト数・所要時間）"""
+    return jsonify(extra_import_scheduler.stats())
+
+@app.route('/api/http_stats', methods=['GET'])
+@login_required
+def get_http_stats():
+    """外部へのHTTPリクエストの接続先ごとのリクエスト数・失敗数・開いた接続数"""
+    return jsonify(http_client.stats())
+
+@app.route('/api/dns_stats', methods=['GET'])
+@login_required
+def get_dns_stats():
+    """名前解決キャッシュのヒット率・エントリ数・名前解決の所要時間"""
+    return jsonify(dns_cache.stats())
+
 @app.route('/api/config/extra_import_url', methods=['POST'])
 @login_required
 def set_extra_import_url():
     data = request.json
-    new_url = data.get('url', '')
+    new_url = (data.get('url') or '').strip()
+    # ローカルファイルの取り込み元は extra_import.yaml の sources でのみ設定できる
+    if new_url and not is_http_url(new_url):
+        return jsonify({"error": "Extra import URL must start with http:// or https://"}), 400
     
     extra_import_config = load_extra_import_config()
     current_url = extra_import_config.get('url', '')
@@ -704,11 +880,11 @@ def set_extra_import_url():
         #     return jsonify({"message": "URL changed. Confirmation needed for existing extra imported servers.", "confirmation_needed": True}), 200
         # else:
         app.logger.info("Starting import directly after URL change.")
-        threading.Thread(target=run_extra_import).start()
+        threading.Thread(target=run_extra_import, kwargs={'force': True}).start()
         return jsonify({"message": "URL saved, import started."}), 200
     else:
         app.logger.info("URL is unchanged, re-triggering import.")
-        threading.Thread(target=run_extra_import).start()
+        threading.Thread(target=run_extra_import, kwargs={'force': True}).start()
         return jsonify({"message": "URL is unchanged, import re-triggered."}), 200
 
 
@@ -718,71 +894,108 @@ def confirm_extra_import_action():
     data = request.json
     action = data.get('action')
 
-    config = load_servers_config()
-    servers = config.get('servers', [])
     extra_import_config = load_extra_import_config()
-    
-    if action == 'delete_all':
-        servers = [s for s in servers if not (s.get('is_extra') and s.get('is_deleted'))]
-        app.logger.info("Confirmed: Deleted all extra imported servers marked for deletion.")
-    elif action == 'keep_all':
-        for server in servers:
-            if server.get('is_extra') and server.get('is_deleted'):
-                server['is_extra'] = False
-                server.pop('is_deleted', None)
-                server.pop('is_new', None)
-        app.logger.info("Confirmed: Kept all extra imported servers, removed extra import flag.")
-    elif action == 'delete_single':
+
+    def is_pending_deletion(server):
+        return server.get('is_extra') and server.get('is_deleted')
+
+    if action in ('delete_single', 'keep_single'):
+        # 単一サーバーの操作はidインデックスで直接処理する
         server_id = data.get('server_id')
-        if server_id:
+        if not server_id:
+            verb = 'delete' if action == 'delete_single' else 'keep'
+            return jsonify({"error": f"Server ID not provided for single {verb}."}), 400
+        if action == 'delete_single':
             app.logger.info(f"Attempting to delete single extra imported server with ID: {server_id}")
-            original_len = len(servers)
-            servers = [s for s in servers if not (s['id'] == server_id and s.get('is_extra') and s.get('is_deleted'))]
-            app.logger.info(f"After deletion attempt, servers count changed from {original_len} to {len(servers)}.")
+            deleted = servers_store.delete([server_id], predicate=is_pending_deletion)
+            app.logger.info(f"After deletion attempt, {len(deleted)} server(s) removed.")
             app.logger.info(f"Confirmed: Deleted single extra imported server: {server_id}")
         else:
-            return jsonify({"error": "Server ID not provided for single delete."}), 400
-    elif action == 'keep_single':
-        server_id = data.get('server_id')
-        if server_id:
+            server = servers_store.get(server_id)
+            if server and is_pending_deletion(server):
+                servers_store.update(server_id, {'is_extra': False}, remove_keys=('is_deleted', 'is_new'))
+                app.logger.info(f"Confirmed: Kept single extra imported server, removed extra import flag: {server_id}")
+    else:
+        config = load_servers_config()
+        servers = config.get('servers', [])
+
+        if action == 'delete_all':
+            servers = [s for s in servers if not is_pending_deletion(s)]
+            app.logger.info("Confirmed: Deleted all extra imported servers marked for deletion.")
+        elif action == 'keep_all':
             for server in servers:
-                if server['id'] == server_id and server.get('is_extra') and server.get('is_deleted'):
+                if is_pending_deletion(server):
                     server['is_extra'] = False
                     server.pop('is_deleted', None)
                     server.pop('is_new', None)
-                    app.logger.info(f"Confirmed: Kept single extra imported server, removed extra import flag: {server_id}")
-                    break
+            app.logger.info("Confirmed: Kept all extra imported servers, removed extra import flag.")
+        elif action == 'cancel':
+            extra_import_config['url'] = extra_import_config.get('previous_url', '')
+            for server in servers:
+                if is_pending_deletion(server):
+                    server.pop('is_deleted', None)
+                    server.pop('is_new', None)
+            app.logger.info("Confirmed: Canceled URL change, reverted to previous URL.")
         else:
-            return jsonify({"error": "Server ID not provided for single keep."}), 400
-    elif action == 'cancel':
-        extra_import_config['url'] = extra_import_config.get('previous_url', '')
-        for server in servers:
-            if server.get('is_extra') and server.get('is_deleted'):
-                server.pop('is_deleted', None)
-                server.pop('is_new', None)
-        app.logger.info("Confirmed: Canceled URL change, reverted to previous URL.")
-    else:
-        return jsonify({"error": "Invalid action specified."}), 400
+            return jsonify({"error": "Invalid action specified."}), 400
 
-    save_servers_config(config)
+        config['servers'] = servers
+        save_servers_config(config)
     app.logger.info("Servers config saved after extra import action.")
     save_extra_import_config(extra_import_config)
 
-    threading.Thread(target=run_extra_import).start()
+    threading.Thread(target=run_extra_import, kwargs={'force': True}).start()
     return jsonify({"message": f"Action '{action}' processed. Extra import re-triggered."}), 200
 
 
+@socketio.on('request_priority_ping')
+def handle_request_priority_ping(data):
+    """指定サーバーを即時にPingする"""
+    if not _is_authenticated():
+        return
+    server_id = (data or {}).get('server_id')
+    if server_id:
+        ping_scheduler.request_priority(server_id)
+
 @app.route('/api/ping_status/<server_id>', methods=['GET'])
 @login_required
 def get_ping_status(server_id):
     ping_result = server_ping_status.get(server_id, {'status': 'unknown', 'response_time': None, 'packet_loss': None})
     return jsonify(ping_result)
 
+@app.route('/api/ping_history', methods=['GET'])
+@login_required
+def get_ping_history():
+    """
+    Ping履歴の統計とダウンサンプリング系列を取得
+
+    クエリパラメータ:
+        server_id: 対象サーバーID（複数指定可、省略時は全サーバー）
+        window: 現在から遡る期間（秒、既定 3600）
+        points: 系列の点数（既定 60、最大 1000）
+    """
+    try:
+        window = float(request.args.get('window', 3600))
+        points = min(int(request.args.get('points', 60)), 1000)
+    except ValueError:
+        return jsonify({"error": "window and points must be numbers"}), 400
+    if window <= 0 or points <= 0:
+        return jsonify({"error": "window and points must be positive"}), 400
+    server_ids = request.args.getlist('server_id') or None
+    end = time.time()
+    history = ping_history.query(server_ids, end - window, end, points=points)
+    return jsonify({'start': int(end - window), 'end': int(end), 'points': points, 'servers': history})
+
+@app.route('/api/ping_stats', methods=['GET'])
+@login_required
+def get_ping_stats():
+    """Pingスケジューラーの統計情報を取得"""
+    return jsonify(ping_scheduler.stats())
+
 @app.route('/api/ssh_keys', methods=['GET'])
 @login_required
 def get_ssh_keys():
-    config = load_ssh_keys_config()
-    return jsonify(config.get('ssh_keys', []))
+    return jsonify(list(ssh_keys_store.snapshot()))
 
 @app.route('/api/ssh_keys', methods=['POST'])
 @login_required
@@ -790,20 +1003,15 @@ def add_ssh_key():
     new_key = request.json
     if not new_key or 'id' not in new_key or 'name' not in new_key or 'path' not in new_key:
         return jsonify({"error": "Missing required fields (id, name, path)"}), 400
-    config = load_ssh_keys_config()
-    ssh_keys = config.get('ssh_keys', [])
-    if any(k['id'] == new_key['id'] for k in ssh_keys):
+    if ssh_keys_store.add(new_key) is None:
         return jsonify({"error": f"SSH Key with ID '{new_key['id']}' already exists"}), 409
-    ssh_keys.append(new_key)
-    save_ssh_keys_config(config)
     return jsonify(new_key), 201
 
 @app.route('/api/ssh_keys/<key_id>', methods=['GET'])
 @login_required
 def get_ssh_key(key_id):
     try:
-        config = load_ssh_keys_config()
-        key = next((k for k in config.get('ssh_keys', []) if k['id'] == key_id), None)
+        key = ssh_keys_store.get(key_id)
         if not key:
             return jsonify({"error": "SSH Key not found"}), 404
         return jsonify(key)
@@ -815,30 +1023,18 @@ def get_ssh_key(key_id):
 @login_required
 def update_ssh_key(key_id):
     updated_data = request.json
-    config = load_ssh_keys_config()
-    ssh_keys = config.get('ssh_keys', [])
-    found = False
-    for i, key in enumerate(ssh_keys):
-        if key['id'] == key_id:
-            ssh_keys[i] = {**key, **updated_data}
-            found = True
-            break
-    if not found:
+    key = ssh_keys_store.update(key_id, updated_data)
+    if key is None:
         return jsonify({"error": "SSH Key not found"}), 404
-    save_ssh_keys_config(config)
-    return jsonify(ssh_keys[i])
+    ssh_key_cache.invalidate(key_id)
+    return jsonify(key)
 
 @app.route('/api/ssh_keys/<key_id>', methods=['DELETE'])
 @login_required
 def delete_ssh_key(key_id):
-    config = load_ssh_keys_config()
-    ssh_keys = config.get('ssh_keys', [])
-    original_len = len(ssh_keys)
-    ssh_keys = [k for k in ssh_keys if k['id'] != key_id]
-    if len(ssh_keys) == original_len:
+    if not ssh_keys_store.delete([key_id]):
         return jsonify({"error": "SSH Key not found"}), 404
-    config['ssh_keys'] = ssh_keys
-    save_ssh_keys_config(config)
+    ssh_key_cache.invalidate(key_id)
     return jsonify({"message": "SSH Key deleted"}), 204
 
 @app.route('/api/ssh_keys/upload', methods=['POST'])
@@ -853,23 +1049,18 @@ def upload_ssh_key_file():
     filepath = os.path.join(UPLOAD_FOLDER, filename)
     file.save(filepath)
     os.chmod(filepath, 0o600)
-    key_types_to_try = (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key)
-    last_error = None
 
-    for key_type in key_types_to_try:
-        try:
-            key_type.from_private_key_file(filepath)
-            app.logger.info(f"Uploaded key '{filename}' validated as {key_type.__name__}.")
-            return jsonify({'path': filepath}), 200
-        except paramiko.PasswordRequiredException:
-            last_error = 'SSH key requires a passphrase, which is not supported.'
-            break
-        except paramiko.SSHException as e:
-            last_error = str(e)
-            continue
-        except Exception as e:
-            last_error = f"An unexpected error occurred during validation: {e}"
-            continue
+    try:
+        # 検証でパースした鍵はキャッシュされ、この鍵を使う最初の接続で再利用される
+        _key, key_type = ssh_key_cache.load(filepath)
+        app.logger.info(f"Uploaded key '{filename}' validated as {key_type}.")
+        return jsonify({'path': filepath}), 200
+    except paramiko.PasswordRequiredException:
+        last_error = 'SSH key requires a passphrase, which is not supported.'
+    except paramiko.SSHException as e:
+        last_error = str(e)
+    except Exception as e:
+        last_error = f"An unexpected error occurred during validation: {e}"
 
     os.remove(filepath)
     error_message = f"Invalid or unsupported SSH key format. Last error: {last_error}"
@@ -885,18 +1076,14 @@ def bulk_delete_ssh_keys():
     if not key_ids_to_delete:
         return jsonify({"error": "No SSH key IDs provided for deletion."}), 400
 
-    config = load_ssh_keys_config()
-    ssh_keys = config.get('ssh_keys', [])
-    original_len = len(ssh_keys)
-    
-    ssh_keys = [k for k in ssh_keys if k['id'] not in key_ids_to_delete]
+    deleted_count = len(ssh_keys_store.delete(key_ids_to_delete))
+    for key_id in key_ids_to_delete:
+        ssh_key_cache.invalidate(key_id)
     
-    if len(ssh_keys) == original_len:
+    if not deleted_count:
         return jsonify({"error": "No matching SSH keys found for deletion."}), 404
     
-    config['ssh_keys'] = ssh_keys
-    save_ssh_keys_config(config)
-    return jsonify({"message": f"{original_len - len(ssh_keys)} SSH keys deleted."}), 200
+    return jsonify({"message": f"{deleted_count} SSH keys deleted."}), 200
 
 # --- Backup API Endpoints ---
 @app.route('/api/backups', methods=['GET'])
@@ -975,12 +1162,9 @@ def import_config():
 @login_required
 def export_config():
     try:
-        servers_config = load_servers_config()
-        ssh_keys_config = load_ssh_keys_config()
-
         full_config = {
-            "servers": servers_config.get("servers", []),
-            "ssh_keys": ssh_keys_config.get("ssh_keys", [])
+            "servers": list(servers_store.snapshot()),
+            "ssh_keys": list(ssh_keys_store.snapshot())
         }
 
         yaml_string = yaml.dump(full_config, indent=2, sort_keys=False)
@@ -1015,107 +1199,92 @@ def handle_connect():
         app.logger.warning(f"Unauthenticated socket connection attempt rejected from SID: {request.sid}")
         return False
     app.logger.debug(f"Authenticated client connected! SID: {request.sid}, User: {session.get('username')}")
+    # 接続直後に全サーバーの最新Ping状態をまとめて送る
+    emit('ping_status_snapshot', {'statuses': ping_broadcaster.snapshot()})
 
-def _ssh_read_loop(chan, sid):
+def _ssh_output_formatter(binary, tab_id=None):
     """
-    従来のSSH用の読み取りループ（SSH接続タイムアウト監視付き）
-    
+    チャネルごとの ssh_output ペイロード生成関数を作成
+
+    binary の場合は生バイト列をそのままSocket.IOのバイナリ添付として送り、ブラウザの
+    xterm.js がUTF-8として解釈する。テキストの場合はチャネルごとの逐次デコーダーを使い、
+    チャンク境界をまたぐマルチバイト文字も欠落させない。
+
+    Returns:
+        (data: bytes, final: bool) を受け取りペイロード（送るものがなければ None）を返す関数
+    """
+    base = {} if tab_id is None else {'tab_id': tab_id}
+    if binary and app.config["SSH_OUTPUT_BINARY"]:
+        def format_binary(data, final=False):
+            return dict(base, data=data) if data else None
+        return format_binary
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def format_text(data, final=False):
+        output = decoder.decode(data, final)
+        return dict(base, output=output) if output else None
+    return format_text
+
+def _invoke_shell(client):
+    """受信ウィンドウを SSH_CHANNEL_WINDOW に制限したシェルチャネルを開く"""
+    client.get_transport().default_window_size = app.config["SSH_CHANNEL_WINDOW"]
+    return client.invoke_shell()
+
+def _flow_window(flow_control):
+    """クライアントが受信確認（ssh_output_ack）を返す場合の送信ウィンドウ"""
+    return app.config["SSH_FLOW_WINDOW"] if flow_control else None
+
+def _watch_ssh_channel(chan, sid, binary=False, flow_control=False):
+    """
+    従来のSSH用: チャネルをI/Oリアクターに登録し、出力と切断をクライアントに通知する
+
     ※重要な区別※
     - SSH接続タイムアウト: サーバー側でSSH接続自体が切断された時の検出（ここで処理）
     - クライアント都合タイムアウト: フロントエンド側で30分間無操作時の切断（フロントエンドで処理）
     """
-    try:
-        while True:
-            try:
-                # データが受信可能かチェック
-                if chan.recv_ready():
-                    output = chan.recv(4096).decode('utf-8', errors='ignore')
-                    if output:  # 空でない場合のみ送信
-                        socketio.emit('ssh_output', {'output': output}, room=sid)
-                
-                # 接続状態をチェック（複数の条件で判定）
-                if chan.closed or chan.eof_received or not chan.active:
-                    reason = "unknown"
-                    if chan.closed:
-                        reason = "closed"
-                    elif chan.eof_received:
-                        reason = "EOF"
-                    elif not chan.active:
-                        reason = "inactive"
-                    
-                    app.logger.debug(f"SSH channel terminated for SID: {sid}, reason: {reason}")
-                    update_ssh_status(sid, 'disconnected', 'SSH接続が終了しました', 0)
-                    socketio.emit('ssh_output', {'output': '\r\n[SSH接続が終了しました]\r\n'}, room=sid)
-                    socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': 'SSH接続が終了しました'}, room=sid)
-                    break
-                
-                # 終了状態をチェック
-                if chan.exit_status_ready():
-                    exit_status = chan.recv_exit_status()
-                    app.logger.debug(f"SSH session exited with status {exit_status} for SID: {sid}")
-                    update_ssh_status(sid, 'disconnected', f'SSH接続が終了しました (終了コード: {exit_status})', 0)
-                    socketio.emit('ssh_output', {'output': f'\r\n[SSH接続が終了しました (終了コード: {exit_status})]\r\n'}, room=sid)
-                    socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': f'SSH接続が終了しました (終了コード: {exit_status})'}, room=sid)
-                    break
-                
-                # 追加の接続チェック：recv を非ブロッキングで試行
-                try:
-                    # 0バイトの非ブロッキング読み取りで接続状態を確認
-                    test_read = chan.recv(0)  # 0バイト読み取り
-                    if test_read is None:  # Noneが返された場合、接続終了
-                        app.logger.debug(f"SSH channel recv returned None for SID: {sid}")
-                        update_ssh_status(sid, 'disconnected', 'SSH接続が終了しました (recv None)', 0)
-                        socketio.emit('ssh_output', {'output': '\r\n[SSH接続が終了しました]\r\n'}, room=sid)
-                        socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': 'SSH接続が終了しました'}, room=sid)
-                        break
-                except BlockingIOError:
-                    # ブロッキングIOエラーは正常（データがない）
-                    pass
-                except Exception as recv_e:
-                    # recv エラーは接続問題を示している可能性がある
-                    if "closed" in str(recv_e).lower() or "eof" in str(recv_e).lower():
-                        app.logger.debug(f"SSH recv error indicates connection closed for SID {sid}: {recv_e}")
-                        update_ssh_status(sid, 'disconnected', 'SSH接続が終了しました (recv error)', 0)
-                        socketio.emit('ssh_output', {'output': '\r\n[SSH接続が終了しました]\r\n'}, room=sid)
-                        socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': 'SSH接続が終了しました'}, room=sid)
-                        break
-                
-                time.sleep(0.01)
-                    
-            except socket.error as sock_e:
-                app.logger.debug(f"Socket error in SSH read loop for SID {sid}: {sock_e}")
-                update_ssh_status(sid, 'disconnected', f'SSH接続が終了しました (ソケットエラー)', 0)
-                socketio.emit('ssh_output', {'output': '\r\n[SSH接続が終了しました (ソケットエラー)]\r\n'}, room=sid)
-                socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': f'SSH接続が終了しました (ソケットエラー)'}, room=sid)
-                break
-            except Exception as loop_e:
-                # 予期しないエラーはログに記録して継続を試行
-                app.logger.debug(f"Loop error in SSH read loop for SID {sid}: {loop_e}")
-                # 特定のエラーの場合は終了
-                if any(keyword in str(loop_e).lower() for keyword in ['closed', 'eof', 'connection', 'broken']):
-                    app.logger.debug(f"Connection-related error detected for SID {sid}: {loop_e}")
-                    update_ssh_status(sid, 'disconnected', 'SSH接続が終了しました (接続エラー)', 0)
-                    socketio.emit('ssh_output', {'output': '\r\n[SSH接続が終了しました]\r\n'}, room=sid)
-                    socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': 'SSH接続が終了しました'}, room=sid)
-                    break
-                # それ以外は継続
-                continue
-                
-    except Exception as e:
-        app.logger.error(f"Error in SSH read loop for SID {sid}: {e}")
-        update_ssh_status(sid, 'error', 'SSH接続でエラーが発生しました', 0)
-        socketio.emit('ssh_output', {'output': f'\r\n[SSH接続エラー: {e}]\r\n'}, room=sid)
-        socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': f'SSH接続エラー: {e}'}, room=sid)
-    finally:
+    format_output = _ssh_output_formatter(binary)
+
+    def on_output(data):
+        payload = format_output(data)
+        if payload:  # 空でない場合のみ送信
+            if flow_control:
+                payload['bytes'] = len(data)
+            socketio.emit('ssh_output', payload, room=sid)
+
+    def on_close(reason):
+        payload = format_output(b'', final=True)
+        if payload:
+            socketio.emit('ssh_output', payload, room=sid)
+        if chan.exit_status_ready():
+            exit_status = chan.recv_exit_status()
+            app.logger.debug(f"SSH session exited with status {exit_status} for SID: {sid}")
+            message = f'SSH接続が終了しました (終了コード: {exit_status})'
+        else:
+            app.logger.debug(f"SSH channel terminated for SID: {sid}, reason: {reason}")
+            message = 'SSH接続が終了しました'
+        update_ssh_status(sid, 'disconnected', message, 0)
+        socketio.emit('ssh_output', {'output': f'\r\n[{message}]\r\n'}, room=sid)
+        socketio.emit('ssh_connection_closed', {'tab_id': sid, 'message': message}, room=sid)
         # セッションクリーンアップ
-        if sid in active_ssh_sessions:
+        session_info = active_ssh_sessions.get(sid)
+        if session_info is not None and session_info['channel'] is chan:
             try:
-                active_ssh_sessions[sid]['client'].close()
-            except:
+                session_info['client'].close()
+            except Exception:
                 pass
             del active_ssh_sessions[sid]
             app.logger.debug(f"SSH session cleaned up for SID: {sid}")
 
+    _enable_ssh_keepalive(chan)
+    ssh_reactor.register(chan, on_output, on_close, window=_flow_window(flow_control))
+
+def _enable_ssh_keepalive(chan):
+    """無通信のまま相手が消えた接続もトランスポートの切断として検出できるようにする"""
+    transport = chan.get_transport()
+    if transport is not None and app.config["SSH_KEEPALIVE_INTERVAL"]:
+        transport.set_keepalive(app.config["SSH_KEEPALIVE_INTERVAL"])
+
 @socketio.on('start_ssh')
 def handle_start_ssh(data):
     if not _is_authenticated():
@@ -1129,22 +1298,28 @@ def handle_start_ssh(data):
     update_ssh_status(sid, 'initializing', 'SSH接続を開始しています...', 10)
     
     app.logger.debug(f"Received start_ssh event. Data: {data}, SID: {request.sid}")
+    
+    # 接続処理（鍵交換・認証・シェル作成）は接続ワーカーで行い、ハンドラーはすぐに戻る
+    ssh_connect_executor.submit(_connect_ssh, sid, server_id,
+                                bool(data.get('binary')), bool(data.get('flow_control')))
+
+def _connect_ssh(sid, server_id, binary=False, flow_control=False):
+    """接続ワーカー: 従来のSSH接続を確立する（進捗は ssh_status_update で通知）"""
     app.logger.debug(f"Attempting to start SSH for server_id: {server_id} (SID: {sid})")
     
-    config = load_servers_config()
-    server_info = next((s for s in config.get('servers', []) if s['id'] == server_id), None)
+    server_info = servers_store.get(server_id)
     
     if not server_info:
         app.logger.debug(f"Server '{server_id}' not found.")
         update_ssh_status(sid, 'error', f"サーバー '{server_id}' が見つかりません", 0)
-        emit('ssh_output', {'output': f"Error: Server '{server_id}' not found in configuration.\r\n"})
+        socketio.emit('ssh_output', {'output': f"Error: Server '{server_id}' not found in configuration.\r\n"}, room=sid)
         return
     
     ssh_connectable_types = ['node', 'virtual_machine', 'network_device', 'kvm']
     if server_info.get('type') not in ssh_connectable_types:
         app.logger.debug(f"Server '{server_id}' is not an SSH connectable type server.")
         update_ssh_status(sid, 'error', f"サーバー '{server_id}' はSSH接続できません", 0)
-        emit('ssh_output', {'output': f"Error: Server '{server_id}' is not an SSH connectable type server.\r\n"})
+        socketio.emit('ssh_output', {'output': f"Error: Server '{server_id}' is not an SSH connectable type server.\r\n"}, room=sid)
         return
     
     # サーバー情報取得完了: 20%
@@ -1173,8 +1348,7 @@ def handle_start_ssh(data):
             # SSH鍵認証の準備: 40%
             update_ssh_status(sid, 'authenticating', 'SSH鍵を準備中...', 40)
             
-            ssh_keys_config = load_ssh_keys_config()
-            ssh_key_info = next((k for k in ssh_keys_config.get('ssh_keys', []) if k['id'] == ssh_key_id), None)
+            ssh_key_info = ssh_keys_store.get(ssh_key_id)
             app.logger.debug(f"Attempting to load key '{ssh_key_id}' with info: {ssh_key_info}")
             
             if ssh_key_info and os.path.exists(os.path.expanduser(ssh_key_info['path'])):
@@ -1186,17 +1360,15 @@ def handle_start_ssh(data):
                     update_ssh_status(sid, 'authenticating', f"SSH鍵 '{ssh_key_info['name']}' を読み込み中...", 50)
                     
                     try:
-                        key = paramiko.RSAKey.from_private_key_file(key_path_expanded)
+                        key, key_type = ssh_key_cache.get(ssh_key_id, key_path_expanded)
+                    except paramiko.PasswordRequiredException:
+                        raise
                     except paramiko.SSHException as e:
-                        app.logger.debug(f"RSAKey load failed: {e}. Attempting Ed25519Key.")
-                        try:
-                            key = paramiko.Ed25519Key(filename=key_path_expanded)
-                        except Exception as ed25519_e:
-                            app.logger.debug(f"Ed25519Key load failed: {ed25519_e}.")
-                            update_ssh_status(sid, 'error', f"SSH鍵の読み込みに失敗しました", 0)
-                            emit('ssh_output', {'output': f"Error loading SSH Key '{ssh_key_info['name']}': {e} (RSA) / {ed25519_e} (Ed25519)\r\n"})
-                            client.close()
-                            return
+                        app.logger.debug(f"SSH key load failed: {e}")
+                        update_ssh_status(sid, 'error', f"SSH鍵の読み込みに失敗しました", 0)
+                        socketio.emit('ssh_output', {'output': f"Error loading SSH Key '{ssh_key_info['name']}': {e}\r\n"}, room=sid)
+                        client.close()
+                        return
                     
                     # SSH鍵認証で接続: 70%
                     update_ssh_status(sid, 'authenticating', f"SSH鍵で認証中...", 70)
@@ -1219,7 +1391,7 @@ def handle_start_ssh(data):
                     
                     # 接続実行（詳細なタイムアウト監視付き）
                     try:
-                        client.connect(**connect_params)
+                        _ssh_connect(client, connect_params)
                         app.logger.debug(f"SSH connected to {hostname} using key: {ssh_key_info['name']}")
                         
                         # 接続後の健全性テスト
@@ -1230,37 +1402,37 @@ def handle_start_ssh(data):
                     except socket.timeout:
                         app.logger.warning(f"SSH connection timeout to {hostname}:{port}")
                         update_ssh_status(sid, 'error', f"接続タイムアウト ({hostname}:{port})", 0)
-                        emit('ssh_output', {'output': f"Connection timeout to {hostname}:{port}\r\n"})
+                        socketio.emit('ssh_output', {'output': f"Connection timeout to {hostname}:{port}\r\n"}, room=sid)
                         client.close()
                         return
                     except paramiko.AuthenticationException:
                         app.logger.warning(f"SSH authentication failed to {hostname}")
                         update_ssh_status(sid, 'error', f"認証に失敗しました", 0)
-                        emit('ssh_output', {'output': f"Authentication failed to {hostname}\r\n"})
+                        socketio.emit('ssh_output', {'output': f"Authentication failed to {hostname}\r\n"}, room=sid)
                         client.close()
                         return
                     except Exception as conn_e:
                         app.logger.warning(f"SSH connection failed to {hostname}: {conn_e}")
                         update_ssh_status(sid, 'error', f"接続に失敗しました: {str(conn_e)[:50]}", 0)
-                        emit('ssh_output', {'output': f"Connection failed to {hostname}: {conn_e}\r\n"})
+                        socketio.emit('ssh_output', {'output': f"Connection failed to {hostname}: {conn_e}\r\n"}, room=sid)
                         client.close()
                         return
                 except paramiko.PasswordRequiredException:
                     app.logger.debug(f"Key '{ssh_key_info['name']}' requires passphrase.")
                     update_ssh_status(sid, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0)
-                    emit('ssh_output', {'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase.\r\n"})
+                    socketio.emit('ssh_output', {'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase.\r\n"}, room=sid)
                     client.close()
                     return
                 except Exception as e:
                     app.logger.debug(f"Error loading SSH Key '{ssh_key_info['name']}': {e}")
                     update_ssh_status(sid, 'error', f"SSH鍵 '{ssh_key_info['name']}' の読み込みエラー", 0)
-                    emit('ssh_output', {'output': f"Error loading SSH Key '{ssh_key_info['name']}': {e}\r\n"})
+                    socketio.emit('ssh_output', {'output': f"Error loading SSH Key '{ssh_key_info['name']}': {e}\r\n"}, room=sid)
                     client.close()
                     return
             else:
                 app.logger.debug(f"SSH Key '{ssh_key_id}' not found or path invalid (info: {ssh_key_info}).")
                 update_ssh_status(sid, 'error', f"SSH鍵 '{ssh_key_id}' が見つかりません", 0)
-                emit('ssh_output', {'output': f"Error: SSH Key '{ssh_key_id}' not found or path invalid.\r\n"})
+                socketio.emit('ssh_output', {'output': f"Error: SSH Key '{ssh_key_id}' not found or path invalid.\r\n"}, room=sid)
                 client.close()
                 return
         elif password:
@@ -1284,7 +1456,7 @@ def handle_start_ssh(data):
             
             # 接続実行（詳細なタイムアウト監視付き）
             try:
-                client.connect(**connect_params)
+                _ssh_connect(client, connect_params)
                 app.logger.debug(f"SSH connected to {hostname} using password.")
                 
                 # 接続後の健全性テスト
@@ -1295,52 +1467,57 @@ def handle_start_ssh(data):
             except socket.timeout:
                 app.logger.warning(f"SSH connection timeout to {hostname}:{port}")
                 update_ssh_status(sid, 'error', f"接続タイムアウト ({hostname}:{port})", 0)
-                emit('ssh_output', {'output': f"Connection timeout to {hostname}:{port}\r\n"})
+                socketio.emit('ssh_output', {'output': f"Connection timeout to {hostname}:{port}\r\n"}, room=sid)
                 client.close()
                 return
             except paramiko.AuthenticationException:
                 app.logger.warning(f"SSH authentication failed to {hostname}")
                 update_ssh_status(sid, 'error', f"認証に失敗しました", 0)
-                emit('ssh_output', {'output': f"Authentication failed to {hostname}\r\n"})
+                socketio.emit('ssh_output', {'output': f"Authentication failed to {hostname}\r\n"}, room=sid)
                 client.close()
                 return
             except Exception as conn_e:
                 app.logger.warning(f"SSH connection failed to {hostname}: {conn_e}")
                 update_ssh_status(sid, 'error', f"接続に失敗しました: {str(conn_e)[:50]}", 0)
-                emit('ssh_output', {'output': f"Connection failed to {hostname}: {conn_e}\r\n"})
+                socketio.emit('ssh_output', {'output': f"Connection failed to {hostname}: {conn_e}\r\n"}, room=sid)
                 client.close()
                 return
         else:
             app.logger.debug(f"No valid authentication method provided.")
             update_ssh_status(sid, 'error', f"認証情報が提供されていません", 0)
-            emit('ssh_output', {'output': "Error: No valid authentication method (password or SSH key) provided.\r\n"})
+            socketio.emit('ssh_output', {'output': "Error: No valid authentication method (password or SSH key) provided.\r\n"}, room=sid)
             client.close()
             return
         
         # シェルセッション作成: 90%
         update_ssh_status(sid, 'connecting', 'シェルセッションを作成中...', 90)
         
-        chan = client.invoke_shell()
+        chan = _invoke_shell(client)
         chan.settimeout(0.0)
+        if not socketio.server.manager.is_connected(sid, '/'):
+            # 接続処理中にブラウザが切断された
+            app.logger.debug(f"Client {sid} disconnected while connecting to {hostname}")
+            client.close()
+            return
         active_ssh_sessions[sid] = {'client': client, 'channel': chan}
         
         # 接続完了: 100%
         update_ssh_status(sid, 'connected', f'{hostname} に接続完了', 100)
         
-        emit('ssh_output', {'output': f"Successfully connected to {hostname}.\r\n"})
-        threading.Thread(target=_ssh_read_loop, args=(chan, sid), daemon=True).start()
+        socketio.emit('ssh_output', {'output': f"Successfully connected to {hostname}.\r\n"}, room=sid)
+        _watch_ssh_channel(chan, sid, binary=binary, flow_control=flow_control)
     except paramiko.AuthenticationException:
         app.logger.debug(f"Authentication failed for {hostname}.")
         update_ssh_status(sid, 'error', f"認証に失敗しました", 0)
-        emit('ssh_output', {'output': "Authentication failed. Please check your credentials.\r\n"})
+        socketio.emit('ssh_output', {'output': "Authentication failed. Please check your credentials.\r\n"}, room=sid)
     except paramiko.SSHException as e:
         app.logger.debug(f"SSH error for {hostname}: {e}")
         update_ssh_status(sid, 'error', f"SSH接続エラー: {e}", 0)
-        emit('ssh_output', {'output': f"SSH error: {e}\r\n"})
+        socketio.emit('ssh_output', {'output': f"SSH error: {e}\r\n"}, room=sid)
     except Exception as e:
         app.logger.debug(f"General connection error for {hostname}: {e}")
         update_ssh_status(sid, 'error', f"接続エラー: {e}", 0)
-        emit('ssh_output', {'output': f"Connection error: {e}\r\n"})
+        socketio.emit('ssh_output', {'output': f"Connection error: {e}\r\n"}, room=sid)
 
 @socketio.on('ssh_input')
 def handle_ssh_input(data):
@@ -1349,6 +1526,7 @@ def handle_ssh_input(data):
     sid = request.sid
     if sid in active_ssh_sessions:
         chan = active_ssh_sessions[sid]['channel']
+        ssh_reactor.mark_interactive(chan)
         chan.send(data['input'])
 
 @socketio.on('resize_terminal')
@@ -1381,6 +1559,7 @@ def handle_disconnect_ssh(data):
             
             # チャネルとクライアントを明示的に閉じる
             if chan:
+                ssh_reactor.unregister(chan)
                 chan.close()
             if client:
                 client.close()
@@ -1398,6 +1577,7 @@ def handle_disconnect_ssh(data):
             
             # チャネルとクライアントを明示的に閉じる
             if chan:
+                ssh_reactor.unregister(chan)
                 chan.close()
             if client:
                 client.close()
@@ -1416,6 +1596,7 @@ def handle_disconnect():
     sid = request.sid
     app.logger.debug(f"Client disconnected (SID: {sid})")
     if sid in active_ssh_sessions:
+        ssh_reactor.unregister(active_ssh_sessions[sid]['channel'])
         client = active_ssh_sessions[sid]['client']
         client.close()
         del active_ssh_sessions[sid]
@@ -1426,6 +1607,359 @@ def handle_disconnect():
         del ssh_connection_status[sid]
 
 # --- SSH Options Parser ---
+def _ssh_connect_params(server_info, pkey=None, ssh_connect_kwargs=None):
+    """
+    マルチタブSSHと一括実行で共通の paramiko connect() パラメータを作成
+
+    Args:
+        server_info: サーバー設定
+        pkey: SSH鍵認証の場合はパース済みの鍵（None の場合はパスワード認証）
+        ssh_connect_kwargs: 解析済みの SSH オプション（None の場合は server_info から解析）
+    """
+    connect_params = {
+        'hostname': server_info.get('host'),
+        'port': server_info.get('port', 22),
+        'username': server_info.get('username'),
+        'timeout': 10
+    }
+    if pkey is not None:
+        connect_params.update({'pkey': pkey, 'look_for_keys': False, 'allow_agent': False})
+    else:
+        connect_params['password'] = server_info.get('password')
+    
+    # SSH オプションから得られた追加パラメータをマージ
+    if ssh_connect_kwargs is None:
+        ssh_connect_kwargs = parse_ssh_options(server_info.get('ssh_options', ''))
+    connect_params.update(ssh_connect_kwargs)
+    return connect_params
+
+def _ssh_connect(client, connect_params):
+    """
+    名前解決キャッシュのアドレスに接続したソケットで client.connect() を実行
+
+    ホスト鍵の照合には connect_params のホスト名がそのまま使われる。
+
+    Raises:
+        socket.gaierror: ホスト名を解決できない（否定キャッシュされている場合を含む）
+        paramiko.SSHException / OSError: 接続・認証に失敗
+    """
+    if connect_params.get('sock') is not None:
+        client.connect(**connect_params)
+        return
+    sock = dns_cache.create_connection(connect_params['hostname'], connect_params.get('port') or 22,
+                                       timeout=connect_params.get('timeout'))
+    try:
+        client.connect(sock=sock, **connect_params)
+    except Exception:
+        sock.close()
+        raise
+
+def _open_pooled_ssh(server_info, timeout=None):
+    """
+    サーバーへのSSHトランスポートの利用権を取得（プールにあれば再利用し、なければ接続する）
+
+    認証方法はマルチタブSSHと同じ（SSH鍵が設定されていれば鍵、なければパスワード）。
+
+    Args:
+        timeout: 他のスレッドの接続完了の待ち時間と接続・認証を合わせた上限（秒、None の場合は個別の既定値）
+
+    Raises:
+        ValueError: SSH鍵が見つからない、または認証情報がない
+        paramiko.AuthenticationException / paramiko.SSHException / OSError: 接続・認証に失敗
+        socket.timeout: timeout を過ぎた
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    ssh_key_id = server_info.get('ssh_key_id')
+    password = server_info.get('password')
+    pool_key = transport_pool_key(server_info.get('host'), server_info.get('port', 22), server_info.get('username'),
+                                  ssh_key_id, password, server_info.get('ssh_options', ''))
+    wait = SSH_POOL_CONNECT_WAIT if timeout is None else max(0.01, min(SSH_POOL_CONNECT_WAIT, timeout))
+    lease = ssh_transport_pool.acquire(pool_key, wait=wait)
+    if lease is not None:
+        return lease
+    try:
+        if ssh_key_id:
+            ssh_key_info = ssh_keys_store.get(ssh_key_id)
+            if not ssh_key_info:
+                raise ValueError(f"SSH Key '{ssh_key_id}' not found")
+            pkey, _key_type = ssh_key_cache.get(ssh_key_id, os.path.expanduser(ssh_key_info['path']))
+        elif password:
+            pkey = None
+        else:
+            raise ValueError("No valid authentication method (password or SSH key) provided")
+        
+        connect_params = _ssh_connect_params(server_info, pkey=pkey)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout(f"Timed out waiting to connect to {server_info.get('host')}")
+            # TCP接続・バナー受信・認証のいずれも残り時間を超えて待たない
+            for name in ('timeout', 'banner_timeout', 'auth_timeout'):
+                connect_params[name] = min(connect_params.get(name) or remaining, remaining)
+        
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            _ssh_connect(client, connect_params)
+        except Exception:
+            client.close()
+            raise
+        return ssh_transport_pool.add(pool_key, client)
+    finally:
+        ssh_transport_pool.end_connect(pool_key)
+
+def _resolve_exec_targets(server_ids=None, tag=None):
+    """
+    一括実行の対象サーバーを決定
+
+    Returns:
+        (SSH接続できる対象サーバーのリスト, 見つからない・SSH接続できないサーバーIDのリスト)
+    """
+    ssh_connectable_types = ['node', 'virtual_machine', 'network_device', 'kvm']
+    registry = servers_store.registry()
+    candidates = []
+    skipped = []
+    for server_id in server_ids or []:
+        server_info = registry.get(server_id)
+        if server_info is None:
+            skipped.append(server_id)
+        else:
+            candidates.append(server_info)
+    if tag:
+        candidates.extend(registry.with_tag(tag))
+    
+    targets = []
+    seen = set()
+    for server_info in candidates:
+        if server_info['id'] in seen:
+            continue
+        seen.add(server_info['id'])
+        if server_info.get('type') in ssh_connectable_types:
+            targets.append(server_info)
+        else:
+            skipped.append(server_info['id'])
+    return targets, skipped
+
+def _parse_exec_request(data):
+    """一括実行のリクエストを検証し、(対象, 除外したサーバーID, コマンド, 同時実行数, タイムアウト) を返す"""
+    command = (data.get('command') or '').strip()
+    if not command:
+        raise ValueError("command is required")
+    server_ids = data.get('server_ids') or []
+    if isinstance(server_ids, str):
+        server_ids = [server_ids]
+    tag = data.get('tag')
+    if not server_ids and not tag:
+        raise ValueError("server_ids or tag is required")
+    try:
+        parallelism = int(data['parallelism']) if data.get('parallelism') else None
+        timeout = float(data['timeout']) if data.get('timeout') else None
+    except (TypeError, ValueError):
+        raise ValueError("parallelism and timeout must be numbers")
+    if (parallelism is not None and parallelism <= 0) or (timeout is not None and timeout <= 0):
+        raise ValueError("parallelism and timeout must be positive")
+    targets, skipped = _resolve_exec_targets(server_ids, tag)
+    return targets, skipped, command, parallelism, timeout
+
+@app.route('/api/ssh_exec', methods=['POST'])
+@login_required
+def run_ssh_exec():
+    """
+    コマンドを複数のサーバーで並行して実行し、結果を NDJSON で逐次返す
+
+    リクエスト: {'server_ids': [...], 'tag': タグ, 'command': コマンド,
+                'parallelism': 同時実行数, 'timeout': サーバーごとのタイムアウト（秒）}
+    各行は SshFanout のイベント（start / output / exit）で、最後の行は集計（type: 'summary'）。
+    """
+    try:
+        targets, skipped, command, parallelism, timeout = _parse_exec_request(request.json or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    app.logger.info(f"Running command on {len(targets)} servers (skipped: {skipped})")
+    
+    events = queue.Queue()
+    
+    def run():
+        try:
+            summary = ssh_fanout.run(targets, command, events.put, parallelism=parallelism, timeout=timeout)
+        except Exception as e:
+            app.logger.error(f"SSH fan-out failed: {e}")
+            summary = {'error': str(e)}
+        events.put(dict(summary, type='summary', skipped=skipped))
+        events.put(None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    def generate():
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield json.dumps(event, ensure_ascii=False) + '\n'
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@socketio.on('ssh_exec')
+def handle_ssh_exec(data):
+    """
+    コマンドを複数のサーバーで並行して実行する（Socket.IO版）
+
+    結果は ssh_exec_event（start / output / exit）と ssh_exec_complete（集計）で通知する。
+    戻り値（ack）は {'job_id': ..., 'servers': 対象数, 'skipped': [...]} またはエラー。
+    """
+    if not _is_authenticated():
+        return {'error': 'Authentication required'}
+    try:
+        targets, skipped, command, parallelism, timeout = _parse_exec_request(data or {})
+    except ValueError as e:
+        return {'error': str(e)}
+    sid = request.sid
+    job_id = str(data.get('job_id') or os.urandom(8).hex())
+    app.logger.info(f"Running command on {len(targets)} servers for SID {sid} (job {job_id}, skipped: {skipped})")
+    
+    def on_event(event):
+        socketio.emit('ssh_exec_event', dict(event, job_id=job_id), room=sid)
+    
+    def run():
+        try:
+            summary = ssh_fanout.run(targets, command, on_event, parallelism=parallelism, timeout=timeout)
+        except Exception as e:
+            app.logger.error(f"SSH fan-out failed: {e}")
+            summary = {'error': str(e)}
+        socketio.emit('ssh_exec_complete', dict(summary, job_id=job_id, skipped=skipped), room=sid)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return {'job_id': job_id, 'servers': len(targets), 'skipped': skipped}
+
+def _open_tab_sftp(tab_id):
+    """
+    ログイン中のユーザーのタブが使っているSSH接続の上にSFTPチャネルを開く
+
+    Returns:
+        (タブのセッション情報, SFTPを開いた転送用の利用権)。タブが見つからない場合は (None, None)
+    """
+    session_info = multitab_ssh_sessions.get(tab_id)
+    if session_info is None or session_info.get('owner') != session.get('session_id'):
+        return None, None
+    # タブが転送中に閉じられてもトランスポートを維持するため、別の利用権を取得する
+    lease = session_info['client'].share()
+    try:
+        lease.open_sftp(window_size=app.config["SFTP_WINDOW_SIZE"])
+    except Exception:
+        lease.close()
+        raise
+    return session_info, lease
+
+def _sftp_progress(session_info, tab_id, transfer_id, direction, path, total=None):
+    """SFTP転送の進捗をタブのSocket.IOクライアントに sftp_progress イベントで通知する TransferProgress を作成"""
+    def emit_progress(progress):
+        socketio.emit('sftp_progress', dict(progress, transfer_id=transfer_id, tab_id=tab_id,
+                                            direction=direction, path=path), room=session_info['sid'])
+    return TransferProgress(emit_progress, total=total, interval=app.config["SFTP_PROGRESS_INTERVAL"])
+
+def _sftp_error_status(e):
+    if isinstance(e, FileNotFoundError):
+        return 404
+    if isinstance(e, PermissionError):
+        return 403
+    return 500
+
+@app.route('/api/ssh_tabs/<tab_id>/sftp', methods=['GET'])
+@login_required
+def sftp_download(tab_id):
+    """
+    タブのSSH接続でリモートファイルをダウンロード（SFTPで読み取りながらレスポンスとして返す）
+
+    クエリ: path=リモートパス, transfer_id=進捗イベントの識別子（省略時は生成）
+    進捗は sftp_progress イベントでタブのSocket.IOクライアントに通知する。
+    """
+    path = request.args.get('path', '')
+    if not path:
+        return jsonify({"error": "path is required"}), 400
+    transfer_id = request.args.get('transfer_id') or os.urandom(8).hex()
+    try:
+        session_info, lease = _open_tab_sftp(tab_id)
+    except Exception as e:
+        app.logger.error(f"Could not open SFTP for tab {tab_id}: {e}")
+        return jsonify({"error": f"Could not open SFTP: {e}"}), 502
+    if session_info is None:
+        return jsonify({"error": "SSH tab not found"}), 404
+    try:
+        remote = lease.sftp.open(path, 'rb')
+        size = remote.stat().st_size
+    except Exception as e:
+        lease.close()
+        return jsonify({"error": str(e)}), _sftp_error_status(e)
+    
+    app.logger.info(f"SFTP download of {path} ({size} bytes) on tab {tab_id} started")
+    progress = _sftp_progress(session_info, tab_id, transfer_id, 'download', path, total=size)
+    error = 'cancelled'  # レスポンスを最後まで返す前にクライアントが切断した場合
+    
+    def generate():
+        nonlocal error
+        try:
+            yield from iter_remote_file(remote, size, chunk_size=app.config["SFTP_CHUNK_SIZE"],
+                                        read_ahead=app.config["SFTP_READ_AHEAD"], progress=progress)
+            error = None
+        except Exception as e:
+            # ヘッダーは送信済みなので、Content-Length に満たないまま終了して失敗を伝える
+            app.logger.error(f"SFTP download of {path} on tab {tab_id} failed: {e}")
+            error = str(e)
+    
+    def cleanup():
+        progress.finish(error)
+        try:
+            remote.close()
+        except Exception:
+            pass
+        lease.close()
+    
+    response = Response(generate(), mimetype='application/octet-stream', headers={
+        'Content-Length': str(size),
+        'Content-Disposition': f"attachment; filename*=UTF-8''{quote(posixpath.basename(path))}",
+        'X-Transfer-Id': transfer_id,
+    })
+    # 生成を始める前にクライアントが切断した場合も含め、レスポンスの終了時に必ず解放する
+    response.call_on_close(cleanup)
+    return response
+
+@app.route('/api/ssh_tabs/<tab_id>/sftp', methods=['PUT'])
+@login_required
+def sftp_upload(tab_id):
+    """
+    タブのSSH接続でリモートファイルにアップロード（リクエストボディを受け取りながら書き込む）
+
+    クエリ: path=書き込み先のリモートパス, transfer_id=進捗イベントの識別子（省略時は生成）
+    ボディはファイルの内容そのもの（multipart/form-data ではない）。
+    進捗は sftp_progress イベントでタブのSocket.IOクライアントに通知する。
+    """
+    path = request.args.get('path', '')
+    if not path:
+        return jsonify({"error": "path is required"}), 400
+    transfer_id = request.args.get('transfer_id') or os.urandom(8).hex()
+    try:
+        session_info, lease = _open_tab_sftp(tab_id)
+    except Exception as e:
+        app.logger.error(f"Could not open SFTP for tab {tab_id}: {e}")
+        return jsonify({"error": f"Could not open SFTP: {e}"}), 502
+    if session_info is None:
+        return jsonify({"error": "SSH tab not found"}), 404
+    
+    app.logger.info(f"SFTP upload to {path} on tab {tab_id} started")
+    progress = _sftp_progress(session_info, tab_id, transfer_id, 'upload', path, total=request.content_length)
+    try:
+        written = write_remote_file(lease.sftp, path, request.stream, chunk_size=app.config["SFTP_CHUNK_SIZE"],
+                                    expected_size=request.content_length, progress=progress)
+    except Exception as e:
+        app.logger.error(f"SFTP upload to {path} on tab {tab_id} failed: {e}")
+        progress.finish(str(e))
+        return jsonify({"error": str(e), "transfer_id": transfer_id}), _sftp_error_status(e)
+    finally:
+        lease.close()
+    progress.finish()
+    return jsonify({"path": path, "bytes": written, "transfer_id": transfer_id})
+
 def parse_ssh_options(ssh_options_string):
     """
     SSH オプション文字列を解析して、Paramiko の connect() に渡す辞書を生成
@@ -1577,107 +2111,162 @@ def organize_servers_hierarchy(servers):
     return organized
 
 # --- Multi-Tab SSH Handlers ---
-def update_multitab_ssh_status(tab_id, status, message, progress):
-    """マルチタブSSH接続の状態を更新"""
+def update_multitab_ssh_status(tab_id, status, message, progress, room=None):
+    """マルチタブSSH接続の状態を更新（room を指定した場合はそのクライアントにだけ通知）"""
     socketio.emit('ssh_status_update', {
         'tab_id': tab_id,
         'status': status,
         'message': message,
         'progress': progress
-    })
+    }, room=room)
 
-def _multitab_ssh_read_loop(channel, tab_id, sid):
+def _watch_multitab_ssh_channel(channel, tab_id):
     """
-    マルチタブSSH用の読み取りループ（Paramikoベースの SSH接続タイムアウト 監視付き）
-    
+    マルチタブSSH用: チャネルをI/Oリアクターに登録し、出力と切断をクライアントに通知する
+
+    出力はすべてタブのスクロールバックに記録し、接続中のクライアント（session_info['sid']）が
+    いる場合だけ送信する。ブラウザが切断されている間も読み取りを続けるため、再接続時に
+    直近の出力を再送できる。
+
     ※重要な区別※
     - SSH接続タイムアウト: サーバー側でSSH接続自体が切断された時の検出（ここで処理）
     - クライアント都合タイムアウト: フロントエンド側で30分間無操作時の切断（フロントエンドで処理）
     """
-    consecutive_empty_reads = 0
-    max_empty_reads = 50  # 0.5秒 * 50 = 25秒で SSH接続タイムアウト 判定
-    read_timeout = 25.0  # 25秒でread操作をタイムアウト
-    
-    app.logger.info(f"[SSH_LOOP_DEBUG] Starting SSH read loop for tab {tab_id}")
-    
-    # セッション情報を取得してログ出力
-    if tab_id in multitab_ssh_sessions:
-        server_info = multitab_ssh_sessions[tab_id]['server_info']
-        app.logger.info(f"[SSH_LOOP_DEBUG] Tab {tab_id} is connected to server {server_info.get('id', 'unknown')}")
-    else:
-        app.logger.warning(f"[SSH_LOOP_DEBUG] Tab {tab_id} not found in sessions during loop start")
-    
+    def on_output(data):
+        session_info = multitab_ssh_sessions.get(tab_id)
+        if session_info is None or session_info['channel'] is not channel:
+            return
+        with session_info['lock']:
+            session_info['scrollback'].append(data)
+            sid = session_info['sid']
+            if sid is None:
+                return
+            payload = session_info['format_output'](data)
+            if payload:
+                if session_info['flow_control']:
+                    payload['bytes'] = len(data)
+                socketio.emit('ssh_output', payload, room=sid)
+
+    def on_close(reason):
+        app.logger.debug(f"SSH channel ended for tab {tab_id} ({reason})")
+        session_info = multitab_ssh_sessions.get(tab_id)
+        if session_info is None or session_info['channel'] is not channel:
+            # 同じタブIDの新しいセッションに置き換えられた古いチャネル
+            return
+        with session_info['lock']:
+            sid = session_info['sid']
+            if sid is None:
+                # 切断中に終了したセッションは通知先がないので破棄する
+                _discard_multitab_ssh_session(tab_id)
+                return
+            payload = session_info['format_output'](b'', final=True)
+            if payload:
+                socketio.emit('ssh_output', payload, room=sid)
+        # 接続が閉じられた場合、クライアントに通知
+        try:
+            socketio.emit('ssh_connection_closed', {
+                'tab_id': tab_id,
+                'message': 'SSH接続が切断されました'
+            }, room=sid)
+            app.logger.debug(f"Sent connection closed event for tab {tab_id}")
+        except Exception as e:
+            app.logger.error(f"Error sending connection closed event for tab {tab_id}: {e}")
+
+    session_info = multitab_ssh_sessions[tab_id]
+    _enable_ssh_keepalive(channel)
+    ssh_reactor.register(channel, on_output, on_close, window=_flow_window(session_info['flow_control']))
+
+def _discard_multitab_ssh_session(tab_id):
+    """マルチタブSSHセッションを閉じて管理対象から外す"""
+    session_info = multitab_ssh_sessions.pop(tab_id, None)
+    if session_info is None:
+        return
+    _close_multitab_ssh_session_info(tab_id, session_info)
+
+def _close_multitab_ssh_session_info(tab_id, session_info):
+    """管理対象から外したマルチタブSSHセッションのチャネルを閉じ、トランスポートの参照を返す"""
+    ssh_reactor.unregister(session_info['channel'])
     try:
-        while not channel.closed:
-            try:
-                if channel.recv_ready():
-                    # データが利用可能な場合
-                    try:
-                        channel.settimeout(read_timeout)  # read操作にタイムアウトを設定
-                        output = channel.recv(4096).decode('utf-8', errors='ignore')
-                        if output:
-                            consecutive_empty_reads = 0  # データを受信したのでカウンターをリセット
-                            socketio.emit('ssh_output', {
-                                'tab_id': tab_id,
-                                'output': output
-                            }, room=sid)
-                        else:
-                            consecutive_empty_reads += 1
-                            app.logger.debug(f"Empty read #{consecutive_empty_reads} for tab {tab_id}")
-                    except socket.timeout:
-                        app.logger.warning(f"SSH read timeout for tab {tab_id}")
-                        consecutive_empty_reads += 10  # タイムアウトが発生した場合は大きくカウントを増やす
-                    except Exception as e:
-                        app.logger.error(f"SSH read error for tab {tab_id}: {e}")
-                        break
-                else:
-                    # データが利用可能でない場合
-                    consecutive_empty_reads += 1
-                    
-                # 連続して空読みが続く場合、接続の健全性をチェック
-                if consecutive_empty_reads >= max_empty_reads:
-                    app.logger.warning(f"Too many consecutive empty reads for tab {tab_id}, checking connection health")
-                    
-                    # Paramikoの内部状態をチェック
-                    transport = channel.get_transport()
-                    if transport is None or not transport.is_active():
-                        app.logger.warning(f"SSH transport is not active for tab {tab_id}")
-                        break
-                    
-                    # ping的なメッセージを送信して接続をテスト
-                    try:
-                        # ゼロバイトの送信を試す（接続テスト）
-                        channel.send('')
-                        consecutive_empty_reads = 0  # 成功したらリセット
-                        app.logger.debug(f"Connection test successful for tab {tab_id}")
-                    except Exception as e:
-                        app.logger.warning(f"Connection test failed for tab {tab_id}: {e}")
-                        break
-                
-                if channel.closed:
-                    break
-                    
-                time.sleep(0.01)
-                
-            except Exception as e:
-                app.logger.error(f"Unexpected error in SSH read loop for tab {tab_id}: {e}")
-                break
-                
+        session_info['client'].close()
     except Exception as e:
-        app.logger.error(f"Fatal error in SSH read loop for tab {tab_id}: {e}")
-    finally:
-        app.logger.debug(f"SSH read loop ended for tab {tab_id}")
-        
-        # 接続が閉じられた場合、クライアントに通知
-        if tab_id in multitab_ssh_sessions:
-            try:
-                socketio.emit('ssh_connection_closed', {
-                    'tab_id': tab_id,
-                    'message': 'SSH接続が切断されました'
-                }, room=sid)
-                app.logger.debug(f"Sent connection closed event for tab {tab_id}")
-            except Exception as e:
-                app.logger.error(f"Error sending connection closed event for tab {tab_id}: {e}")
+        app.logger.debug(f"Error closing SSH client for tab {tab_id}: {e}")
+
+def _detach_multitab_ssh_session(tab_id):
+    """
+    ブラウザが切断されたタブを猶予期間だけ維持する
+
+    猶予期間内に同じログインセッションから attach_ssh_tab があれば再接続し、
+    なければセッションを閉じる。
+    """
+    session_info = multitab_ssh_sessions.get(tab_id)
+    if session_info is None:
+        return
+    grace_period = app.config["SSH_DETACH_GRACE_PERIOD"]
+    if not grace_period:
+        _discard_multitab_ssh_session(tab_id)
+        app.logger.debug(f"Multi-tab SSH session closed for tab: {tab_id}")
+        return
+    detached_at = time.time()
+    with session_info['lock']:
+        session_info['sid'] = None
+        session_info['detached_at'] = detached_at
+    # 受信確認を返すクライアントがいないので、読み取りを止めずにスクロールバックへ記録し続ける
+    ssh_reactor.set_window(session_info['channel'], None)
+    timer = threading.Timer(grace_period, _expire_detached_ssh_session, args=(tab_id, detached_at))
+    timer.daemon = True
+    timer.start()
+    app.logger.debug(f"Multi-tab SSH session detached for tab: {tab_id} (grace period {grace_period}s)")
+
+def _expire_detached_ssh_session(tab_id, detached_at):
+    session_info = multitab_ssh_sessions.get(tab_id)
+    if session_info is None or session_info['sid'] is not None or session_info.get('detached_at') != detached_at:
+        return
+    _discard_multitab_ssh_session(tab_id)
+    app.logger.info(f"Detached SSH session for tab {tab_id} expired and was closed")
+
+@socketio.on('attach_ssh_tab')
+def handle_attach_ssh_tab(data):
+    """
+    切断中（または別の接続で開いていた）タブに再接続する
+
+    スクロールバックのうちクライアントが受信済みの位置（since）以降を1フレームで再送する。
+    再接続できない場合は ssh_tab_attach_failed を返すので、クライアントは新規接続する。
+    """
+    if not _is_authenticated():
+        return
+    tab_id = data.get('tab_id')
+    if not _attach_ssh_tab(tab_id, request.sid, session.get('session_id'), data.get('since'),
+                           bool(data.get('binary')), bool(data.get('flow_control'))):
+        emit('ssh_tab_attach_failed', {'tab_id': tab_id})
+
+def _attach_ssh_tab(tab_id, sid, owner, since, binary, flow_control):
+    """
+    サーバー側に残っているタブのセッションをクライアント（sid）に結び付ける
+
+    Returns:
+        再接続できた場合は True（セッションがない・所有者が違う・チャネルが閉じている場合は False）
+    """
+    session_info = multitab_ssh_sessions.get(tab_id) if tab_id else None
+    if session_info is None or session_info['owner'] != owner or session_info['channel'].closed:
+        return False
+    try:
+        since = max(0, int(since or 0))
+    except (TypeError, ValueError):
+        since = 0
+    with session_info['lock']:
+        session_info['sid'] = sid
+        session_info['detached_at'] = None
+        session_info['format_output'] = _ssh_output_formatter(binary, tab_id)
+        session_info['flow_control'] = flow_control
+        ssh_reactor.set_window(session_info['channel'], _flow_window(flow_control))
+        replay = session_info['scrollback'].read_since(since)
+        payload = _ssh_output_formatter(binary, tab_id)(replay) if replay else None
+        if payload:
+            payload['replay'] = True
+            socketio.emit('ssh_output', payload, room=sid)
+    app.logger.debug(f"Tab {tab_id} reattached to SID {sid} (replayed {len(replay)} bytes)")
+    update_multitab_ssh_status(tab_id, 'connected', '接続中のセッションに再接続しました', 100, room=sid)
+    return True
 
 @socketio.on('start_ssh_tab')
 def handle_start_ssh_tab(data):
@@ -1695,32 +2284,67 @@ def handle_start_ssh_tab(data):
         return
     
     # 初期化: 接続開始状態
-    update_multitab_ssh_status(tab_id, 'initializing', 'SSH接続を開始しています...', 10)
+    update_multitab_ssh_status(tab_id, 'initializing', 'SSH接続を開始しています...', 10, room=sid)
     
     app.logger.info(f"[SSH_TAB_DEBUG] Received start_ssh_tab event. Tab ID: {tab_id}, Server ID: {server_id}, SID: {sid}")
     
+    # ログインセッションIDはワーカー（リクエストコンテキストの外）では参照できないので先に取得する
+    owner = _login_session_id()
+    
+    with ssh_connecting_lock:
+        if tab_id in ssh_connecting_tabs:
+            app.logger.debug(f"Tab {tab_id} is already connecting")
+            return
+        ssh_connecting_tabs[tab_id] = {'cancel': threading.Event(), 'owner': owner, 'sid': sid}
+    
+    # 接続処理（鍵交換・認証・シェル作成）は接続ワーカーで行い、ハンドラーはすぐに戻る
+    ssh_connect_executor.submit(_connect_ssh_tab, tab_id, server_id, sid, owner,
+                                bool(data.get('binary')), bool(data.get('flow_control')))
+
+def _connect_ssh_tab(tab_id, server_id, sid, owner, binary=False, flow_control=False, server_info=None):
+    """
+    接続ワーカー: マルチタブSSH接続を確立してセッションに登録する
+
+    進捗とエラーは接続を要求したクライアント（sid）に ssh_status_update / ssh_output で通知する。
+
+    Args:
+        owner: タブを所有するログインセッションID
+        server_info: 接続先のサーバー設定（None の場合は server_id で取得）
+    """
+    try:
+        _establish_ssh_tab(tab_id, server_id, sid, owner, binary, flow_control, server_info)
+    except Exception as e:
+        app.logger.error(f"Unexpected error while connecting tab {tab_id}: {e}")
+    finally:
+        # 接続に失敗した場合も、同じ接続先を待っている他のタブを起こす
+        ssh_transport_pool.end_connect()
+        with ssh_connecting_lock:
+            ssh_connecting_tabs.pop(tab_id, None)
+
+def _establish_ssh_tab(tab_id, server_id, sid, owner, binary, flow_control, server_info):
+    """_connect_ssh_tab の本体（接続できなかった場合はクライアントに通知して戻る）"""
     # セッション管理のログ追加
     app.logger.info(f"[SSH_TAB_DEBUG] Current multitab_ssh_sessions keys: {list(multitab_ssh_sessions.keys())}")
     app.logger.info(f"[SSH_TAB_DEBUG] Tab {tab_id} - Starting connection to server {server_id}")
     
-    config = load_servers_config()
-    server_info = next((s for s in config.get('servers', []) if s['id'] == server_id), None)
+    if server_info is None:
+        server_info = servers_store.get(server_id)
     
     if not server_info:
         app.logger.debug(f"Server '{server_id}' not found.")
-        update_multitab_ssh_status(tab_id, 'error', f"サーバー '{server_id}' が見つかりません", 0)
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: Server '{server_id}' not found in configuration.\r\n"})
+        update_multitab_ssh_status(tab_id, 'error', f"サーバー '{server_id}' が見つかりません", 0, room=sid)
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: Server '{server_id}' not found in configuration.\r\n"}, room=sid)
         return
     
     ssh_connectable_types = ['node', 'virtual_machine', 'network_device', 'kvm']
     if server_info.get('type') not in ssh_connectable_types:
         app.logger.debug(f"Server '{server_id}' is not an SSH connectable type server.")
-        update_multitab_ssh_status(tab_id, 'error', f"サーバー '{server_id}' はSSH接続できません", 0)
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: Server '{server_id}' is not an SSH connectable type server.\r\n"})
+        update_multitab_ssh_status(tab_id, 'error', f"サーバー '{server_id}' はSSH接続できません", 0, room=sid)
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: Server '{server_id}' is not an SSH connectable type server.\r\n"}, room=sid)
         return
     
     # サーバー情報取得完了: 20%
-    update_multitab_ssh_status(tab_id, 'connecting', 'サーバー情報を取得しました', 20)
+    update_multitab_ssh_status(tab_id, 'connecting', 'サーバー情報を取得しました', 20, room=sid)
     
     try:
         client = paramiko.SSHClient()
@@ -1735,18 +2359,26 @@ def handle_start_ssh_tab(data):
         ssh_options = server_info.get('ssh_options', '')
         
         # SSH接続準備完了: 30%
-        update_multitab_ssh_status(tab_id, 'connecting', f'{hostname}:{port} に接続中...', 30)
+        update_multitab_ssh_status(tab_id, 'connecting', f'{hostname}:{port} に接続中...', 30, room=sid)
         
         # SSH オプションを解析
         ssh_connect_kwargs = parse_ssh_options(ssh_options)
         app.logger.debug(f"SSH connection will use additional options: {ssh_connect_kwargs}")
         
-        if ssh_key_id:
+        pool_key = transport_pool_key(hostname, port, username, ssh_key_id, password, ssh_options)
+        # 同じ接続先へ別のタブが接続中の場合は、その接続を待って共有する
+        lease = ssh_transport_pool.acquire(pool_key, wait=SSH_POOL_CONNECT_WAIT)
+        
+        if lease is not None:
+            # 同じ接続先・認証情報の接続済みトランスポートにチャネルを追加する（鍵交換と認証を省略）: 70%
+            update_multitab_ssh_status(tab_id, 'authenticating', '既存のSSH接続を再利用しています', 70, room=sid)
+            app.logger.debug(f"Reusing pooled SSH transport to {hostname}:{port} for tab {tab_id}")
+            client.close()
+        elif ssh_key_id:
             # SSH鍵認証の準備: 40%
-            update_multitab_ssh_status(tab_id, 'authenticating', 'SSH鍵を準備中...', 40)
+            update_multitab_ssh_status(tab_id, 'authenticating', 'SSH鍵を準備中...', 40, room=sid)
             
-            ssh_keys_config = load_ssh_keys_config()
-            ssh_key_info = next((k for k in ssh_keys_config.get('ssh_keys', []) if k['id'] == ssh_key_id), None)
+            ssh_key_info = ssh_keys_store.get(ssh_key_id)
             app.logger.debug(f"Attempting to load key '{ssh_key_id}' with info: {ssh_key_info}")
             
             if ssh_key_info and os.path.exists(os.path.expanduser(ssh_key_info['path'])):
@@ -1755,136 +2387,138 @@ def handle_start_ssh_tab(data):
                     app.logger.debug(f"Expanded key path: {key_path_expanded}")
                     
                     # SSH鍵の読み込み: 50%
-                    update_multitab_ssh_status(tab_id, 'authenticating', f"SSH鍵 '{ssh_key_info['name']}' を読み込み中...", 50)
+                    update_multitab_ssh_status(tab_id, 'authenticating', f"SSH鍵 '{ssh_key_info['name']}' を読み込み中...", 50, room=sid)
                     
                     try:
-                        key = paramiko.RSAKey.from_private_key_file(key_path_expanded)
-                        app.logger.debug(f"Successfully loaded RSA key: {ssh_key_info['name']}")
+                        key, key_type = ssh_key_cache.get(ssh_key_id, key_path_expanded)
+                        app.logger.debug(f"Loaded {key_type} key: {ssh_key_info['name']}")
                     except paramiko.PasswordRequiredException:
-                        app.logger.debug(f"RSA key requires passphrase: {ssh_key_info['name']}")
-                        update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0)
-                        emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase (RSA format).\r\n"})
+                        app.logger.debug(f"SSH key requires passphrase: {ssh_key_info['name']}")
+                        update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0, room=sid)
+                        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase.\r\n"}, room=sid)
                         client.close()
                         return
                     except paramiko.SSHException as e:
-                        app.logger.debug(f"RSAKey load failed: {e}. Attempting Ed25519Key.")
-                        try:
-                            key = paramiko.Ed25519Key(filename=key_path_expanded)
-                            app.logger.debug(f"Successfully loaded Ed25519 key: {ssh_key_info['name']}")
-                        except paramiko.PasswordRequiredException:
-                            app.logger.debug(f"Ed25519 key requires passphrase: {ssh_key_info['name']}")
-                            update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0)
-                            emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase (Ed25519 format).\r\n"})
-                            client.close()
-                            return
-                        except Exception as ed25519_e:
-                            app.logger.debug(f"Ed25519Key load failed: {ed25519_e}.")
-                            update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイルの読み込みに失敗しました", 0)
-                            emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file format error for '{ssh_key_info['name']}':\r\nRSA format: {e}\r\nEd25519 format: {ed25519_e}\r\nPlease check if the key file is corrupted or in an unsupported format.\r\n"})
-                            client.close()
-                            return
+                        app.logger.debug(f"SSH key load failed: {e}")
+                        update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイルの読み込みに失敗しました", 0, room=sid)
+                        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file format error for '{ssh_key_info['name']}':\r\n{e}\r\nPlease check if the key file is corrupted or in an unsupported format.\r\n"}, room=sid)
+                        client.close()
+                        return
                     except Exception as e:
                         app.logger.debug(f"Failed to load SSH key file: {e}")
-                        update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイルの読み込みに失敗しました", 0)
-                        emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file loading error for '{ssh_key_info['name']}': {e}\r\nThis appears to be a file permission or format issue.\r\n"})
+                        update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイルの読み込みに失敗しました", 0, room=sid)
+                        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file loading error for '{ssh_key_info['name']}': {e}\r\nThis appears to be a file permission or format issue.\r\n"}, room=sid)
                         client.close()
                         return
                     
                     # SSH鍵認証で接続: 70%
-                    update_multitab_ssh_status(tab_id, 'authenticating', f"SSH鍵で認証中...", 70)
-                    
-                    # 基本的な接続パラメータ
-                    connect_params = {
-                        'hostname': hostname,
-                        'port': port,
-                        'username': username,
-                        'pkey': key,
-                        'timeout': 10,
-                        'look_for_keys': False,
-                        'allow_agent': False
-                    }
+                    update_multitab_ssh_status(tab_id, 'authenticating', f"SSH鍵で認証中...", 70, room=sid)
                     
-                    # SSH オプションから得られた追加パラメータをマージ
-                    connect_params.update(ssh_connect_kwargs)
+                    # 接続パラメータ（SSH オプションから得られた追加パラメータを含む）
+                    connect_params = _ssh_connect_params(server_info, pkey=key, ssh_connect_kwargs=ssh_connect_kwargs)
                     
-                    client.connect(**connect_params)
+                    _ssh_connect(client, connect_params)
                     app.logger.debug(f"SSH connected to {hostname} using key: {ssh_key_info['name']}")
                 except paramiko.PasswordRequiredException:
                     app.logger.debug(f"Key '{ssh_key_info['name']}' requires passphrase.")
-                    update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0)
-                    emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase.\r\n"})
+                    update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_info['name']}' にパスフレーズが必要です", 0, room=sid)
+                    socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_info['name']}' requires a passphrase.\r\n"}, room=sid)
                     client.close()
                     return
                 except paramiko.AuthenticationException:
                     app.logger.debug(f"SSH authentication failed for {hostname} with username {username} using key {ssh_key_info['name']}")
-                    update_multitab_ssh_status(tab_id, 'error', f"SSH認証失敗（ユーザー名またはSSH鍵が正しくありません）", 0)
-                    emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH authentication rejected for {username}@{hostname} using key '{ssh_key_info['name']}'.\r\nPlease check if the username '{username}' is correct for this server and if the SSH key is properly configured.\r\n"})
+                    update_multitab_ssh_status(tab_id, 'error', f"SSH認証失敗（ユーザー名またはSSH鍵が正しくありません）", 0, room=sid)
+                    socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH authentication rejected for {username}@{hostname} using key '{ssh_key_info['name']}'.\r\nPlease check if the username '{username}' is correct for this server and if the SSH key is properly configured.\r\n"}, room=sid)
                     client.close()
                     return
                 except (paramiko.SSHException, OSError, ValueError) as e:
                     app.logger.debug(f"SSH Key file loading error for '{ssh_key_info['name']}': {e}")
-                    update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイル '{ssh_key_info['name']}' の読み込みエラー", 0)
-                    emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file loading error for '{ssh_key_info['name']}': {e}\r\nThis is a file format or permission issue, not an authentication problem.\r\n"})
+                    update_multitab_ssh_status(tab_id, 'error', f"SSH鍵ファイル '{ssh_key_info['name']}' の読み込みエラー", 0, room=sid)
+                    socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH Key file loading error for '{ssh_key_info['name']}': {e}\r\nThis is a file format or permission issue, not an authentication problem.\r\n"}, room=sid)
                     client.close()
                     return
                 except Exception as e:
                     app.logger.debug(f"Unexpected SSH connection error for '{ssh_key_info['name']}': {e}")
-                    update_multitab_ssh_status(tab_id, 'error', f"SSH接続エラー", 0)
-                    emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH connection error: {e}\r\n"})
+                    update_multitab_ssh_status(tab_id, 'error', f"SSH接続エラー", 0, room=sid)
+                    socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH connection error: {e}\r\n"}, room=sid)
                     client.close()
                     return
             else:
                 app.logger.debug(f"SSH Key '{ssh_key_id}' not found or path invalid (info: {ssh_key_info}).")
-                update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_id}' が見つかりません", 0)
-                emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_id}' not found or path invalid.\r\n"})
+                update_multitab_ssh_status(tab_id, 'error', f"SSH鍵 '{ssh_key_id}' が見つかりません", 0, room=sid)
+                socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Error: SSH Key '{ssh_key_id}' not found or path invalid.\r\n"}, room=sid)
                 client.close()
                 return
         elif password:
             # パスワード認証: 50%
-            update_multitab_ssh_status(tab_id, 'authenticating', 'パスワードで認証中...', 50)
+            update_multitab_ssh_status(tab_id, 'authenticating', 'パスワードで認証中...', 50, room=sid)
             
             app.logger.debug(f"Attempting password authentication for {hostname}")
-            # 基本的な接続パラメータ
-            connect_params = {
-                'hostname': hostname,
-                'port': port,
-                'username': username,
-                'password': password,
-                'timeout': 10
-            }
+            # 接続パラメータ（SSH オプションから得られた追加パラメータを含む）
+            connect_params = _ssh_connect_params(server_info, ssh_connect_kwargs=ssh_connect_kwargs)
             
-            # SSH オプションから得られた追加パラメータをマージ
-            connect_params.update(ssh_connect_kwargs)
-            
-            client.connect(**connect_params)
+            _ssh_connect(client, connect_params)
             app.logger.debug(f"SSH connected to {hostname} using password.")
         else:
             app.logger.debug(f"No valid authentication method provided.")
-            update_multitab_ssh_status(tab_id, 'error', f"認証情報が提供されていません", 0)
-            emit('ssh_output', {'tab_id': tab_id, 'output': "Error: No valid authentication method (password or SSH key) provided.\r\n"})
+            update_multitab_ssh_status(tab_id, 'error', f"認証情報が提供されていません", 0, room=sid)
+            socketio.emit('ssh_output', {'tab_id': tab_id, 'output': "Error: No valid authentication method (password or SSH key) provided.\r\n"}, room=sid)
             client.close()
             return
         
         # シェルセッション作成: 90%
-        update_multitab_ssh_status(tab_id, 'connecting', 'シェルセッションを作成中...', 90)
+        update_multitab_ssh_status(tab_id, 'connecting', 'シェルセッションを作成中...', 90, room=sid)
         
-        chan = client.invoke_shell()
-        chan.settimeout(0.0)
-        
-        # シェル作成後の健全性チェック
-        time.sleep(0.1)  # 少し待ってからチェック
-        if chan.closed:
-            raise Exception("Shell channel was closed immediately after creation")
+        if lease is None:
+            lease = ssh_transport_pool.add(pool_key, client)
+        try:
+            chan = lease.open_shell(window_size=app.config["SSH_CHANNEL_WINDOW"])
+            chan.settimeout(0.0)
+            
+            # シェル作成後の健全性チェック
+            time.sleep(0.1)  # 少し待ってからチェック
+            if chan.closed:
+                raise Exception("Shell channel was closed immediately after creation")
+        except Exception:
+            lease.close()
+            raise
         
-        # マルチタブセッション管理に追加
-        multitab_ssh_sessions[tab_id] = {
-            'client': client,
-            'channel': chan,
-            'sid': sid,
-            'server_info': server_info,
-            'server_config': server_info,  # 状態保存用
-            'username': username  # 状態保存用
-        }
+        # マルチタブセッション管理に追加（接続中に close_ssh_tab を受けた場合は破棄する）
+        # 同じタブIDの切断中のセッションが残っていれば閉じて置き換える（別のログインセッションのものは置き換えない）
+        replaced = None
+        with ssh_connecting_lock:
+            connecting = ssh_connecting_tabs.get(tab_id)
+            cancelled = connecting is not None and connecting['cancel'].is_set()
+            existing = multitab_ssh_sessions.get(tab_id)
+            rejected = not cancelled and existing is not None and existing.get('owner') != owner
+            if not cancelled and not rejected:
+                replaced = existing
+                multitab_ssh_sessions[tab_id] = {
+                    'client': lease,  # close() でチャネルを閉じてプールに参照を返す
+                    'channel': chan,
+                    'sid': sid,
+                    'owner': owner,  # 再接続を許可するログインセッション
+                    'server_info': server_info,
+                    'server_config': server_info,  # 状態保存用
+                    'username': username,  # 状態保存用
+                    'lock': threading.Lock(),
+                    'scrollback': ScrollbackBuffer(app.config["SSH_SCROLLBACK_BYTES"]),
+                    'format_output': _ssh_output_formatter(binary, tab_id),
+                    'flow_control': flow_control,
+                    'detached_at': None
+                }
+        if replaced is not None:
+            app.logger.debug(f"Replacing existing SSH session for tab {tab_id}")
+            _close_multitab_ssh_session_info(tab_id, replaced)
+        if cancelled:
+            app.logger.debug(f"Tab {tab_id} was closed while connecting")
+            lease.close()
+            return
+        if rejected:
+            app.logger.warning(f"Tab ID {tab_id} is already used by another login session")
+            lease.close()
+            update_multitab_ssh_status(tab_id, 'error', 'このタブIDは使用中です', 0, room=sid)
+            return
         
         # デバッグログを追加
         app.logger.info(f"[SSH_TAB_DEBUG] Tab {tab_id} - Successfully connected to server {server_id} ({hostname})")
@@ -1892,28 +2526,42 @@ def handle_start_ssh_tab(data):
         app.logger.info(f"[SSH_TAB_DEBUG] Updated multitab_ssh_sessions keys: {list(multitab_ssh_sessions.keys())}")
         
         # 接続完了: 100%
-        update_multitab_ssh_status(tab_id, 'connected', f'{hostname} に接続完了', 100)
+        update_multitab_ssh_status(tab_id, 'connected', f'{hostname} に接続完了', 100, room=sid)
+        
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Successfully connected to {hostname}.\r\n"}, room=sid)
         
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"Successfully connected to {hostname}.\r\n"})
+        # マルチタブ用のSSH出力をI/Oリアクターで待ち受ける
+        _watch_multitab_ssh_channel(chan, tab_id)
         
-        # マルチタブ用のSSH出力読み取りスレッドを開始
-        threading.Thread(target=_multitab_ssh_read_loop, args=(chan, tab_id, sid), daemon=True).start()
+        if not socketio.server.manager.is_connected(sid, '/'):
+            # 接続処理中にブラウザが切断された場合は、切断中のタブとして再接続を待つ
+            _detach_multitab_ssh_session(tab_id)
         
         # SSH接続成功時に状態を保存
-        _save_ssh_tabs_state()
+        _save_ssh_tabs_state(owner)
         
     except paramiko.AuthenticationException:
         app.logger.debug(f"SSH authentication failed for {hostname} with username {username}")
-        update_multitab_ssh_status(tab_id, 'error', f"SSH認証エラー（ユーザー名またはSSH鍵が正しくありません）", 0)
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH authentication failed for {username}@{hostname}.\r\nPlease check username and SSH key configuration.\r\n"})
+        update_multitab_ssh_status(tab_id, 'error', f"SSH認証エラー（ユーザー名またはSSH鍵が正しくありません）", 0, room=sid)
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH authentication failed for {username}@{hostname}.\r\nPlease check username and SSH key configuration.\r\n"}, room=sid)
     except paramiko.SSHException as e:
         app.logger.debug(f"SSH error for {hostname}: {e}")
-        update_multitab_ssh_status(tab_id, 'error', f"SSH接続エラー: {e}", 0)
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH error: {e}\r\n"})
+        update_multitab_ssh_status(tab_id, 'error', f"SSH接続エラー: {e}", 0, room=sid)
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"SSH error: {e}\r\n"}, room=sid)
     except Exception as e:
         app.logger.debug(f"General connection error for {hostname}: {e}")
-        update_multitab_ssh_status(tab_id, 'error', f"接続エラー: {e}", 0)
-        emit('ssh_output', {'tab_id': tab_id, 'output': f"Connection error: {e}\r\n"})
+        update_multitab_ssh_status(tab_id, 'error', f"接続エラー: {e}", 0, room=sid)
+        socketio.emit('ssh_output', {'tab_id': tab_id, 'output': f"Connection error: {e}\r\n"}, room=sid)
+
+def _owns_ssh_tab(entry):
+    """
+    タブのセッション（または接続処理中のタブ）が要求元のものかを返す（リクエストコンテキストで呼ぶ）
+
+    他のユーザーのタブを操作させないため、所有するログインセッションからの要求で、
+    かつ現在タブに結び付いているクライアントからの要求だけを受け付ける。
+    """
+    return (entry is not None and entry.get('owner') == session.get('session_id')
+            and entry.get('sid') == request.sid)
 
 @socketio.on('ssh_input')
 def handle_ssh_input(data):
@@ -1926,19 +2574,42 @@ def handle_ssh_input(data):
     if tab_id:
         # マルチタブモード
         app.logger.info(f"[SSH_INPUT_DEBUG] Received input for tab {tab_id}")
-        if tab_id in multitab_ssh_sessions:
-            chan = multitab_ssh_sessions[tab_id]['channel']
-            server_info = multitab_ssh_sessions[tab_id]['server_info']
+        session_info = multitab_ssh_sessions.get(tab_id)
+        if _owns_ssh_tab(session_info):
+            chan = session_info['channel']
+            server_info = session_info['server_info']
             app.logger.info(f"[SSH_INPUT_DEBUG] Sending input to server {server_info.get('id', 'unknown')} for tab {tab_id}")
+            ssh_reactor.mark_interactive(chan)
             chan.send(data['input'])
         else:
-            app.logger.warning(f"[SSH_INPUT_DEBUG] Tab {tab_id} not found in multitab_ssh_sessions. Available keys: {list(multitab_ssh_sessions.keys())}")
+            app.logger.warning(f"[SSH_INPUT_DEBUG] Tab {tab_id} not found in multitab_ssh_sessions for this client")
     else:
         # 既存の単一タブモード
         if sid in active_ssh_sessions:
             chan = active_ssh_sessions[sid]['channel']
+            ssh_reactor.mark_interactive(chan)
             chan.send(data['input'])
 
+@socketio.on('ssh_output_ack')
+def handle_ssh_output_ack(data):
+    """クライアントが描画し終えた出力のバイト数を受け取り、送信ウィンドウを回復する"""
+    if not _is_authenticated():
+        return
+    tab_id = data.get('tab_id')
+    try:
+        nbytes = int(data.get('bytes') or 0)
+    except (TypeError, ValueError):
+        return
+    if tab_id:
+        # 他のユーザーのタブの送信ウィンドウを回復させない（受信確認は接続中のクライアントからのみ受け付ける）
+        session_info = multitab_ssh_sessions.get(tab_id)
+        if not _owns_ssh_tab(session_info):
+            return
+    else:
+        session_info = active_ssh_sessions.get(request.sid)
+    if session_info:
+        ssh_reactor.ack(session_info['channel'], nbytes)
+
 @socketio.on('resize_terminal')
 def handle_resize_terminal(data):
     """ターミナルリサイズ処理（既存の単一タブとマルチタブの両方に対応）"""
@@ -1951,9 +2622,9 @@ def handle_resize_terminal(data):
     
     if tab_id:
         # マルチタブモード
-        if tab_id in multitab_ssh_sessions:
-            chan = multitab_ssh_sessions[tab_id]['channel']
-            chan.resize_pty(cols, rows)
+        session_info = multitab_ssh_sessions.get(tab_id)
+        if _owns_ssh_tab(session_info):
+            session_info['channel'].resize_pty(cols, rows)
     else:
         # 既存の単一タブモード
         if sid in active_ssh_sessions:
@@ -1972,11 +2643,19 @@ def handle_close_ssh_tab(data):
     
     app.logger.debug(f"Closing SSH tab: {tab_id}")
     
-    if tab_id in multitab_ssh_sessions:
-        session_info = multitab_ssh_sessions[tab_id]
+    # 他のユーザーのタブは閉じない（接続処理中のタブも所有者からの要求のみキャンセルする）
+    with ssh_connecting_lock:
+        connecting = ssh_connecting_tabs.get(tab_id)
+        if _owns_ssh_tab(connecting):
+            # 接続処理中のタブは接続完了時に破棄させる
+            connecting['cancel'].set()
+    
+    session_info = multitab_ssh_sessions.get(tab_id)
+    if _owns_ssh_tab(session_info):
         client = session_info['client']
         
         try:
+            ssh_reactor.unregister(session_info['channel'])
             client.close()
             app.logger.debug(f"SSH client closed for tab: {tab_id}")
         except Exception as e:
@@ -2042,9 +2721,83 @@ def handle_load_ssh_tabs_state():
         emit('restore_ssh_tabs', {'tabs': []})
         app.logger.debug(f"No SSH tabs data found for session {session_id}")
 
-def _save_ssh_tabs_state():
-    """現在のSSHタブ状態をセッションに保存（内部用）"""
-    # FlaskのログインセッションIDを使用
+@socketio.on('restore_ssh_tabs_bulk')
+def handle_restore_ssh_tabs_bulk(data):
+    """
+    保存されていたタブをまとめて復元する
+
+    サーバー側に残っているセッションはその場で再接続し、それ以外のタブは接続ワーカーで
+    並行して新規接続する（1回の復元で同時に接続するのは SSH_RESTORE_CONCURRENCY タブまで）。
+    サーバー設定は1回だけスナップショットを取って全タブで共有する。
+    タブごとの進捗は ssh_status_update と ssh_tabs_restore_progress、完了は
+    ssh_tabs_restore_complete で通知する。
+
+    data: {'tabs': [{'tab_id': ..., 'server_id': ..., 'since': 受信済みバイト数}, ...],
+           'binary': bool, 'flow_control': bool}
+    """
+    if not _is_authenticated():
+        emit('ssh_tabs_restore_complete', {'total': 0, 'attached': 0, 'connected': 0, 'failed': 0})
+        return
+    sid = request.sid
+    owner = _login_session_id()
+    binary = bool(data.get('binary'))
+    flow_control = bool(data.get('flow_control'))
+    servers = {server.get('id'): server for server in servers_store.snapshot()}
+    
+    attached = 0
+    to_connect = []
+    for tab in data.get('tabs') or []:
+        tab_id = tab.get('tab_id')
+        if not tab_id:
+            continue
+        if _attach_ssh_tab(tab_id, sid, owner, tab.get('since'), binary, flow_control):
+            attached += 1
+            continue
+        with ssh_connecting_lock:
+            if tab_id in ssh_connecting_tabs:
+                continue
+            ssh_connecting_tabs[tab_id] = {'cancel': threading.Event(), 'owner': owner, 'sid': sid}
+        update_multitab_ssh_status(tab_id, 'initializing', 'SSH接続を開始しています...', 10, room=sid)
+        to_connect.append((tab_id, tab.get('server_id')))
+    
+    app.logger.info(f"Restoring SSH tabs for SID {sid}: {attached} reattached, {len(to_connect)} to connect")
+    threading.Thread(target=_restore_ssh_tabs, args=(sid, owner, to_connect, servers, binary, flow_control, attached),
+                     daemon=True).start()
+
+def _restore_ssh_tabs(sid, owner, to_connect, servers, binary, flow_control, attached):
+    """一括復元: タブを同時接続数の上限内で接続ワーカーに渡し、完了したタブから結果を通知する"""
+    limit = threading.BoundedSemaphore(app.config["SSH_RESTORE_CONCURRENCY"])
+    progress_lock = threading.Lock()
+    counts = {'attached': attached, 'connected': 0, 'failed': 0}
+    total = attached + len(to_connect)
+    
+    def report(tab_id, _future):
+        limit.release()
+        status = 'connected' if tab_id in multitab_ssh_sessions else 'failed'
+        with progress_lock:
+            counts[status] += 1
+            completed = sum(counts.values())
+        socketio.emit('ssh_tabs_restore_progress', {
+            'tab_id': tab_id,
+            'status': status,
+            'completed': completed,
+            'total': total
+        }, room=sid)
+    
+    futures = []
+    for tab_id, server_id in to_connect:
+        limit.acquire()
+        future = ssh_connect_executor.submit(_connect_ssh_tab, tab_id, server_id, sid, owner,
+                                             binary, flow_control, servers.get(server_id))
+        future.add_done_callback(partial(report, tab_id))
+        futures.append(future)
+    wait_futures(futures)
+    
+    socketio.emit('ssh_tabs_restore_complete', dict(counts, total=total), room=sid)
+    app.logger.info(f"SSH tabs restore finished for SID {sid}: {counts}")
+
+def _login_session_id():
+    """FlaskのログインセッションIDを取得（存在しない場合は新規生成。リクエストコンテキストで呼ぶ）"""
     session_id = session.get('session_id')
     
     # セッションIDが存在しない場合は新規生成（通常はログイン時に設定済み）
@@ -2053,10 +2806,24 @@ def _save_ssh_tabs_state():
         session['session_id'] = session_id
         session.permanent = True  # セッションを永続化
         app.logger.debug(f"Generated new session ID for internal save: {session_id}")
+    return session_id
+
+def _save_ssh_tabs_state(session_id=None):
+    """
+    現在のSSHタブ状態をセッションに保存（内部用）
+
+    Args:
+        session_id: ログインセッションID（接続ワーカーなどリクエストコンテキストの外から
+            呼ぶ場合は事前に取得して渡す）
+    """
+    if session_id is None:
+        session_id = _login_session_id()
     
-    # 現在アクティブなタブ情報を収集
+    # 現在アクティブなタブ情報を収集（このログインセッションのタブのみ）
     tabs_data = []
-    for tab_id, session_info in multitab_ssh_sessions.items():
+    for tab_id, session_info in list(multitab_ssh_sessions.items()):
+        if session_info.get('owner') != session_id:
+            continue
         server_config = session_info.get('server_config', {})
         tabs_data.append({
             'tab_id': tab_id,
@@ -2081,6 +2848,7 @@ def handle_disconnect():
     
     # 既存の単一タブセッションの処理
     if sid in active_ssh_sessions:
+        ssh_reactor.unregister(active_ssh_sessions[sid]['channel'])
         client = active_ssh_sessions[sid]['client']
         client.close()
         del active_ssh_sessions[sid]
@@ -2090,20 +2858,15 @@ def handle_disconnect():
     if sid in ssh_connection_status:
         del ssh_connection_status[sid]
     
-    # マルチタブセッションの処理
-    tabs_to_close = []
-    for tab_id, session_info in multitab_ssh_sessions.items():
-        if session_info['sid'] == sid:
-            tabs_to_close.append(tab_id)
+    # マルチタブセッションの処理（猶予期間内は閉じずに再接続を待つ）
+    tabs_to_detach = [tab_id for tab_id, session_info in list(multitab_ssh_sessions.items())
+                      if session_info['sid'] == sid]
     
-    for tab_id in tabs_to_close:
+    for tab_id in tabs_to_detach:
         try:
-            client = multitab_ssh_sessions[tab_id]['client']
-            client.close()
-            del multitab_ssh_sessions[tab_id]
-            app.logger.debug(f"Multi-tab SSH session closed for tab: {tab_id}")
+            _detach_multitab_ssh_session(tab_id)
         except Exception as e:
-            app.logger.debug(f"Error closing multi-tab SSH session {tab_id}: {e}")
+            app.logger.debug(f"Error detaching multi-tab SSH session {tab_id}: {e}")
 
 # セッション管理API
 @app.route('/api/session-stats')
@@ -2128,7 +2891,7 @@ def manual_session_cleanup():
         'success': True,
         'deleted_count': deleted_count,
         'remaining_count': remaining_count,
-        'message': f'{deleted_count} expired session files deleted, {remaining_count} files remaining'
+        'message': f'{deleted_count} expired sessions deleted, {remaining_count} sessions remaining'
     })
 
 if __name__ == '__main__':
@@ -2136,6 +2899,7 @@ if __name__ == '__main__':
     threading.Thread(target=schedule_extra_import, daemon=True).start()
     
     # Ping monitoring のスケジュール開始
+    start_icmp_prober()
     threading.Thread(target=run_ping_monitoring, daemon=True).start()
     
     # アプリケーション起動
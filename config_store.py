@@ -0,0 +1,454 @@
+"""
+Config Store
+============
+
+servers.yaml / ssh_keys.yaml をプロセス内にキャッシュするモジュール
+
+機能:
+- 各設定ファイルを一度だけパース・正規化してメモリに保持
+- ファイルの mtime / inode / サイズが変わった時だけ再読み込み
+- API経由の書き込み時はキャッシュを直接更新（再パース不要）
+- 呼び出し側には安価な読み取り専用スナップショットを提供
+- id をキーにした O(1) の取得・追加・更新・削除
+- 保存先を YAML ファイルまたは SQLite (WAL) から選択可能
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+from server_registry import ItemRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def _copy_item(item: Dict) -> Dict:
+    """設定項目を変更可能なコピーにする（1階層下の list / dict もコピー）"""
+    copied = {}
+    for key, value in item.items():
+        if isinstance(value, list):
+            copied[key] = list(value)
+        elif isinstance(value, dict):
+            copied[key] = dict(value)
+        else:
+            copied[key] = value
+    return copied
+
+
+def _unique_ids(items: Iterable[Dict], root_key: str) -> List[Dict]:
+    """
+    重複した id の項目に新しい id を割り当てる（2つ目以降。黙って捨てずに警告を残す）
+
+    新しい id は次回の保存時に保存先へ書き込まれる。
+    """
+    seen = set()
+    result = []
+    for item in items:
+        item_id = item.get('id')
+        if item_id in seen:
+            new_id = f"{item_id}-{uuid.uuid4().hex[:12]}" if item_id else uuid.uuid4().hex
+            logger.warning(f"Duplicate id '{item_id}' in {root_key}; assigned new id '{new_id}' "
+                           f"to the entry with host '{item.get('host', '')}'")
+            item = dict(item, id=new_id)
+        seen.add(item.get('id'))
+        result.append(item)
+    return result
+
+
+class YamlBackend:
+    """YAMLファイル1つに全項目を保存するバックエンド（従来の形式）"""
+
+    file_backed = True
+
+    def __init__(self, path: str, root_key: str):
+        self.path = path
+        self.root_key = root_key
+
+    def version(self):
+        """ファイルの変更検出用キー（存在しない場合はNone）"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return yaml.safe_load(f) or {}
+
+    def replace_all(self, config_data: Dict):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            yaml.dump(config_data, f, indent=2, sort_keys=False)
+
+    def apply(self, config_data: Dict, upserts: List[Dict], deletes: List[str]):
+        """YAMLは部分更新できないため文書全体を書き直す"""
+        self.replace_all(config_data)
+
+
+class SqliteBackend:
+    """
+    SQLite (WAL) に項目を1行ずつ保存するバックエンド
+
+    項目は kind ごとに config_items テーブルへJSONで保存し、host / parent_id / tag
+    にはインデックスを張る。初回起動時、既存のYAMLファイルがあれば取り込む。
+    """
+
+    file_backed = False
+
+    def __init__(self, db_path: str, root_key: str, legacy_yaml_path: Optional[str] = None):
+        self.db_path = db_path
+        self.root_key = root_key
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS config_items (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                host TEXT,
+                parent_id TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (kind, id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_config_items_position ON config_items (kind, position);
+            CREATE INDEX IF NOT EXISTS idx_config_items_host ON config_items (kind, host);
+            CREATE INDEX IF NOT EXISTS idx_config_items_parent ON config_items (kind, parent_id);
+            CREATE TABLE IF NOT EXISTS config_item_tags (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (kind, id, tag)
+            );
+            CREATE INDEX IF NOT EXISTS idx_config_item_tags_tag ON config_item_tags (kind, tag);
+            CREATE TABLE IF NOT EXISTS config_meta (
+                kind TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+        ''')
+        if legacy_yaml_path:
+            self._import_legacy_yaml(legacy_yaml_path)
+
+    def _import_legacy_yaml(self, yaml_path: str):
+        """DBにまだ何も無い場合のみ、既存のYAMLファイルを取り込む"""
+        row = self._conn.execute('SELECT 1 FROM config_meta WHERE kind = ?', (self.root_key,)).fetchone()
+        if row is not None:
+            return
+        config_data = YamlBackend(yaml_path, self.root_key).load()
+        items = [i for i in (config_data.get(self.root_key) or []) if isinstance(i, dict)]
+        config_data[self.root_key] = _unique_ids(items, self.root_key)
+        self.replace_all(config_data)
+
+    def version(self):
+        """他の接続（別プロセス含む）による変更でのみ増える値"""
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self) -> Dict:
+        row = self._conn.execute('SELECT data FROM config_meta WHERE kind = ?', (self.root_key,)).fetchone()
+        config_data = json.loads(row[0]) if row else {}
+        config_data[self.root_key] = [
+            json.loads(data) for (data,) in self._conn.execute(
+                'SELECT data FROM config_items WHERE kind = ? ORDER BY position', (self.root_key,))
+        ]
+        return config_data
+
+    def _row(self, item: Dict, position: int):
+        return (self.root_key, str(item.get('id')), position, item.get('host'), item.get('parent_id'),
+                json.dumps(item, ensure_ascii=False, default=str))
+
+    def _write_tags(self, item: Dict):
+        item_id = str(item.get('id'))
+        self._conn.execute('DELETE FROM config_item_tags WHERE kind = ? AND id = ?', (self.root_key, item_id))
+        tags = item.get('tags')
+        if isinstance(tags, list):
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO config_item_tags (kind, id, tag) VALUES (?, ?, ?)',
+                [(self.root_key, item_id, str(tag)) for tag in tags])
+
+    def _write_meta(self, config_data: Dict):
+        extra = {k: v for k, v in config_data.items() if k != self.root_key}
+        self._conn.execute('INSERT OR REPLACE INTO config_meta (kind, data) VALUES (?, ?)',
+                           (self.root_key, json.dumps(extra, ensure_ascii=False, default=str)))
+
+    def replace_all(self, config_data: Dict):
+        items = [i for i in (config_data.get(self.root_key) or []) if isinstance(i, dict)]
+        with self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM config_items WHERE kind = ?', (self.root_key,))
+            self._conn.execute('DELETE FROM config_item_tags WHERE kind = ?', (self.root_key,))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO config_items (kind, id, position, host, parent_id, data) VALUES (?, ?, ?, ?, ?, ?)',
+                [self._row(item, position) for position, item in enumerate(items)])
+            for item in items:
+                self._write_tags(item)
+            self._write_meta(config_data)
+
+    def apply(self, config_data: Dict, upserts: List[Dict], deletes: List[str]):
+        """変更された行だけを1トランザクションで書き込む"""
+        with self._conn:
+            self._conn.execute('BEGIN')
+            for item_id in deletes:
+                self._conn.execute('DELETE FROM config_items WHERE kind = ? AND id = ?', (self.root_key, str(item_id)))
+                self._conn.execute('DELETE FROM config_item_tags WHERE kind = ? AND id = ?', (self.root_key, str(item_id)))
+            for item in upserts:
+                row = self._conn.execute('SELECT position FROM config_items WHERE kind = ? AND id = ?',
+                                         (self.root_key, str(item.get('id')))).fetchone()
+                if row:
+                    position = row[0]
+                else:
+                    (max_position,) = self._conn.execute(
+                        'SELECT MAX(position) FROM config_items WHERE kind = ?', (self.root_key,)).fetchone()
+                    position = -1 if max_position is None else max_position
+                    position += 1
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO config_items (kind, id, position, host, parent_id, data) VALUES (?, ?, ?, ?, ?, ?)',
+                    self._row(item, position))
+                self._write_tags(item)
+
+
+class ConfigStore:
+    """設定ファイル1つ分（servers / ssh_keys）のキャッシュ"""
+
+    def __init__(self, path: str, root_key: str,
+                 normalizer: Optional[Callable[[Dict], None]] = None,
+                 on_save: Optional[Callable[..., None]] = None,
+                 registry_class=ItemRegistry,
+                 backend=None):
+        """
+        ConfigStoreを初期化
+
+        Args:
+            path: YAMLファイルのパス
+            root_key: 項目リストを保持するトップレベルキー（例: "servers"）
+            normalizer: 各項目をその場で正規化する関数
+            on_save: 保存後に呼ばれるフック（バックアップ作成など）。
+                YAMLバックエンドでは毎回 on_save(path) 、SQLiteバックエンドでは
+                文書全体の保存時のみ on_save(path, config_data) が呼ばれる
+            registry_class: 項目を保持するレジストリのクラス
+            backend: 保存先バックエンド（省略時は path の YamlBackend）
+        """
+        self.path = path
+        self.root_key = root_key
+        self.normalizer = normalizer
+        self.on_save = on_save
+        self.registry_class = registry_class
+        self.backend = backend or YamlBackend(path, root_key)
+        self._lock = threading.RLock()
+        self._version = None
+        self._registry = registry_class()
+        self._snapshot: Optional[Tuple[Dict, ...]] = None
+        self._extra: Dict = {}
+        self._loaded = False
+
+    def _prepare(self, item: Dict) -> Dict:
+        item = _copy_item(item)
+        if self.normalizer:
+            self.normalizer(item)
+        return item
+
+    def _set_cache(self, config_data: Dict, version):
+        items = config_data.get(self.root_key) or []
+        self._registry = self.registry_class(
+            _unique_ids((self._prepare(i) for i in items if isinstance(i, dict)), self.root_key))
+        self._snapshot = None
+        self._extra = {k: v for k, v in config_data.items() if k != self.root_key}
+        self._version = version
+        self._loaded = True
+
+    def _refresh(self):
+        """保存先が変更されていればキャッシュを再構築（ロック保持中に呼ぶこと）"""
+        version = self.backend.version()
+        if self._loaded and version == self._version:
+            return
+        self._set_cache(self.backend.load(), version)
+
+    def _document(self) -> Dict:
+        config_data = dict(self._extra)
+        config_data[self.root_key] = self._registry.items()
+        return config_data
+
+    def _commit(self, upserts: List[Dict] = (), deletes: List[str] = ()):
+        """キャッシュの変更分を保存先に書き込む（ロック保持中に呼ぶこと）"""
+        try:
+            self.backend.apply(self._document(), list(upserts), list(deletes))
+        except Exception:
+            self.invalidate()
+            raise
+        self._snapshot = None
+        self._version = self.backend.version()
+        if self.on_save and self.backend.file_backed:
+            self.on_save(self.path)
+
+    def snapshot(self) -> Tuple[Dict, ...]:
+        """
+        現在の項目一覧を読み取り専用で取得
+
+        返される辞書はキャッシュと共有されているため、呼び出し側で変更しないこと。
+        変更が必要な場合は load() を使う。
+        """
+        with self._lock:
+            self._refresh()
+            if self._snapshot is None:
+                self._snapshot = tuple(self._registry)
+            return self._snapshot
+
+    def registry(self):
+        """インデックス付きレジストリを読み取り専用で取得"""
+        with self._lock:
+            self._refresh()
+            return self._registry
+
+    def get(self, item_id) -> Optional[Dict]:
+        """idで項目を取得（読み取り専用）"""
+        with self._lock:
+            self._refresh()
+            return self._registry.get(item_id)
+
+    def load(self) -> Dict:
+        """従来の load_*_config() と同じ形式の、変更可能なコピーを取得"""
+        items = self.snapshot()
+        with self._lock:
+            config = dict(self._extra)
+        config[self.root_key] = [_copy_item(item) for item in items]
+        return config
+
+    def save(self, config_data: Dict):
+        """設定全体を保存し、キャッシュも更新"""
+        with self._lock:
+            try:
+                self.backend.replace_all(config_data)
+            except Exception:
+                self.invalidate()
+                raise
+            self._set_cache(config_data, self.backend.version())
+        if self.on_save:
+            if self.backend.file_backed:
+                self.on_save(self.path)
+            else:
+                self.on_save(self.path, config_data)
+
+    def add(self, item: Dict) -> Optional[Dict]:
+        """項目を追加して保存（同じidが既に存在する場合はNone）"""
+        with self._lock:
+            self._refresh()
+            item = self._prepare(item)
+            if not self._registry.add(item):
+                return None
+            self._commit(upserts=[item])
+            return item
+
+    def update(self, item_id, changes: Dict, remove_keys: Iterable[str] = ()) -> Optional[Dict]:
+        """
+        項目に変更をマージして保存
+
+        Args:
+            item_id: 対象項目のid
+            changes: 上書きするフィールド
+            remove_keys: 削除するフィールド
+
+        Returns:
+            更新後の項目（見つからない場合はNone）
+        """
+        with self._lock:
+            self._refresh()
+            current = self._registry.get(item_id)
+            if current is None:
+                return None
+            updated = {**current, **changes}
+            for key in remove_keys:
+                updated.pop(key, None)
+            updated['id'] = item_id
+            updated = self._prepare(updated)
+            self._registry.replace(updated)
+            self._commit(upserts=[updated])
+            return updated
+
+    def delete(self, item_ids: Iterable, predicate: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+        """
+        項目を削除して保存
+
+        Args:
+            item_ids: 削除する項目のid
+            predicate: 指定した場合、Trueを返す項目のみ削除
+
+        Returns:
+            削除された項目のリスト
+        """
+        with self._lock:
+            self._refresh()
+            removed = []
+            for item_id in dict.fromkeys(item_ids):
+                item = self._registry.get(item_id)
+                if item is None or (predicate and not predicate(item)):
+                    continue
+                removed.append(self._registry.remove(item_id))
+            if removed:
+                self._commit(deletes=[item['id'] for item in removed])
+            return removed
+
+    def apply_changes(self, upserts: Iterable[Dict] = (), deletes: Iterable = ()) -> int:
+        """
+        複数項目の追加・置き換え・削除を1回の保存にまとめる
+
+        変更がない場合は保存もバックアップも行わない。
+
+        Args:
+            upserts: 追加または同じidの項目と置き換える項目（同じidを2回含めてはならない）
+            deletes: 削除する項目のid
+
+        Returns:
+            変更した項目数
+
+        Raises:
+            ValueError: upserts に同じidの項目が複数ある（後の項目で前の項目を上書きしない）
+        """
+        upserts = [self._prepare(item) for item in upserts]
+        ids = [item.get('id') for item in upserts]
+        if len(set(ids)) != len(ids):
+            duplicates = sorted({str(item_id) for item_id in ids if ids.count(item_id) > 1})
+            raise ValueError(f"Duplicate ids in one batch: {', '.join(duplicates)}")
+        with self._lock:
+            self._refresh()
+            written = []
+            for item in upserts:
+                if self._registry.replace(item) is None:
+                    self._registry.add(item)
+                written.append(item)
+            removed = [self._registry.remove(item_id) for item_id in dict.fromkeys(deletes)
+                       if item_id in self._registry]
+            if written or removed:
+                self._commit(upserts=written, deletes=[item['id'] for item in removed])
+            return len(written) + len(removed)
+
+    def invalidate(self):
+        """次回アクセス時に保存先から再読み込みさせる"""
+        with self._lock:
+            self._loaded = False
+            self._version = None
+
+
+def create_backend(kind: str, yaml_path: str, root_key: str, db_path: str):
+    """
+    設定名からバックエンドを生成
+
+    Args:
+        kind: "yaml" または "sqlite"
+        yaml_path: YAMLファイルのパス（sqlite の場合は初回取り込み元）
+        root_key: 項目リストのトップレベルキー
+        db_path: SQLiteデータベースのパス
+    """
+    if kind == 'sqlite':
+        return SqliteBackend(db_path, root_key, legacy_yaml_path=yaml_path)
+    if kind == 'yaml':
+        return YamlBackend(yaml_path, root_key)
+    raise ValueError(f"Unknown config storage backend: {kind}")
@@ -0,0 +1,298 @@
+"""
+DNS Cache
+=========
+
+ホスト名の名前解決結果をTTL付きでキャッシュするモジュール
+
+機能:
+- 解決結果のTTL付きキャッシュ（解決できなかった名前は短いTTLで否定キャッシュ）
+- 同じ名前の解決が進行中の場合はその結果を待って共有（同時に多数の問い合わせを送らない）
+- スレッドプールでの複数の名前の並列解決と、期限切れが近いエントリの先行更新
+- socket.getaddrinfo と同じ形式で結果を返す関数（TcpProber などにそのまま渡せる）
+- キャッシュしたアドレスに接続するソケットの作成（SSH接続用）
+- ヒット率と名前解決にかかった時間の統計
+
+IPアドレスのリテラルはキャッシュせずにそのまま返す。キャッシュするのはアドレスのみで、
+ポートとソケット種別は呼び出しごとに組み立てる。
+"""
+
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (アドレスファミリー, ポートを除いた sockaddr の残り) のリスト
+_Addresses = List[Tuple[int, Tuple]]
+
+
+class _Entry:
+    __slots__ = ('addresses', 'error', 'expires')
+
+    def __init__(self, addresses: _Addresses, error: Optional[str], expires: float):
+        self.addresses = addresses
+        self.error = error  # 否定キャッシュの場合は解決エラーのメッセージ
+        self.expires = expires
+
+
+def _literal(host: str) -> Optional[_Addresses]:
+    """IPアドレスのリテラルであればそのアドレスを返す"""
+    try:
+        address = ipaddress.ip_address(host.split('%', 1)[0])
+    except ValueError:
+        return None
+    if address.version == 4:
+        return [(socket.AF_INET, (host,))]
+    return [(socket.AF_INET6, (host, 0, 0))]
+
+
+class DnsCache:
+    """TTLと否定キャッシュ付きの名前解決キャッシュ"""
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 30.0, workers: int = 16,
+                 max_entries: int = 10000, refresh_ahead: float = 0.2,
+                 getaddrinfo: Callable = socket.getaddrinfo):
+        """
+        DnsCacheを初期化
+
+        Args:
+            ttl: 解決できた名前のキャッシュ期間（秒）
+            negative_ttl: 解決できなかった名前のキャッシュ期間（秒）
+            workers: 並列解決を行うスレッド数
+            max_entries: キャッシュする名前の最大数（超えた分は最も古く参照されたものから捨てる）
+            refresh_ahead: prefetch() で先行して更新する、残りキャッシュ期間の ttl に対する割合
+            getaddrinfo: 実際の名前解決に使う関数
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max(1, int(max_entries))
+        self.refresh_ahead = refresh_ahead
+        self._getaddrinfo = getaddrinfo
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='dns-resolve')
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._pending: Dict[str, Future] = {}  # 名前 -> 解決中の結果
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = 0
+        self._negative_hits = 0
+        self._shared = 0  # 進行中の解決の結果を待って共有した回数
+        self._resolutions = 0
+        self._failures = 0
+        self._latencies = deque(maxlen=1024)  # 直近の名前解決の所要時間（ミリ秒）
+
+    def lookup(self, host: str) -> _Addresses:
+        """
+        名前のアドレス一覧を返す（キャッシュになければ解決する）
+
+        Raises:
+            socket.gaierror: 名前を解決できない（否定キャッシュされている場合を含む）
+        """
+        literal = _literal(host)
+        if literal is not None:
+            return literal
+        future, owner = self._cached_or_pending(host)
+        if owner:
+            self._resolve(host, future)
+        return future.result()
+
+    def _cached_or_pending(self, host: str) -> Tuple[Future, bool]:
+        """
+        キャッシュされた結果か進行中の解決の Future と、呼び出し元が解決を担当するかを返す
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._lookups += 1
+            entry = self._entries.get(host)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(host)
+                self._hits += 1
+                future = Future()
+                if entry.error is not None:
+                    self._negative_hits += 1
+                    future.set_exception(socket.gaierror(socket.EAI_NONAME, entry.error))
+                else:
+                    future.set_result(entry.addresses)
+                return future, False
+            future = self._pending.get(host)
+            if future is not None:
+                self._shared += 1
+                return future, False
+            future = self._pending[host] = Future()
+            return future, True
+
+    def _resolve(self, host: str, future: Future):
+        started = time.monotonic()
+        addresses: _Addresses = []
+        error = None
+        try:
+            for family, _type, _proto, _canonname, sockaddr in self._getaddrinfo(
+                    host, None, socket.AF_UNSPEC, socket.SOCK_STREAM):
+                address = (family, (sockaddr[0],) + tuple(sockaddr[2:]))
+                if address not in addresses:
+                    addresses.append(address)
+            if not addresses:
+                error = f"No address found for {host}"
+        except socket.gaierror as e:
+            error = e.strerror or str(e)
+        except UnicodeError as e:
+            error = str(e)
+        except Exception as e:
+            # 想定外のエラーはキャッシュせず、待っている呼び出し元にそのまま渡す
+            with self._lock:
+                self._pending.pop(host, None)
+            future.set_exception(e)
+            return
+        finished = time.monotonic()
+        with self._lock:
+            self._resolutions += 1
+            self._latencies.append((finished - started) * 1000.0)
+            if error is not None:
+                self._failures += 1
+                logger.debug(f"Could not resolve {host}: {error}")
+            ttl = self.negative_ttl if error is not None else self.ttl
+            self._entries[host] = _Entry(addresses, error, finished + ttl)
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._pending.pop(host, None)
+        if error is not None:
+            future.set_exception(socket.gaierror(socket.EAI_NONAME, error))
+        else:
+            future.set_result(addresses)
+
+    def resolve(self, host: str, family: int = socket.AF_UNSPEC) -> str:
+        """
+        名前を1つのIPアドレスに解決
+
+        Args:
+            family: 求めるアドレスファミリー（AF_UNSPEC の場合は最初に得られたもの）
+
+        Raises:
+            socket.gaierror: 名前を解決できない、または指定したファミリーのアドレスがない
+        """
+        for address_family, address in self.lookup(host):
+            if family in (socket.AF_UNSPEC, address_family):
+                return address[0]
+        raise socket.gaierror(socket.EAI_NONAME, f"No address of the requested family for {host}")
+
+    def getaddrinfo(self, host: str, port, family: int = 0, type: int = 0, proto: int = 0, flags: int = 0) -> List[Tuple]:
+        """socket.getaddrinfo と同じ形式で、キャッシュしたアドレスを返す"""
+        port = int(port or 0)
+        results = []
+        for address_family, address in self.lookup(host):
+            if family not in (0, address_family):
+                continue
+            sockaddr = (address[0], port) + address[1:]
+            results.append((address_family, type or socket.SOCK_STREAM, proto, '', sockaddr))
+        if not results:
+            raise socket.gaierror(socket.EAI_NONAME, f"No address of the requested family for {host}")
+        return results
+
+    def create_connection(self, host: str, port: int, timeout: Optional[float] = None) -> socket.socket:
+        """
+        キャッシュしたアドレスに順に接続し、最初に接続できたソケットを返す
+
+        Raises:
+            socket.gaierror: 名前を解決できない
+            OSError: すべてのアドレスへの接続に失敗
+        """
+        last_error = None
+        for family, type_, proto, _canonname, sockaddr in self.getaddrinfo(host, port):
+            sock = socket.socket(family, type_, proto)
+            try:
+                sock.settimeout(timeout)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                sock.close()
+                last_error = e
+        raise last_error
+
+    def resolve_many(self, hosts: Iterable[str]) -> Dict[str, Optional[List[str]]]:
+        """
+        複数の名前をスレッドプールで並列に解決
+
+        Returns:
+            名前 -> IPアドレスのリスト（解決できなかった名前は None）
+        """
+        futures = {}
+        for host in dict.fromkeys(hosts):
+            if not host:
+                continue
+            literal = _literal(host)
+            if literal is not None:
+                futures[host] = Future()
+                futures[host].set_result(literal)
+                continue
+            future, owner = self._cached_or_pending(host)
+            if owner:
+                self._executor.submit(self._resolve, host, future)
+            futures[host] = future
+        results = {}
+        for host, future in futures.items():
+            try:
+                results[host] = [address[0] for _family, address in future.result()]
+            except (socket.gaierror, UnicodeError):
+                results[host] = None
+            except Exception as e:
+                logger.error(f"Error resolving {host}: {e}")
+                results[host] = None
+        return results
+
+    def prefetch(self, hosts: Iterable[str]):
+        """
+        キャッシュにない名前と期限切れが近い名前をバックグラウンドで解決（完了を待たない）
+
+        監視対象などを定期的に渡しておくと、プローブや接続が名前解決を待たずに済む。
+        """
+        now = time.monotonic()
+        margin = self.ttl * self.refresh_ahead
+        submit = []
+        with self._lock:
+            for host in dict.fromkeys(hosts):
+                if not host or host in self._pending or _literal(host) is not None:
+                    continue
+                entry = self._entries.get(host)
+                if entry is not None and entry.expires - now > (margin if entry.error is None else 0):
+                    continue
+                future = self._pending[host] = Future()
+                submit.append((host, future))
+        for host, future in submit:
+            self._executor.submit(self._resolve, host, future)
+
+    def invalidate(self, host: Optional[str] = None):
+        """キャッシュを捨てる（host が None の場合はすべて）"""
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(host, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            latencies = sorted(self._latencies)
+            lookups = self._lookups
+            return {
+                'entries': len(self._entries),
+                'negative_entries': sum(1 for entry in self._entries.values()
+                                        if entry.error is not None and entry.expires > now),
+                'lookups': lookups,
+                'hits': self._hits,
+                'negative_hits': self._negative_hits,
+                'shared': self._shared,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+                'resolutions': self._resolutions,
+                'failures': self._failures,
+                'in_flight': len(self._pending),
+                'latency_ms': {
+                    'avg': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                    'max': round(latencies[-1], 3) if latencies else None,
+                },
+            }
@@ -0,0 +1,610 @@
+"""
+Extra Import
+============
+
+外部のホスト一覧をサーバー設定に取り込むためのモジュール
+
+機能:
+- 複数の取り込み元（HTTP(S) / ローカルファイル）と、取り込み元ごとの間隔・パーサー・タイムアウト
+- パーサー: 1行1ホスト（lines）/ DNSゾーンのエクスポート（zone）/ CSV（csv）/ JSON（json）
+- 条件付きリクエスト（If-None-Match / If-Modified-Since）による取得（304 の場合は一覧を返さない）
+- レスポンスを受け取りながら1行ずつパース（本文全体を文字列として保持しない）
+- 取り込み元ごとの次回取得時刻のヒープによるスケジューリングと、ワーカープールでの並行取得
+  （遅い取り込み元が他の取り込み元の取得や反映を待たせない）
+- 現在のサーバー一覧との集合演算による差分（追加するホストと、フラグや取り込み元が変わる既存サーバーだけを求める）
+
+差分が空であれば呼び出し側は保存しないため、一覧が変わらない限り設定ファイルの書き込みや
+バックアップは発生しない。取り込んだサーバーには取り込み元のIDを extra_source として記録する
+（extra_source のないサーバーは従来の単一URL（DEFAULT_SOURCE_ID）から取り込んだものとして扱う）。
+"""
+
+import csv
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SOURCE_ID = 'default'  # extra_import.yaml の url（従来の単一URL）の取り込み元ID
+
+
+class ImportSource(NamedTuple):
+    """取り込み元（URLやパーサーが変わった場合は別の取り込み元として扱う）"""
+    id: str
+    url: str  # http(s):// / file:// / ローカルファイルの絶対パス
+    parser: str = 'lines'
+    interval: float = 300  # 取得間隔（秒）
+    timeout: float = 10  # 取得全体のタイムアウト（秒）
+
+
+def parse_host_line(line: str) -> Optional[str]:
+    """1行からホスト名を取り出す（行頭の語を採用し、末尾のドットは取り除く。空行は None）"""
+    fields = line.split()
+    if not fields:
+        return None
+    host = fields[0]
+    if host.endswith('.'):
+        host = host[:-1]
+    return host or None
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[str]:
+    """1行1ホスト（行頭の語のみ使用）"""
+    for line in lines:
+        host = parse_host_line(line)
+        if host:
+            yield host
+
+
+_ZONE_CLASSES = {'IN', 'CH', 'HS', 'CS'}
+_ZONE_HOST_TYPES = {'A', 'AAAA', 'CNAME'}
+_ZONE_TTL = re.compile(r'^\d[\dsmhdw]*$', re.IGNORECASE)
+
+
+def parse_zone(lines: Iterable[str]) -> Iterator[str]:
+    """
+    DNSゾーンのエクスポート（BIND形式）から A / AAAA / CNAME レコードの名前を取り出す
+
+    $ORIGIN による相対名の補完、所有者名を省略した継続行、括弧で複数行にわたるレコード
+    （SOA など）に対応する。ワイルドカードと @ のみのレコードは取り込まない。
+    """
+    origin = ''
+    owner = None
+    depth = 0  # 閉じていない括弧の数
+    for line in lines:
+        line = line.split(';', 1)[0]
+        if depth:
+            depth = max(0, depth + line.count('(') - line.count(')'))
+            continue
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0].startswith('$'):
+            if fields[0].upper() == '$ORIGIN' and len(fields) > 1:
+                origin = fields[1].rstrip('.')
+            continue
+        if line[0].isspace():
+            name = owner
+        else:
+            name, fields = fields[0], fields[1:]
+            owner = name
+        depth = max(0, line.count('(') - line.count(')'))
+        record_type = next((f.upper() for f in fields
+                            if f.upper() not in _ZONE_CLASSES and not _ZONE_TTL.match(f)), None)
+        if name is None or name == '@' or name.startswith('*') or record_type not in _ZONE_HOST_TYPES:
+            continue
+        if name.endswith('.'):
+            yield name[:-1]
+        elif origin:
+            yield f"{name}.{origin}"
+        else:
+            yield name
+
+
+_CSV_HOST_COLUMNS = ('host', 'hostname', 'fqdn', 'name')
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[str]:
+    """CSV（host / hostname / fqdn / name 列、該当する見出しがなければ1列目）"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    index = next((columns.index(name) for name in _CSV_HOST_COLUMNS if name in columns), None)
+    rows = reader
+    if index is None:
+        # 見出し行がないので1行目もデータとして扱う
+        index = 0
+        rows = itertools.chain([header], reader)
+    for row in rows:
+        if len(row) > index:
+            host = parse_host_line(row[index])
+            if host:
+                yield host
+
+
+def parse_json(lines: Iterable[str]) -> Iterator[str]:
+    """JSON（ホスト名またはオブジェクトの配列、または {"hosts": [...]}）。本文全体を読み込んでからパースする"""
+    data = json.loads('\n'.join(lines) or 'null')
+    if isinstance(data, dict):
+        data = data.get('hosts') or data.get('servers') or []
+    if not isinstance(data, list):
+        raise ValueError("JSON host list must be an array or an object with 'hosts'")
+    for entry in data:
+        if isinstance(entry, dict):
+            entry = next((entry[key] for key in _CSV_HOST_COLUMNS if entry.get(key)), None)
+        if isinstance(entry, str):
+            host = parse_host_line(entry)
+            if host:
+                yield host
+
+
+PARSERS: Dict[str, Callable[[Iterable[str]], Iterator[str]]] = {
+    'lines': parse_lines,
+    'zone': parse_zone,
+    'csv': parse_csv,
+    'json': parse_json,
+}
+
+
+def load_sources(config: Dict, default_interval: float = 300, default_timeout: float = 10) -> List[ImportSource]:
+    """
+    extra_import.yaml の内容から取り込み元の一覧を作成
+
+    url（従来の単一URL）は DEFAULT_SOURCE_ID の取り込み元として先頭に置き、sources の各要素
+    （id / url / parser / interval / timeout）を続ける。url のない要素・未知のパーサー・
+    重複したIDは警告して無視する。
+
+    url はAPIから設定できるため http(s) のみ受け付け、ローカルファイル（file:// または
+    絶対パス）の取り込み元は extra_import.yaml の sources にのみ書ける。
+    """
+    sources = []
+    seen = set()
+    entries = []
+    if config.get('url'):
+        entries.append({'id': DEFAULT_SOURCE_ID, 'url': config['url'], 'http_only': True})
+    entries.extend(entry for entry in config.get('sources') or [] if isinstance(entry, dict))
+    for entry in entries:
+        url = str(entry.get('url') or entry.get('path') or '').strip()
+        source_id = str(entry.get('id') or url)
+        parser = entry.get('parser') or 'lines'
+        if not url:
+            logger.warning(f"Extra import source {source_id!r} has no url. Ignored.")
+            continue
+        if entry.get('http_only') and not is_http_url(url):
+            logger.warning(f"Extra import url {url!r} is not an http(s) URL. Ignored.")
+            continue
+        if parser not in PARSERS:
+            logger.warning(f"Extra import source {source_id!r} has unknown parser {parser!r}. Ignored.")
+            continue
+        if source_id in seen:
+            logger.warning(f"Duplicate extra import source id {source_id!r}. Ignored.")
+            continue
+        try:
+            interval = float(entry.get('interval') or default_interval)
+            timeout = float(entry.get('timeout') or default_timeout)
+        except (TypeError, ValueError):
+            logger.warning(f"Extra import source {source_id!r} has invalid interval or timeout. Ignored.")
+            continue
+        seen.add(source_id)
+        sources.append(ImportSource(source_id, url, parser, max(1.0, interval), max(0.1, timeout)))
+    return sources
+
+
+def is_http_url(url: str) -> bool:
+    """http:// または https:// のURLか"""
+    parts = urlparse(url)
+    return parts.scheme in ('http', 'https') and bool(parts.netloc)
+
+
+def _local_path(url: str) -> Optional[str]:
+    """ローカルファイルの取り込み元であればそのパスを返す"""
+    if url.startswith('file://'):
+        return unquote(urlparse(url).path)
+    if os.path.isabs(url):
+        return url
+    return None
+
+
+def _until(lines: Iterable[str], deadline: float, url: str) -> Iterator[str]:
+    """取得全体の期限を過ぎたら中断する（requests の timeout は1回の読み取りごとの待ち時間のため）"""
+    for line in lines:
+        if time.monotonic() > deadline:
+            raise requests.Timeout(f"Reading {url} took longer than the source timeout")
+        yield line
+
+
+class HostListFetcher:
+    """取り込み元ごとの検証子（ETag / Last-Modified）を保持し、ホスト一覧を条件付きで取得する"""
+
+    def __init__(self, get: Callable[..., requests.Response] = requests.get):
+        """
+        HostListFetcherを初期化
+
+        Args:
+            get: requests.get と同じ引数を受け取る関数（HttpClient.get など）
+        """
+        self._get = get
+        self._validators: Dict[str, Dict[str, str]] = {}  # 取り込み元のキー -> 前回のレスポンスの検証子
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str, timeout: float = 10, conditional: bool = True, parser: str = 'lines',
+              key: Optional[str] = None) -> Optional[Dict[str, None]]:
+        """
+        ホスト一覧を取得
+
+        Args:
+            url: 取得先（http(s):// / file:// / ローカルファイルの絶対パス）
+            timeout: 取得全体のタイムアウト（秒）
+            conditional: 前回の検証子を送り、変更がなければ取得を省略する
+            parser: PARSERS のパーサー名
+            key: 検証子を保持するキー（省略時は url。同じURLを別のパーサーで読む取り込み元を区別する）
+
+        Returns:
+            順序を保った重複なしのホスト名（辞書のキーを順序付き集合として使用）。
+            前回から変更がない（304、ローカルファイルでは mtime とサイズが同じ）場合は None
+
+        Raises:
+            requests.RequestException / OSError / ValueError: 取得またはパースに失敗
+                （この場合は検証子を更新しない）
+        """
+        key = key or url
+        parse = PARSERS[parser]
+        with self._lock:
+            previous = self._validators.get(key) if conditional else None
+        path = _local_path(url)
+        if path is not None:
+            hosts, validators = self._fetch_file(path, previous, parse)
+        else:
+            hosts, validators = self._fetch_http(url, timeout, previous, parse)
+        if hosts is None:
+            logger.debug(f"Host list at {url} not modified")
+            return None
+
+        # 本文を最後まで読めた場合だけ検証子を更新する（途中で失敗した一覧を 304 で固定しない）
+        with self._lock:
+            if any(validators.values()):
+                self._validators[key] = validators
+            else:
+                self._validators.pop(key, None)
+        return hosts
+
+    def _fetch_http(self, url: str, timeout: float, previous: Optional[Dict], parse):
+        headers = {}
+        if previous:
+            if previous.get('etag'):
+                headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                headers['If-Modified-Since'] = previous['last_modified']
+        deadline = time.monotonic() + timeout
+        with self._get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                return None, previous
+            response.raise_for_status()
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            lines = _until(response.iter_lines(decode_unicode=True), deadline, url)
+            hosts = dict.fromkeys(parse(lines))
+            return hosts, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+
+    def _fetch_file(self, path: str, previous: Optional[Dict], parse):
+        st = os.stat(path)
+        validators = {'file': (st.st_mtime_ns, st.st_ino, st.st_size)}
+        if previous and previous.get('file') == validators['file']:
+            return None, previous
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            hosts = dict.fromkeys(parse(line.rstrip('\r\n') for line in f))
+        return hosts, validators
+
+    def forget(self, key: Optional[str] = None):
+        """検証子を破棄し、次回は一覧全体を取得させる（key が None の場合はすべて）"""
+        with self._lock:
+            if key is None:
+                self._validators.clear()
+            else:
+                self._validators.pop(key, None)
+
+
+class _SourceState:
+    __slots__ = ('source', 'due', 'generation', 'in_flight', 'force', 'hosts',
+                 'last_fetch', 'last_status', 'last_error', 'duration')
+
+    def __init__(self, source: ImportSource, due: float):
+        self.source = source
+        self.due = due
+        self.generation = 0
+        self.in_flight = False
+        self.force = False  # 次回は検証子を送らずに一覧全体を取得する
+        self.hosts: Optional[Dict[str, None]] = None  # 最後に取得できたホスト一覧（未取得は None）
+        self.last_fetch: Optional[float] = None  # time.time()
+        self.last_status: Optional[str] = None  # 'updated' / 'not_modified' / 'error'
+        self.last_error: Optional[str] = None
+        self.duration: Optional[float] = None
+
+
+class ExtraImportScheduler:
+    """次回取得時刻のヒープで取り込み元ごとに取得を発行し、結果の反映をまとめて依頼するスケジューラー"""
+
+    def __init__(self, fetcher: HostListFetcher, on_update: Callable[[], None],
+                 load_sources: Optional[Callable[[], List[ImportSource]]] = None,
+                 workers: int = 8, reload_interval: float = 60, merge_delay: float = 0.5):
+        """
+        ExtraImportSchedulerを初期化
+
+        Args:
+            fetcher: 取得に使う HostListFetcher
+            on_update: 取得結果が変わった時に呼ばれる関数（results() を読んで反映する）。
+                merge_delay 以内に完了した取得はまとめて1回の呼び出しになる
+            load_sources: 取り込み元の一覧を返す関数（reload_interval ごとに呼んで設定の変更を反映する）
+            workers: 同時に取得する取り込み元の最大数
+            reload_interval: load_sources を呼ぶ間隔（秒）
+            merge_delay: 取得の完了から on_update を呼ぶまでの待ち時間（秒）
+        """
+        self.fetcher = fetcher
+        self.on_update = on_update
+        self.load_sources = load_sources
+        self.reload_interval = reload_interval
+        self.merge_delay = merge_delay
+        self._states: Dict[str, _SourceState] = {}  # 設定順を保持する
+        # (due, 連番, 取り込み元ID, generation)。古い世代のエントリは取り出し時に捨てる
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='extra-import')
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._next_reload = 0.0
+        self._merge_timer: Optional[threading.Timer] = None
+
+    def _push(self, state: _SourceState):
+        state.generation += 1
+        heapq.heappush(self._heap, (state.due, next(self._counter), state.source.id, state.generation))
+
+    def sync(self, sources: Iterable[ImportSource]):
+        """
+        取り込み元の一覧を更新（追加・変更された取り込み元は即時取得、消えた取り込み元は結果を破棄）
+        """
+        now = time.monotonic()
+        removed = False
+        with self._cond:
+            previous = self._states
+            self._states = {}
+            for source in sources:
+                state = previous.pop(source.id, None)
+                if state is None or state.source != source:
+                    if state is not None:
+                        # URLやパーサーが変わったので前回の結果と検証子は使わない
+                        self.fetcher.forget(source.id)
+                        removed = removed or state.hosts is not None
+                    state = _SourceState(source, now)
+                    self._push(state)
+                self._states[source.id] = state
+            for state in previous.values():
+                self.fetcher.forget(state.source.id)
+                removed = True
+            self._cond.notify()
+        if removed:
+            self._schedule_merge()
+
+    def refresh(self, force: bool = False):
+        """
+        すべての取り込み元を即時取得する（force の場合は検証子を送らない）
+
+        定期取得（start()）を開始していなくても取得と反映は行われる。
+        """
+        with self._cond:
+            due_states = []
+            for state in self._states.values():
+                state.force = state.force or force
+                if not state.in_flight:
+                    state.in_flight = True
+                    due_states.append(state)
+        for state in due_states:
+            self._executor.submit(self._fetch, state)
+
+    def sources(self) -> List[ImportSource]:
+        """設定されている取り込み元（設定順）"""
+        with self._cond:
+            return [state.source for state in self._states.values()]
+
+    def results(self) -> Dict[str, Dict[str, None]]:
+        """取り込み元ID -> 最後に取得できたホスト一覧（一度も取得できていない取り込み元は含まない）"""
+        with self._cond:
+            return {source_id: state.hosts for source_id, state in self._states.items() if state.hosts is not None}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='extra-import-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _reload(self, now: float):
+        if self.load_sources is None or now < self._next_reload:
+            return
+        self._next_reload = now + self.reload_interval
+        try:
+            sources = self.load_sources()
+        except Exception as e:
+            logger.error(f"Could not load extra import sources: {e}")
+            return
+        self.sync(sources)
+
+    def _run(self):
+        while True:
+            self._reload(time.monotonic())
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due_states = []
+                while self._heap and self._heap[0][0] <= now:
+                    _due, _count, source_id, generation = heapq.heappop(self._heap)
+                    state = self._states.get(source_id)
+                    if state is None or state.generation != generation or state.in_flight:
+                        continue
+                    state.in_flight = True
+                    due_states.append(state)
+                if not due_states:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    if self.load_sources is not None:
+                        reload_in = max(0.0, self._next_reload - now)
+                        timeout = reload_in if timeout is None else min(timeout, reload_in)
+                    self._cond.wait(timeout)
+                    continue
+            for state in due_states:
+                self._executor.submit(self._fetch, state)
+
+    def _fetch(self, state: _SourceState):
+        source = state.source
+        with self._cond:
+            force, state.force = state.force, False
+        started = time.monotonic()
+        hosts = None
+        error = None
+        try:
+            hosts = self.fetcher.fetch(source.url, timeout=source.timeout, conditional=not force,
+                                       parser=source.parser, key=source.id)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            logger.error(f"Error fetching extra import source {source.id}: {error}")
+        finished = time.monotonic()
+        with self._cond:
+            state.in_flight = False
+            state.last_fetch = time.time()
+            state.duration = round(finished - started, 3)
+            state.last_error = error
+            state.last_status = 'error' if error else ('not_modified' if hosts is None else 'updated')
+            current = self._states.get(source.id) is state
+            updated = current and hosts is not None and hosts != state.hosts
+            if hosts is not None:
+                state.hosts = hosts
+            if current:
+                state.due = finished + source.interval
+                self._push(state)
+                self._cond.notify()
+        if updated:
+            self._schedule_merge()
+
+    def _schedule_merge(self):
+        """直後に完了する取得とまとめて反映するため、少し待ってから on_update を呼ぶ"""
+        with self._cond:
+            if self._merge_timer is not None:
+                return
+            self._merge_timer = threading.Timer(self.merge_delay, self._merge)
+            self._merge_timer.daemon = True
+            self._merge_timer.start()
+
+    def _merge(self):
+        with self._cond:
+            self._merge_timer = None
+        try:
+            self.on_update()
+        except Exception as e:
+            logger.error(f"Error merging extra import results: {e}")
+
+    def stats(self) -> List[Dict]:
+        """取り込み元ごとの状態"""
+        with self._cond:
+            return [{
+                'id': state.source.id,
+                'url': state.source.url,
+                'parser': state.source.parser,
+                'interval': state.source.interval,
+                'timeout': state.source.timeout,
+                'hosts': None if state.hosts is None else len(state.hosts),
+                'in_flight': state.in_flight,
+                'last_fetch': state.last_fetch,
+                'last_status': state.last_status,
+                'last_error': state.last_error,
+                'duration': state.duration,
+            } for state in self._states.values()]
+
+
+def merge_extra_sources(servers: Iterable[Dict], results: Dict[str, Dict[str, None]], configured: List[str],
+                        reset: Set[str] = frozenset()) -> Tuple[List[Tuple[str, str]], List[Dict]]:
+    """
+    全取り込み元の最新のホスト一覧と現在のサーバー一覧の差分を求める
+
+    一度も取得できていない取り込み元のサーバーは変更しない（取得に失敗した取り込み元の
+    サーバーを削除扱いにしない）。複数の取り込み元に含まれるホストは設定順で先の取り込み元に
+    属するものとし、元の取り込み元から消えたホストが他の取り込み元に残っていれば取り込み元を付け替える。
+    設定から外された取り込み元のサーバーは、取り込み元が1つもない場合と同様に通常のサーバーに戻す。
+
+    Args:
+        servers: 現在のサーバー一覧（読み取り専用のスナップショットでよい）
+        results: 取り込み元ID -> ホスト一覧（一度も取得できていない取り込み元は含めない）
+        configured: 設定されている取り込み元ID（設定順）
+        reset: 取り込み元のURLが変わったため、取り込み済みサーバーの is_new / is_deleted を戻す取り込み元ID
+
+    Returns:
+        ([(新しく追加するホスト名, 取り込み元ID)], 変更後の内容に置き換える既存サーバーのリスト)
+    """
+    servers = list(servers)
+    owners: Dict[str, str] = {}  # ホスト名 -> 属する取り込み元ID
+    for source_id in configured:
+        for host in results.get(source_id, ()):
+            owners.setdefault(host, source_id)
+
+    existing_hosts = {server.get('host') for server in servers if server.get('host')}
+    added = [(host, source_id) for host, source_id in owners.items() if host not in existing_hosts]
+
+    changed = []
+    for server in servers:
+        if not server.get('is_extra'):
+            continue
+        source_id = server.get('extra_source') or DEFAULT_SOURCE_ID
+        host = server.get('host')
+        updated = dict(server)
+        if source_id in reset:
+            updated['is_new'] = False
+            updated['is_deleted'] = False
+        listed = source_id in results and host in results[source_id]
+        if host in owners:
+            if not listed and (source_id in results or source_id not in configured):
+                updated['extra_source'] = owners[host]
+            if updated.get('is_deleted'):
+                # 一覧に戻ってきたので削除の確認待ちを取り消す
+                updated['is_deleted'] = False
+        elif source_id not in configured:
+            updated.update(is_extra=False, is_new=False, is_deleted=False)
+            updated.pop('extra_source', None)
+        elif source_id in results:
+            # 一覧から消えたサーバーは削除の確認待ちにする
+            updated['is_deleted'] = True
+            updated.pop('is_new', None)
+        if updated != server:
+            changed.append(updated)
+    return added, changed
+
+
+def release_extra_servers(servers: Iterable[Dict]) -> List[Dict]:
+    """取り込み元が設定されていない場合に、取り込み済みサーバーを通常のサーバーに戻した変更後の一覧を返す"""
+    changed = []
+    for server in servers:
+        if not server.get('is_extra'):
+            continue
+        updated = dict(server, is_extra=False, is_new=False, is_deleted=False)
+        updated.pop('extra_source', None)
+        changed.append(updated)
+    return changed
@@ -0,0 +1,140 @@
+"""
+HTTP Client
+===========
+
+外部サービスへのHTTPリクエストで共有する接続プール付きクライアント
+
+機能:
+- requests.Session によるキープアライブ（接続先ごとに接続を再利用し、TCP/TLSハンドシェイクを省略）
+- 接続先ごとの同時接続数の上限（上限に達したリクエストは接続が空くまで待つ）
+- 接続エラー・一時的なエラー応答（429 / 502 / 503 / 504）のジッター付き指数バックオフでの再試行
+  （Retry-After があればそれに従う。再試行するのは冪等なメソッドのみ）
+- gzip / deflate で圧縮されたレスポンスの受け入れ
+- 既定のタイムアウト
+- 接続先ごとの接続数・リクエスト数の統計
+
+Extra import など外部に接続する処理は requests.get の代わりにこのクライアントを使う。
+"""
+
+import logging
+import random
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class _JitteredRetry(Retry):
+    """指数バックオフの待ち時間を 0 からその値までの一様乱数にする Retry（多数のクライアントの再試行を分散させる）"""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class HttpClient:
+    """接続プール付きのHTTPクライアント"""
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, max_per_host: int = 8, max_hosts: int = 32, retries: int = 3,
+                 backoff: float = 0.5, backoff_max: float = 10.0, timeout: float = 10.0,
+                 user_agent: Optional[str] = None):
+        """
+        HttpClientを初期化
+
+        Args:
+            max_per_host: 接続先（スキーム・ホスト・ポート）ごとの最大同時接続数
+            max_hosts: 接続を保持しておく接続先の最大数
+            retries: 再試行の最大回数（0で再試行しない）
+            backoff: 再試行の待ち時間の基準（秒）。n回目の再試行は最大 backoff * 2^(n-1) 秒待つ
+            backoff_max: 再試行の待ち時間の上限（秒）
+            timeout: timeout を指定しないリクエストのタイムアウト（秒）
+            user_agent: User-Agent ヘッダー（None の場合は requests の既定値）
+        """
+        self.timeout = timeout
+        retry = _JitteredRetry(
+            total=retries,
+            backoff_factor=backoff,
+            backoff_max=backoff_max,
+            status_forcelist=self.RETRY_STATUSES,
+            raise_on_status=False,  # 再試行し尽くした場合は最後のレスポンスを返す（raise_for_status で判定する）
+            respect_retry_after_header=True,
+        )
+        self._adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=max_per_host,
+                                    pool_block=True, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        self._requests: Dict[str, int] = {}  # 接続先 -> リクエスト数
+        self._errors: Dict[str, int] = {}  # 接続先 -> 失敗したリクエスト数
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        requests.request と同じ引数でリクエストを送る（timeout の既定値は self.timeout）
+
+        Raises:
+            requests.RequestException: 再試行しても接続できない、またはタイムアウト
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        origin = self._origin(url)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._count(origin, error=True)
+            raise
+        self._count(origin, error=response.status_code >= 500)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _count(self, origin: str, error: bool):
+        with self._lock:
+            self._requests[origin] = self._requests.get(origin, 0) + 1
+            if error:
+                self._errors[origin] = self._errors.get(origin, 0) + 1
+
+    def close(self):
+        self.session.close()
+
+    def stats(self) -> Dict:
+        """接続先ごとのリクエスト数・失敗数と、開いた接続数（リクエスト数より少ないほど接続を再利用できている）"""
+        opened = {}
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            origin = f"{pool.scheme}://{pool.host}" + (f":{pool.port}" if pool.port else '')
+            opened[origin] = opened.get(origin, 0) + pool.num_connections
+        with self._lock:
+            hosts = {origin: {'requests': count, 'errors': self._errors.get(origin, 0)}
+                     for origin, count in self._requests.items()}
+        for origin, count in opened.items():
+            # URLでポートを省略した接続先はポート付きの接続プールに対応させる
+            entry = hosts.get(origin) or hosts.get(origin.rsplit(':', 1)[0])
+            if entry is not None:
+                entry['connections'] = entry.get('connections', 0) + count
+        return {
+            'hosts': hosts,
+            'requests': sum(entry['requests'] for entry in hosts.values()),
+            'connections': sum(opened.values()),
+        }
@@ -0,0 +1,178 @@
+"""
+ICMP Prober
+===========
+
+プロセスを生成せずにICMP Echoで疎通確認を行うモジュール
+
+機能:
+- 全ホストで共有する1つの非特権ICMPデータグラムソケット（Linux の ping ソケット）
+- 受信スレッドが identifier / sequence で応答を待機中のプローブに振り分け
+- 外部コマンドの出力解析が不要なため、ロケールに依存しない
+
+ping ソケットは net.ipv4.ping_group_range でカーネルが許可している場合のみ利用できる。
+利用できない環境では start() が OSError を送出するので、呼び出し側で従来の
+ping コマンドにフォールバックすること。
+"""
+
+import itertools
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(identifier: int, sequence: int, payload: bytes = b'serverdeck') -> bytes:
+    """ICMP Echo Request パケットを組み立てる"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence) + payload
+
+
+def parse_echo_reply(packet: bytes):
+    """
+    ICMP Echo Reply を解析
+
+    Returns:
+        (identifier, sequence)。Echo Reply でない場合は None
+    """
+    if len(packet) < 8:
+        return None
+    icmp_type, code, _checksum_value, identifier, sequence = struct.unpack('!BBHHH', packet[:8])
+    if icmp_type != ICMP_ECHO_REPLY or code != 0:
+        return None
+    return identifier, sequence
+
+
+class _PendingProbe:
+    __slots__ = ('address', 'sent_at', 'rtt', 'event')
+
+    def __init__(self, address: str):
+        self.address = address
+        self.sent_at = 0.0
+        self.rtt: Optional[float] = None
+        self.event = threading.Event()
+
+
+class IcmpProber:
+    """共有ソケットでICMP Echoを送受信するプローバー"""
+
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._identifier = 0
+        self._sequence = itertools.count()
+        self._pending: Dict[int, _PendingProbe] = {}
+        self._lock = threading.Lock()
+        self._receiver: Optional[threading.Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return self._sock is not None
+
+    def start(self):
+        """ソケットを開いて受信スレッドを開始（許可されていない場合は OSError）"""
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        sock.bind(('', 0))
+        # ping ソケットではカーネルが identifier をソケットのポート番号に書き換える
+        self._identifier = sock.getsockname()[1] or (os.getpid() & 0xFFFF)
+        self._sock = sock
+        self._receiver = threading.Thread(target=self._receive_loop, name='icmp-receiver', daemon=True)
+        self._receiver.start()
+        logger.info("Native ICMP prober started (unprivileged datagram socket)")
+
+    def _receive_loop(self):
+        sock = self._sock
+        while sock is not None:
+            try:
+                packet, (address, _port) = sock.recvfrom(2048)
+            except OSError as e:
+                logger.error(f"ICMP receive error: {e}")
+                time.sleep(0.1)
+                continue
+            received_at = time.monotonic()
+            parsed = parse_echo_reply(packet)
+            if parsed is None:
+                continue
+            _identifier, sequence = parsed
+            with self._lock:
+                probe = self._pending.get(sequence)
+            if probe is None or probe.address != address or probe.event.is_set():
+                continue
+            probe.rtt = (received_at - probe.sent_at) * 1000.0
+            probe.event.set()
+
+    def _register(self, probe: _PendingProbe) -> int:
+        """未使用の sequence を割り当ててプローブを登録"""
+        with self._lock:
+            while True:
+                sequence = next(self._sequence) & 0xFFFF
+                if sequence not in self._pending:
+                    self._pending[sequence] = probe
+                    return sequence
+
+    def ping(self, host: str, count: int = 1, timeout: float = 1) -> Optional[Dict]:
+        """
+        ホストにICMP Echoを送信
+
+        Args:
+            host: ホスト名またはIPv4アドレス
+            count: 送信するEcho Requestの数
+            timeout: 応答を待つ最大時間（秒）
+
+        Returns:
+            ping_host() と同じ形式の辞書。IPv4アドレスに解決できない場合は None
+        """
+        result_data = {'status': 'unknown', 'response_time': None, 'packet_loss': None}
+        try:
+            address = socket.getaddrinfo(host, None, socket.AF_INET, socket.SOCK_DGRAM)[0][4][0]
+        except socket.gaierror as e:
+            logger.debug(f"Could not resolve {host} to an IPv4 address: {e}")
+            return None
+
+        probes = []
+        try:
+            for _ in range(max(1, count)):
+                probe = _PendingProbe(address)
+                sequence = self._register(probe)
+                probes.append((sequence, probe))
+                probe.sent_at = time.monotonic()
+                self._sock.sendto(build_echo_request(self._identifier, sequence), (address, 0))
+
+            deadline = time.monotonic() + timeout
+            for _sequence, probe in probes:
+                probe.event.wait(max(0.0, deadline - time.monotonic()))
+        except OSError as e:
+            logger.debug(f"ICMP send to {host} failed: {e}")
+            result_data['status'] = 'offline'
+            return result_data
+        finally:
+            with self._lock:
+                for sequence, _probe in probes:
+                    self._pending.pop(sequence, None)
+
+        rtts = [probe.rtt for _sequence, probe in probes if probe.rtt is not None]
+        result_data['packet_loss'] = round(100.0 * (len(probes) - len(rtts)) / len(probes), 1)
+        if rtts:
+            result_data['status'] = 'online'
+            result_data['response_time'] = round(sum(rtts) / len(rtts), 3)
+        else:
+            result_data['status'] = 'offline'
+        return result_data
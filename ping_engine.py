@@ -0,0 +1,362 @@
+"""
+Ping Engine
+===========
+
+複数ホストへの疎通確認を並列に実行するモジュール
+
+機能:
+- 同時実行数を制限したワーカープールでプローブを並列実行
+- サーバーごとのプローブ方式（ICMP / TCPポート / SSHバナー）
+- 次回実行時刻のヒープによるホストごとの適応的スケジューリング
+  - 状態が安定しているホストは間隔を延ばす
+  - 状態が変化したホストは間隔を縮める
+  - ダウンし続けるホストは上限まで指数バックオフ
+- 詳細表示などからの優先プローブ（即時実行）
+- スケジューラーの統計情報の記録
+- 変化のあった結果だけをまとめて送る一括通知
+"""
+
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+PROBE_MODES = ('icmp', 'tcp', 'ssh')
+
+
+class ProbeTarget(NamedTuple):
+    """プローブ対象（方式やポートが変わった場合は別の対象として扱う）"""
+    host: str
+    mode: str = 'icmp'  # 'icmp' / 'tcp'（ポートへの接続）/ 'ssh'（接続後にSSHバナーを確認）
+    port: int = 22
+
+
+class PingEngine:
+    """プローブ関数を並列実行するエンジン"""
+
+    def __init__(self, probe: Callable[[str], Dict], concurrency: int = 64, tcp_prober=None):
+        """
+        PingEngineを初期化
+
+        Args:
+            probe: ホスト名を受け取り ping_host() と同じ形式の辞書を返す関数
+            concurrency: 同時に実行するプローブの最大数
+            tcp_prober: 'tcp' / 'ssh' 方式のプローブを実行する TcpProber（None の場合は常に probe を使う）
+        """
+        self.probe = probe
+        self.concurrency = max(1, int(concurrency))
+        self.tcp_prober = tcp_prober
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ping')
+
+    def _run_probe(self, host: str) -> Dict:
+        try:
+            return self.probe(host)
+        except Exception as e:
+            logger.error(f"Probe failed for {host}: {e}")
+            return {'status': 'unknown', 'response_time': None, 'packet_loss': None}
+
+    def submit(self, target: Union[ProbeTarget, str], callback: Callable[[Dict], None]):
+        """
+        プローブを実行し、結果でコールバックを呼ぶ
+
+        ICMP はワーカープールで実行する。TCP / SSH はスレッドを占有せず
+        TcpProber のセレクター上で完了を待つ。
+        """
+        if isinstance(target, str):
+            target = ProbeTarget(target)
+        if target.mode in ('tcp', 'ssh') and self.tcp_prober is not None:
+            self.tcp_prober.submit(target.host, target.port, callback, read_banner=target.mode == 'ssh')
+            return None
+
+        def task():
+            callback(self._run_probe(target.host))
+        return self._executor.submit(task)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class _HostSchedule:
+    __slots__ = ('server_id', 'target', 'interval', 'due', 'stable_count', 'last_status', 'in_flight', 'generation')
+
+    def __init__(self, server_id: str, target: ProbeTarget, interval: float, due: float):
+        self.server_id = server_id
+        self.target = target
+        self.interval = interval
+        self.due = due
+        self.stable_count = 0
+        self.last_status: Optional[str] = None
+        self.in_flight = False
+        self.generation = 0
+
+
+class PingScheduler:
+    """次回実行時刻のヒープでホストごとにプローブを発行するスケジューラー"""
+
+    def __init__(self, engine: PingEngine, on_result: Callable[[str, Dict], None],
+                 base_interval: float = 10, min_interval: float = 5,
+                 max_stable_interval: float = 60, max_down_interval: float = 300,
+                 stable_after: int = 3):
+        """
+        PingSchedulerを初期化
+
+        Args:
+            engine: プローブを実行する PingEngine
+            on_result: 結果が出るたびに (server_id, result) で呼ばれるコールバック
+            base_interval: 新規ホストと通常時の間隔（秒）
+            min_interval: 状態が変化した直後の間隔（秒）
+            max_stable_interval: 安定しているホストの最大間隔（秒）
+            max_down_interval: ダウンし続けるホストのバックオフ上限（秒）
+            stable_after: 何回連続で同じ状態なら安定とみなすか
+        """
+        self.engine = engine
+        self.on_result = on_result
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_stable_interval = max_stable_interval
+        self.max_down_interval = max_down_interval
+        self.stable_after = stable_after
+        self._hosts: Dict[str, _HostSchedule] = {}
+        # (due, 連番, server_id, generation)。古い世代のエントリは取り出し時に捨てる
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._completed = deque()  # 直近1分間のプローブ完了時刻
+        self._lags = deque()  # 直近1分間の (発行時刻, 予定からの遅れ)
+
+    def _push(self, schedule: _HostSchedule):
+        schedule.generation += 1
+        heapq.heappush(self._heap, (schedule.due, next(self._counter), schedule.server_id, schedule.generation))
+
+    def sync(self, targets: Dict[str, str]):
+        """
+        監視対象を更新（追加されたホストは即時プローブ、消えたホストは削除）
+
+        Args:
+            targets: server_id をキーにした ProbeTarget（またはホスト名）の辞書
+        """
+        now = time.monotonic()
+        with self._cond:
+            for server_id in list(self._hosts):
+                if server_id not in targets:
+                    del self._hosts[server_id]
+            for server_id, target in targets.items():
+                if isinstance(target, str):
+                    target = ProbeTarget(target)
+                schedule = self._hosts.get(server_id)
+                if schedule is None:
+                    schedule = _HostSchedule(server_id, target, self.base_interval, now)
+                    self._hosts[server_id] = schedule
+                    self._push(schedule)
+                elif schedule.target != target:
+                    # ホスト名やプローブ方式が変わった場合は新規扱いで即時プローブ
+                    schedule.target = target
+                    schedule.last_status = None
+                    schedule.interval = self.base_interval
+                    schedule.stable_count = 0
+                    schedule.due = now
+                    self._push(schedule)
+            self._cond.notify()
+
+    def request_priority(self, server_id: str) -> bool:
+        """指定したホストを即時プローブする（監視対象外ならFalse）"""
+        with self._cond:
+            schedule = self._hosts.get(server_id)
+            if schedule is None:
+                return False
+            if not schedule.in_flight:
+                schedule.due = time.monotonic()
+                self._push(schedule)
+                self._cond.notify()
+            return True
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='ping-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due_schedules = []
+                while self._heap and self._heap[0][0] <= now:
+                    due, _count, server_id, generation = heapq.heappop(self._heap)
+                    schedule = self._hosts.get(server_id)
+                    if schedule is None or schedule.generation != generation or schedule.in_flight:
+                        continue
+                    schedule.in_flight = True
+                    self._lags.append((now, now - due))
+                    due_schedules.append(schedule)
+                while self._lags and self._lags[0][0] < now - 60:
+                    self._lags.popleft()
+                if not due_schedules:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+                    continue
+            for schedule in due_schedules:
+                self.engine.submit(schedule.target, lambda result, s=schedule: self._complete(s, result))
+
+    def _next_interval(self, schedule: _HostSchedule, status: str) -> float:
+        if status != schedule.last_status:
+            # 状態が変化したホストは短い間隔で追跡する
+            schedule.stable_count = 0
+            return self.min_interval
+        schedule.stable_count += 1
+        if status == 'offline':
+            return min(max(schedule.interval, self.base_interval) * 2, self.max_down_interval)
+        if status == 'online' and schedule.stable_count >= self.stable_after:
+            return min(max(schedule.interval, self.base_interval) * 1.5, self.max_stable_interval)
+        return self.base_interval
+
+    def _complete(self, schedule: _HostSchedule, result: Dict):
+        now = time.monotonic()
+        with self._cond:
+            schedule.in_flight = False
+            self._completed.append(now)
+            while self._completed and self._completed[0] < now - 60:
+                self._completed.popleft()
+            status = result.get('status')
+            schedule.interval = self._next_interval(schedule, status)
+            schedule.last_status = status
+            if self._hosts.get(schedule.server_id) is schedule:
+                schedule.due = now + schedule.interval
+                self._push(schedule)
+                self._cond.notify()
+            else:
+                # 監視対象から外れたホストの結果は通知しない
+                return
+        try:
+            self.on_result(schedule.server_id, result)
+        except Exception as e:
+            logger.error(f"Error handling ping result for {schedule.server_id}: {e}")
+
+    def stats(self) -> Dict:
+        """スケジューラーの統計情報"""
+        now = time.monotonic()
+        with self._cond:
+            intervals = [s.interval for s in self._hosts.values()]
+            overdue = sum(1 for s in self._hosts.values() if not s.in_flight and s.due < now)
+            stats = {
+                'hosts': len(self._hosts),
+                'in_flight': sum(1 for s in self._hosts.values() if s.in_flight),
+                'overdue': overdue,
+                'probes_last_minute': sum(1 for t in self._completed if t >= now - 60),
+                'max_lag_seconds': round(max((lag for t, lag in self._lags if t >= now - 60), default=0.0), 3),
+                'concurrency': self.engine.concurrency,
+                'probe_modes': {mode: sum(1 for s in self._hosts.values() if s.target.mode == mode) for mode in PROBE_MODES},
+                'interval_min': min(intervals) if intervals else None,
+                'interval_max': max(intervals) if intervals else None,
+                'interval_avg': round(sum(intervals) / len(intervals), 2) if intervals else None,
+            }
+        if self.engine.tcp_prober is not None:
+            stats['tcp'] = self.engine.tcp_prober.stats()
+        return stats
+
+
+# 応答時間の区分（ミリ秒）。同じ区分内の揺らぎは通知しない
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def latency_bucket(response_time: Optional[float]) -> Optional[int]:
+    if response_time is None:
+        return None
+    return bisect.bisect_right(LATENCY_BUCKETS_MS, response_time)
+
+
+class PingStatusBroadcaster:
+    """Ping結果を集約し、状態か応答時間区分が変わったホストだけを定期的に一括送信する"""
+
+    def __init__(self, emit: Callable[[str, Dict], None], flush_interval: float = 1.0):
+        """
+        PingStatusBroadcasterを初期化
+
+        Args:
+            emit: (イベント名, データ) を全クライアントに送信する関数
+            flush_interval: 一括送信の間隔（秒）
+        """
+        self.emit = emit
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sent: Dict[str, Dict] = {}  # 最後に送信した状態
+        self._pending: Dict[str, Dict] = {}
+        self._removed: Dict[str, Dict] = {}  # 次の一括送信で1回だけ通知する監視対象外のホスト
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _entry(server_id: str, result: Dict) -> Dict:
+        return {
+            'server_id': server_id,
+            'status': result.get('status'),
+            'response_time': result.get('response_time'),
+            'packet_loss': result.get('packet_loss'),
+        }
+
+    def publish(self, server_id: str, result: Dict):
+        """結果を記録（前回送信時から変化がある場合のみ送信対象にする）"""
+        entry = self._entry(server_id, result)
+        with self._lock:
+            self._removed.pop(server_id, None)
+            sent = self._sent.get(server_id)
+            if (sent is not None and sent['status'] == entry['status']
+                    and latency_bucket(sent['response_time']) == latency_bucket(entry['response_time'])):
+                self._pending.pop(server_id, None)
+                return
+            self._pending[server_id] = entry
+
+    def remove(self, server_id: str):
+        """監視対象から外れたホストを 'disabled' として1回だけ通知し、保持している状態を破棄"""
+        with self._lock:
+            self._sent.pop(server_id, None)
+            self._pending.pop(server_id, None)
+            self._removed[server_id] = self._entry(server_id, {'status': 'disabled'})
+
+    def snapshot(self) -> List[Dict]:
+        """接続直後のクライアントに送る全ホストの最新状態"""
+        with self._lock:
+            merged = dict(self._sent)
+            merged.update(self._pending)
+            return list(merged.values())
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._removed:
+                return
+            updates = list(self._pending.values()) + list(self._removed.values())
+            self._sent.update(self._pending)
+            self._pending.clear()
+            self._removed.clear()
+        self.emit('ping_status_batch', {'updates': updates})
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='ping-broadcaster', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting ping status batch: {e}")
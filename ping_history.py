@@ -0,0 +1,209 @@
+"""
+Ping History
+============
+
+ホストごとのPing結果の履歴を固定長リングバッファで保持するモジュール
+
+機能:
+- ホストごとに事前確保した NumPy 配列（時刻 / 応答時間 / 損失率）のリングバッファ
+- 指定期間の min / avg / max / p95 / p99 と損失率の集計
+- 指定期間を等間隔に区切ったダウンサンプリング系列
+
+集計はすべて配列演算で行うため、多数のホスト・長い期間を問い合わせても
+サンプル数に比例したPythonオブジェクトは生成しない。
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class _HostRing:
+    """1ホスト分のリングバッファ"""
+
+    __slots__ = ('timestamps', 'rtts', 'losses', 'head', 'count')
+
+    def __init__(self, capacity: int):
+        self.timestamps = np.zeros(capacity, dtype=np.uint32)  # UNIX時刻（秒）
+        self.rtts = np.full(capacity, np.nan, dtype=np.float32)  # 応答時間（ms）。応答なしは NaN
+        self.losses = np.zeros(capacity, dtype=np.float32)  # 損失率（%）
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: float, rtt: Optional[float], loss: Optional[float]):
+        capacity = len(self.timestamps)
+        self.timestamps[self.head] = int(timestamp)
+        self.rtts[self.head] = np.nan if rtt is None else rtt
+        self.losses[self.head] = 100.0 if loss is None and rtt is None else (loss or 0.0)
+        self.head = (self.head + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+
+    def window(self, start: float, end: float):
+        """期間内のサンプルを (時刻, 応答時間, 損失率) の配列で返す（順不同）"""
+        timestamps = self.timestamps[:self.count]
+        mask = (timestamps >= int(start)) & (timestamps <= int(end))
+        return timestamps[mask], self.rtts[:self.count][mask], self.losses[:self.count][mask]
+
+
+def _to_list(values: np.ndarray) -> List[Optional[float]]:
+    """配列をJSON用のリストに変換（NaN は None）"""
+    values = np.round(values.astype(np.float64), 3)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+class PingHistory:
+    """全ホストのPing履歴"""
+
+    def __init__(self, capacity: int = 2880):
+        """
+        PingHistoryを初期化
+
+        Args:
+            capacity: ホストごとに保持するサンプル数
+        """
+        self.capacity = max(1, int(capacity))
+        self._hosts: Dict[str, _HostRing] = {}
+        self._lock = threading.Lock()
+
+    def record(self, server_id: str, result: Dict, timestamp: Optional[float] = None):
+        """Ping結果を1件記録（'online' / 'offline' 以外の結果は記録しない）"""
+        status = result.get('status')
+        if status not in ('online', 'offline'):
+            return
+        rtt = result.get('response_time') if status == 'online' else None
+        with self._lock:
+            ring = self._hosts.get(server_id)
+            if ring is None:
+                ring = self._hosts[server_id] = _HostRing(self.capacity)
+            ring.append(time.time() if timestamp is None else timestamp, rtt, result.get('packet_loss'))
+
+    def forget(self, server_id: str):
+        with self._lock:
+            self._hosts.pop(server_id, None)
+
+    def query(self, server_ids: Optional[Iterable[str]], start: float, end: float, points: int = 60) -> Dict[str, Dict]:
+        """
+        期間内の統計とダウンサンプリング系列を取得
+
+        全ホスト分のサンプルを1つの配列に連結し、ホスト番号と区間番号を組み合わせた
+        キーで一括集計する。
+
+        Args:
+            server_ids: 対象サーバーID（None の場合は全ホスト）
+            start: 期間の開始（UNIX時刻）
+            end: 期間の終了（UNIX時刻）
+            points: 系列の点数
+
+        Returns:
+            server_id をキーにした {'stats': {...}, 'series': {...}} の辞書
+        """
+        points = max(1, int(points))
+        edges = np.linspace(start, end, points + 1)
+        with self._lock:
+            if server_ids is None:
+                rings = list(self._hosts.items())
+            else:
+                rings = [(sid, self._hosts[sid]) for sid in server_ids if sid in self._hosts]
+            windows = [ring.window(start, end) for _sid, ring in rings]
+        if not rings:
+            return {}
+
+        host_count = len(rings)
+        sizes = np.array([len(w[0]) for w in windows], dtype=np.int64)
+        hosts = np.repeat(np.arange(host_count), sizes)
+        timestamps = np.concatenate([w[0] for w in windows])
+        rtts = np.concatenate([w[1] for w in windows]).astype(np.float64)
+        losses = np.concatenate([w[2] for w in windows]).astype(np.float64)
+        replied = ~np.isnan(rtts)
+
+        stats = self._stats(host_count, hosts, rtts, losses, replied, sizes)
+        series = self._series(host_count, points, edges, hosts, timestamps, rtts, losses, replied)
+        bucket_starts = np.round(edges[:-1]).astype(np.int64).tolist()
+
+        results = {}
+        for index, (server_id, _ring) in enumerate(rings):
+            results[server_id] = {
+                'stats': {key: values[index] for key, values in stats.items()},
+                'series': {
+                    'timestamps': bucket_starts,
+                    'rtt_avg': series['rtt_avg'][index],
+                    'rtt_max': series['rtt_max'][index],
+                    'loss': series['loss'][index],
+                },
+            }
+        return results
+
+    @staticmethod
+    def _stats(host_count, hosts, rtts, losses, replied, sizes) -> Dict[str, list]:
+        """ホストごとの min / avg / max / p95 / p99 / 平均損失率"""
+        reply_hosts = hosts[replied]
+        reply_rtts = rtts[replied]
+        reply_counts = np.bincount(reply_hosts, minlength=host_count)
+
+        # ホストごとに応答時間の範囲をずらした値を1回ソートし、ホスト単位で昇順に並べる。
+        # 各ホストの区間から分位点を線形補間で求める
+        span = float(reply_rtts.max()) + 1.0 if len(reply_rtts) else 1.0
+        shifted = np.sort(reply_hosts * span + reply_rtts)
+        sorted_rtts = shifted - np.repeat(np.arange(host_count), reply_counts) * span
+        offsets = np.concatenate(([0], np.cumsum(reply_counts)[:-1]))
+        has_reply = reply_counts > 0
+        last = np.maximum(reply_counts - 1, 0)
+
+        def quantile(q):
+            position = offsets + last * q
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            if len(sorted_rtts) == 0:
+                return np.full(host_count, np.nan)
+            lower = np.minimum(lower, len(sorted_rtts) - 1)
+            upper = np.minimum(upper, len(sorted_rtts) - 1)
+            values = sorted_rtts[lower] + (sorted_rtts[upper] - sorted_rtts[lower]) * (position - lower)
+            return np.where(has_reply, values, np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rtt_avg = np.bincount(reply_hosts, weights=reply_rtts, minlength=host_count) / reply_counts
+            loss_avg = np.bincount(hosts, weights=losses, minlength=host_count) / sizes
+
+        return {
+            'samples': sizes.tolist(),
+            'replies': reply_counts.tolist(),
+            'loss_avg': _to_list(loss_avg),
+            'min': _to_list(quantile(0.0)),
+            'avg': _to_list(rtt_avg),
+            'max': _to_list(quantile(1.0)),
+            'p95': _to_list(quantile(0.95)),
+            'p99': _to_list(quantile(0.99)),
+        }
+
+    @staticmethod
+    def _series(host_count, points, edges, hosts, timestamps, rtts, losses, replied) -> Dict[str, list]:
+        """期間を等間隔の区間に分け、区間ごとの平均/最大応答時間と平均損失率を求める"""
+        bins = np.clip(np.searchsorted(edges, timestamps, side='right') - 1, 0, points - 1)
+        keys = hosts * points + bins
+        size = host_count * points
+
+        samples = np.bincount(keys, minlength=size)
+        reply_keys = keys[replied]
+        reply_rtts = rtts[replied]
+        reply_counts = np.bincount(reply_keys, minlength=size)
+        rtt_sums = np.bincount(reply_keys, weights=reply_rtts, minlength=size)
+        loss_sums = np.bincount(keys, weights=losses, minlength=size)
+
+        rtt_max = np.full(size, np.nan)
+        if len(reply_keys):
+            order = np.argsort(reply_keys, kind='stable')
+            sorted_keys = reply_keys[order]
+            starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+            rtt_max[sorted_keys[starts]] = np.maximum.reduceat(reply_rtts[order], starts)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rtt_avg = rtt_sums / reply_counts
+            loss_avg = loss_sums / samples
+
+        return {
+            'rtt_avg': [_to_list(row) for row in rtt_avg.reshape(host_count, points)],
+            'rtt_max': [_to_list(row) for row in rtt_max.reshape(host_count, points)],
+            'loss': [_to_list(row) for row in loss_avg.reshape(host_count, points)],
+        }
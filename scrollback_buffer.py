@@ -0,0 +1,73 @@
+"""
+Scrollback Buffer
+=================
+
+SSH出力の直近の一定バイト数を保持する固定長リングバッファ
+
+機能:
+- 事前確保した bytearray への追記（古いデータから上書き）
+- 書き込み総バイト数による位置指定での読み出し
+  （クライアントが受信済みの位置以降だけを再送できる）
+"""
+
+import threading
+
+
+class ScrollbackBuffer:
+    """固定長のバイトリングバッファ"""
+
+    def __init__(self, capacity: int = 256 * 1024):
+        """
+        ScrollbackBufferを初期化
+
+        Args:
+            capacity: 保持する最大バイト数
+        """
+        self.capacity = max(1, int(capacity))
+        self._data = bytearray(self.capacity)
+        self._total = 0  # これまでに書き込んだ総バイト数
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self._total, self.capacity)
+
+    @property
+    def total(self) -> int:
+        """これまでに書き込んだ総バイト数"""
+        return self._total
+
+    def append(self, data: bytes):
+        if not data:
+            return
+        with self._lock:
+            if len(data) >= self.capacity:
+                # 容量を超える分は末尾だけを残す
+                skipped = len(data) - self.capacity
+                self._total += skipped
+                data = data[skipped:]
+            start = self._total % self.capacity
+            first = min(len(data), self.capacity - start)
+            self._data[start:start + first] = data[:first]
+            if first < len(data):
+                self._data[:len(data) - first] = data[first:]
+            self._total += len(data)
+
+    def read_since(self, offset: int = 0) -> bytes:
+        """
+        書き込み総バイト数で offset 以降のデータを返す
+
+        Args:
+            offset: 読み出し開始位置（既に上書きされた位置の場合は保持している先頭から）
+
+        Returns:
+            保持しているデータのうち offset 以降の部分
+        """
+        with self._lock:
+            begin = max(int(offset), self._total - self.capacity, 0)
+            if begin >= self._total:
+                return b''
+            start = begin % self.capacity
+            end = self._total % self.capacity
+            if start < end:
+                return bytes(self._data[start:end])
+            return bytes(self._data[start:]) + bytes(self._data[:end])
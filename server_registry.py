@@ -0,0 +1,131 @@
+"""
+Server Registry
+===============
+
+サーバー一覧をハッシュインデックス付きで保持するモジュール
+
+機能:
+- id をキーにした O(1) の取得・追加・更新・削除（登録順は維持）
+- host / parent_id / tag の二次インデックス
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class ItemRegistry:
+    """id をキーにした設定項目の順序付きコレクション"""
+
+    def __init__(self, items: Iterable[Dict] = ()):
+        self._by_id: Dict[str, Dict] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._by_id
+
+    def get(self, item_id) -> Optional[Dict]:
+        return self._by_id.get(item_id)
+
+    def items(self) -> List[Dict]:
+        return list(self._by_id.values())
+
+    def add(self, item: Dict) -> bool:
+        """項目を追加（同じidが既に存在する場合はFalse）"""
+        item_id = item.get('id')
+        if item_id in self._by_id:
+            return False
+        self._by_id[item_id] = item
+        self._index(item)
+        return True
+
+    def replace(self, item: Dict) -> Optional[Dict]:
+        """同じidの項目を置き換え（位置は維持）。置き換え前の項目を返す"""
+        item_id = item.get('id')
+        old = self._by_id.get(item_id)
+        if old is None:
+            return None
+        self._unindex(old)
+        self._by_id[item_id] = item
+        self._index(item)
+        return old
+
+    def remove(self, item_id) -> Optional[Dict]:
+        """項目を削除し、削除した項目を返す"""
+        item = self._by_id.pop(item_id, None)
+        if item is not None:
+            self._unindex(item)
+        return item
+
+    def _index(self, item: Dict):
+        """二次インデックスへの登録（サブクラスで実装）"""
+
+    def _unindex(self, item: Dict):
+        """二次インデックスからの削除（サブクラスで実装）"""
+
+
+class ServerRegistry(ItemRegistry):
+    """host / parent_id / tag のインデックスを持つサーバー一覧"""
+
+    def __init__(self, servers: Iterable[Dict] = ()):
+        # 値は {server_id: None} の辞書（順序付き集合として使用）
+        self._by_host: Dict[str, Dict[str, None]] = {}
+        self._by_parent: Dict[str, Dict[str, None]] = {}
+        self._by_tag: Dict[str, Dict[str, None]] = {}
+        super().__init__(servers)
+
+    @staticmethod
+    def _tags(server: Dict) -> List[str]:
+        tags = server.get('tags') or []
+        return tags if isinstance(tags, list) else []
+
+    @staticmethod
+    def _link(index: Dict, key, server_id):
+        if key:
+            index.setdefault(key, {})[server_id] = None
+
+    @staticmethod
+    def _unlink(index: Dict, key, server_id):
+        if not key:
+            return
+        ids = index.get(key)
+        if ids is not None:
+            ids.pop(server_id, None)
+            if not ids:
+                del index[key]
+
+    def _index(self, server: Dict):
+        server_id = server.get('id')
+        self._link(self._by_host, server.get('host'), server_id)
+        self._link(self._by_parent, server.get('parent_id'), server_id)
+        for tag in self._tags(server):
+            self._link(self._by_tag, tag, server_id)
+
+    def _unindex(self, server: Dict):
+        server_id = server.get('id')
+        self._unlink(self._by_host, server.get('host'), server_id)
+        self._unlink(self._by_parent, server.get('parent_id'), server_id)
+        for tag in self._tags(server):
+            self._unlink(self._by_tag, tag, server_id)
+
+    def hosts(self):
+        """登録済みのホスト名一覧（集合として扱える keys ビュー）"""
+        return self._by_host.keys()
+
+    def get_by_host(self, host) -> Optional[Dict]:
+        """ホスト名に一致する最初のサーバー"""
+        ids = self._by_host.get(host)
+        if not ids:
+            return None
+        return self._by_id[next(iter(ids))]
+
+    def children_of(self, parent_id) -> List[Dict]:
+        return [self._by_id[i] for i in self._by_parent.get(parent_id, ())]
+
+    def with_tag(self, tag) -> List[Dict]:
+        return [self._by_id[i] for i in self._by_tag.get(tag, ())]
@@ -3,16 +3,16 @@
 Flask Session Manager
 =====================
 
-Flask sessionファイルの管理とSSHマルチタブ状態の永続化を担当するモジュール
+Flask sessionの保存先の管理とSSHマルチタブ状態の永続化を担当するモジュール
 
 機能:
-- 期限切れセッションファイルの自動削除
+- サーバー側セッションストア（session_store.py）のアプリケーションへの組み込み
+- 期限切れセッションの自動削除
 - SSHマルチタブ状態の保存・復元
 - セッション統計情報の提供
 """
 
 import os
-import pickle
 import time
 import json
 import threading
@@ -20,6 +20,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from session_store import SessionStore, StoreSessionInterface, create_session_store
+
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,21 +29,26 @@ logger = logging.getLogger(__name__)
 class SessionManager:
     """Flask sessionとSSHマルチタブ状態を管理するクラス"""
     
-    def __init__(self, session_dir: str = "config/flask_session", cleanup_interval: int = 3600):
+    def __init__(self, session_dir: str = "config/flask_session", cleanup_interval: int = 3600,
+                 store: Optional[SessionStore] = None):
         """
         SessionManagerを初期化
         
         Args:
-            session_dir: Flask sessionファイルが保存されているディレクトリ
+            session_dir: SSHマルチタブ状態ファイルを保存するディレクトリ
             cleanup_interval: 自動クリーンアップの間隔（秒）
+            store: Flask sessionの保存先（None の場合はメモリのみのストア）
         """
         self.session_dir = session_dir
         self.cleanup_interval = cleanup_interval
+        self.store = store if store is not None else SessionStore()
         self.cleanup_thread = None
         self.running = False
         
         # SSHマルチタブ状態保存用
         self.ssh_tabs_file = os.path.join(session_dir, "ssh_tabs_state.json")
+        # 複数の接続ワーカーから同時に保存されるため、読み込み〜書き込みを直列化する
+        self._ssh_tabs_lock = threading.RLock()
         
         # ディレクトリ作成
         os.makedirs(session_dir, exist_ok=True)
@@ -73,123 +80,63 @@ class SessionManager:
                 logger.error(f"Error in session cleanup loop: {e}")
                 time.sleep(60)  # エラー時は1分待ってリトライ
     
-    def cleanup_expired_sessions(self, max_age_hours: int = 24) -> Tuple[int, int]:
+    def cleanup_expired_sessions(self, max_age_hours: Optional[float] = 24) -> Tuple[int, int]:
         """
-        期限切れのセッションファイルを削除
+        期限切れのセッションを削除（SQLite の場合は有効期限のインデックスを使った1回の DELETE）
         
         Args:
-            max_age_hours: セッションファイルの最大保持時間（時間）
+            max_age_hours: この時間より長く使われていないセッションも削除する（None の場合は有効期限のみで判定）
             
         Returns:
-            Tuple[削除されたファイル数, 残存ファイル数]
+            Tuple[削除されたセッション数, 残存セッション数]
         """
-        if not os.path.exists(self.session_dir):
-            return 0, 0
-        
-        current_time = time.time()
-        max_age_seconds = max_age_hours * 3600
-        deleted_count = 0
-        remaining_count = 0
-        
         try:
-            for filename in os.listdir(self.session_dir):
-                filepath = os.path.join(self.session_dir, filename)
-                
-                # 特別なファイルはスキップ
-                if filename in ["ssh_tabs_state.json"] or filename.startswith("tmp"):
-                    remaining_count += 1
-                    continue
-                
-                try:
-                    # ファイルの最終更新時刻を確認
-                    file_mtime = os.path.getmtime(filepath)
-                    file_age = current_time - file_mtime
-                    
-                    if file_age > max_age_seconds:
-                        # 期限切れファイルを削除
-                        os.remove(filepath)
-                        deleted_count += 1
-                        logger.debug(f"Deleted expired session file: {filename} (age: {file_age/3600:.1f}h)")
-                    else:
-                        remaining_count += 1
-                        
-                except (OSError, IOError) as e:
-                    logger.warning(f"Could not process session file {filename}: {e}")
-                    remaining_count += 1
-                    
+            deleted_count, remaining_count = self.store.delete_expired(
+                max_age_hours * 3600 if max_age_hours is not None else None)
         except Exception as e:
             logger.error(f"Error during session cleanup: {e}")
+            return 0, 0
         
         if deleted_count > 0:
-            logger.info(f"Session cleanup completed: {deleted_count} expired files deleted, {remaining_count} files remaining")
+            logger.info(f"Session cleanup completed: {deleted_count} expired sessions deleted, {remaining_count} sessions remaining")
         
         return deleted_count, remaining_count
     
     def get_session_stats(self) -> Dict:
-        """セッション統計情報を取得"""
-        if not os.path.exists(self.session_dir):
-            return {"total_files": 0, "total_size": 0, "oldest_file": None, "newest_file": None}
-        
+        """セッション統計情報を取得（SQLite の場合は1回の集計クエリ）"""
         stats = {
-            "total_files": 0,
+            "backend": self.store.kind,
+            "total_sessions": 0,
             "total_size": 0,
-            "oldest_file": None,
-            "newest_file": None,
-            "files_by_age": {"<1h": 0, "1-6h": 0, "6-24h": 0, ">24h": 0}
+            "expired_sessions": 0,
+            "cached_sessions": 0,
+            "oldest_session": None,
+            "newest_session": None,
+            "sessions_by_age": {"<1h": 0, "1-6h": 0, "6-24h": 0, ">24h": 0}
         }
         
-        current_time = time.time()
-        oldest_time = None
-        newest_time = None
-        
         try:
-            for filename in os.listdir(self.session_dir):
-                filepath = os.path.join(self.session_dir, filename)
-                
-                if filename.startswith("tmp") or filename == "ssh_tabs_state.json":
-                    continue
-                
-                try:
-                    file_stat = os.stat(filepath)
-                    file_mtime = file_stat.st_mtime
-                    file_size = file_stat.st_size
-                    file_age_hours = (current_time - file_mtime) / 3600
-                    
-                    stats["total_files"] += 1
-                    stats["total_size"] += file_size
-                    
-                    # 年齢別分類
-                    if file_age_hours < 1:
-                        stats["files_by_age"]["<1h"] += 1
-                    elif file_age_hours < 6:
-                        stats["files_by_age"]["1-6h"] += 1
-                    elif file_age_hours < 24:
-                        stats["files_by_age"]["6-24h"] += 1
-                    else:
-                        stats["files_by_age"][">24h"] += 1
-                    
-                    # 最古・最新ファイル
-                    if oldest_time is None or file_mtime < oldest_time:
-                        oldest_time = file_mtime
-                        stats["oldest_file"] = {
-                            "name": filename,
-                            "age_hours": file_age_hours,
-                            "modified": datetime.fromtimestamp(file_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                    
-                    if newest_time is None or file_mtime > newest_time:
-                        newest_time = file_mtime
-                        stats["newest_file"] = {
-                            "name": filename,
-                            "age_hours": file_age_hours,
-                            "modified": datetime.fromtimestamp(file_mtime).strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        
-                except (OSError, IOError) as e:
-                    logger.warning(f"Could not stat session file {filename}: {e}")
-                    
+            summary = self.store.stats()
         except Exception as e:
             logger.error(f"Error collecting session stats: {e}")
+            return stats
+        
+        current_time = time.time()
+        stats.update({
+            "total_sessions": summary["count"],
+            "total_size": summary["size"],
+            "expired_sessions": summary["expired"],
+            "cached_sessions": summary["cached"],
+            "cache_hits": summary["cache_hits"],
+            "cache_misses": summary["cache_misses"],
+            "sessions_by_age": summary["by_age"],
+        })
+        for key, updated in (("oldest_session", summary["oldest"]), ("newest_session", summary["newest"])):
+            if updated is not None:
+                stats[key] = {
+                    "age_hours": (current_time - updated) / 3600,
+                    "modified": datetime.fromtimestamp(updated).strftime("%Y-%m-%d %H:%M:%S")
+                }
         
         return stats
     
@@ -203,19 +150,19 @@ class SessionManager:
                 [{"server_id": "server1", "server_name": "Server 1", "connected": True}, ...]
         """
         try:
-            # 既存のデータを読み込み
-            ssh_tabs_data = self.load_all_ssh_tabs_state()
-            
-            # 現在のセッションのデータを更新
-            ssh_tabs_data[session_id] = {
-                "tabs": tabs_data,
-                "last_updated": datetime.now().isoformat(),
-                "session_id": session_id
-            }
-            
-            # ファイルに保存
-            with open(self.ssh_tabs_file, 'w', encoding='utf-8') as f:
-                json.dump(ssh_tabs_data, f, ensure_ascii=False, indent=2)
+            with self._ssh_tabs_lock:
+                # 既存のデータを読み込み
+                ssh_tabs_data = self.load_all_ssh_tabs_state()
+                
+                # 現在のセッションのデータを更新
+                ssh_tabs_data[session_id] = {
+                    "tabs": tabs_data,
+                    "last_updated": datetime.now().isoformat(),
+                    "session_id": session_id
+                }
+                
+                # ファイルに保存
+                self._write_ssh_tabs_file(ssh_tabs_data)
             
             logger.debug(f"SSH tabs state saved for session {session_id}: {len(tabs_data)} tabs")
             
@@ -245,6 +192,13 @@ class SessionManager:
         
         return []
     
+    def _write_ssh_tabs_file(self, ssh_tabs_data: Dict):
+        """一時ファイルに書いてから置き換える（読み込み側が書きかけのファイルを見ないように）"""
+        tmp_path = f"{self.ssh_tabs_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(ssh_tabs_data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.ssh_tabs_file)
+    
     def load_all_ssh_tabs_state(self) -> Dict:
         """すべてのSSHタブ状態データを読み込み"""
         if not os.path.exists(self.ssh_tabs_file):
@@ -265,37 +219,39 @@ class SessionManager:
             max_age_days: 保持する最大日数
         """
         try:
-            ssh_tabs_data = self.load_all_ssh_tabs_state()
-            current_time = datetime.now()
-            cutoff_time = current_time - timedelta(days=max_age_days)
-            
-            cleaned_data = {}
-            removed_count = 0
-            
-            for session_id, session_data in ssh_tabs_data.items():
-                try:
-                    last_updated_str = session_data.get('last_updated')
-                    if last_updated_str:
-                        last_updated = datetime.fromisoformat(last_updated_str)
-                        if last_updated > cutoff_time:
-                            cleaned_data[session_id] = session_data
-                        else:
-                            removed_count += 1
+            with self._ssh_tabs_lock:
+                self._cleanup_ssh_tabs_state(max_age_days)
+        except Exception as e:
+            logger.error(f"Error during SSH tabs state cleanup: {e}")
+    
+    def _cleanup_ssh_tabs_state(self, max_age_days: int):
+        ssh_tabs_data = self.load_all_ssh_tabs_state()
+        current_time = datetime.now()
+        cutoff_time = current_time - timedelta(days=max_age_days)
+        
+        cleaned_data = {}
+        removed_count = 0
+        
+        for session_id, session_data in ssh_tabs_data.items():
+            try:
+                last_updated_str = session_data.get('last_updated')
+                if last_updated_str:
+                    last_updated = datetime.fromisoformat(last_updated_str)
+                    if last_updated > cutoff_time:
+                        cleaned_data[session_id] = session_data
                     else:
-                        # last_updatedがない古いデータは削除
                         removed_count += 1
-                except Exception as e:
-                    logger.warning(f"Error processing SSH tabs state for session {session_id}: {e}")
+                else:
+                    # last_updatedがない古いデータは削除
                     removed_count += 1
-            
-            # クリーンアップしたデータを保存
-            if removed_count > 0:
-                with open(self.ssh_tabs_file, 'w', encoding='utf-8') as f:
-                    json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
-                logger.info(f"SSH tabs state cleanup: {removed_count} old entries removed")
-            
-        except Exception as e:
-            logger.error(f"Error during SSH tabs state cleanup: {e}")
+            except Exception as e:
+                logger.warning(f"Error processing SSH tabs state for session {session_id}: {e}")
+                removed_count += 1
+        
+        # クリーンアップしたデータを保存
+        if removed_count > 0:
+            self._write_ssh_tabs_file(cleaned_data)
+            logger.info(f"SSH tabs state cleanup: {removed_count} old entries removed")
 
 
 # グローバルインスタンス
@@ -308,13 +264,22 @@ def initialize_session_manager(app):
     # アプリケーション設定から値を取得
     session_dir = app.config.get('SESSION_FILE_DIR', 'config/flask_session')
     cleanup_interval = app.config.get('SESSION_CLEANUP_INTERVAL', 3600)  # 1時間
+    store = create_session_store(
+        app.config.get('SESSION_BACKEND', 'sqlite'),
+        app.config.get('SESSION_DB_PATH', os.path.join('config', 'sessions.db')),
+        max_entries=app.config.get('SESSION_CACHE_SIZE', 10000),
+        touch_interval=app.config.get('SESSION_TOUCH_INTERVAL', 60))
+    
+    # Flask sessionの保存先をセッションストアにする
+    app.session_interface = StoreSessionInterface(store)
     
-    session_manager = SessionManager(session_dir, cleanup_interval)
+    session_manager = SessionManager(session_dir, cleanup_interval, store=store)
     session_manager.start_cleanup_service()
     
     # アプリケーション終了時にクリーンアップサービスを停止
     import atexit
     atexit.register(session_manager.stop_cleanup_service)
+    atexit.register(store.close)
     
     logger.info("Session manager initialized")
 
@@ -0,0 +1,368 @@
+"""
+Session Store
+=============
+
+Flask セッションをサーバー側に保存するセッションインターフェース
+
+機能:
+- クッキーにはランダムなセッションIDのみを保存し、内容はサーバー側に保持
+- 最近使われたセッションをプロセス内のLRUキャッシュに保持（通常のリクエストはファイルI/Oなし）
+- 任意で SQLite (WAL) にも保存し、再起動後もセッションを維持
+- 内容が変わった時だけ保存し、有効期限の延長は一定間隔ごとにまとめて反映
+- 有効期限にインデックスを張り、期限切れの削除は1回の DELETE、統計は1回の集計クエリで取得
+
+セッションの内容は Flask 標準のセッションと同じ形式（タグ付きJSON）でシリアライズする。
+"""
+
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# 統計で使う経過時間の区分（時間）
+_AGE_BUCKETS = (("<1h", 0, 1), ("1-6h", 1, 6), ("6-24h", 6, 24), (">24h", 24, None))
+
+
+class _CachedSession:
+    __slots__ = ('data', 'expiry', 'updated', 'persisted_expiry')
+
+    def __init__(self, data: str, expiry: float, updated: float, persisted_expiry: Optional[float] = None):
+        self.data = data
+        self.expiry = expiry
+        self.updated = updated  # 最後に保存・延長した時刻
+        self.persisted_expiry = persisted_expiry  # SQLite に保存済みの有効期限
+
+
+class SqliteSessionBackend:
+    """
+    SQLite (WAL) にセッションを1行ずつ保存するバックエンド
+
+    expiry / updated にインデックスを張り、期限切れの削除をディレクトリの走査ではなく
+    インデックスの範囲削除で行う。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expiry REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions (expiry);
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated);
+        ''')
+        self._lock = threading.Lock()
+
+    def get(self, sid: str, now: float) -> Optional[_CachedSession]:
+        with self._lock:
+            row = self._conn.execute('SELECT data, expiry, updated FROM sessions WHERE sid = ? AND expiry > ?',
+                                     (sid, now)).fetchone()
+        if row is None:
+            return None
+        return _CachedSession(row[0], row[1], row[2], persisted_expiry=row[1])
+
+    def put(self, sid: str, entry: _CachedSession):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO sessions (sid, data, size, expiry, updated) VALUES (?, ?, ?, ?, ?)',
+                               (sid, entry.data, len(entry.data.encode('utf-8')), entry.expiry, entry.updated))
+
+    def touch(self, sid: str, entry: _CachedSession):
+        self.touch_many([(sid, entry)])
+
+    def touch_many(self, entries):
+        """
+        有効期限と更新時刻を書き込む（行が無い場合は内容ごと挿入する）
+
+        期限切れの削除と延長の反映が前後しても、メモリ上で有効なセッションの行が失われないようにする。
+        """
+        rows = [(sid, entry.data, len(entry.data.encode('utf-8')), entry.expiry, entry.updated)
+                for sid, entry in entries]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                'INSERT INTO sessions (sid, data, size, expiry, updated) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(sid) DO UPDATE SET expiry = excluded.expiry, updated = excluded.updated',
+                rows)
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def delete_expired(self, now: float, updated_before: Optional[float] = None) -> Tuple[int, int]:
+        """期限切れ（と updated_before より前から更新のない）セッションを削除し、(削除数, 残り数) を返す"""
+        with self._lock:
+            if updated_before is None:
+                deleted = self._conn.execute('DELETE FROM sessions WHERE expiry <= ?', (now,)).rowcount
+            else:
+                deleted = self._conn.execute('DELETE FROM sessions WHERE expiry <= ? OR updated < ?',
+                                             (now, updated_before)).rowcount
+            remaining = self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+        return deleted, remaining
+
+    def stats(self, now: float) -> Dict:
+        """セッション数・合計サイズ・最終更新時刻の範囲・経過時間ごとの件数を1回の集計クエリで取得"""
+        hour = 3600
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(updated), MAX(updated), '
+                'COALESCE(SUM(expiry <= :now), 0), '
+                'COALESCE(SUM(updated > :h1), 0), '
+                'COALESCE(SUM(updated <= :h1 AND updated > :h6), 0), '
+                'COALESCE(SUM(updated <= :h6 AND updated > :h24), 0), '
+                'COALESCE(SUM(updated <= :h24), 0) '
+                'FROM sessions',
+                {'now': now, 'h1': now - hour, 'h6': now - 6 * hour, 'h24': now - 24 * hour}).fetchone()
+        return {
+            'count': row[0],
+            'size': row[1],
+            'oldest': row[2],
+            'newest': row[3],
+            'expired': row[4],
+            'by_age': {name: count for (name, _low, _high), count in zip(_AGE_BUCKETS, row[5:])},
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """最近使われたセッションのLRUキャッシュ（任意で SQLite に永続化）"""
+
+    def __init__(self, max_entries: int = 10000, backend: Optional[SqliteSessionBackend] = None,
+                 touch_interval: float = 60.0):
+        """
+        SessionStoreを初期化
+
+        Args:
+            max_entries: メモリに保持するセッションの最大数。backend が無い場合、超えた分は
+                最も古く使われたものから破棄される（そのセッションはログアウト扱いになる）
+            backend: 永続化先（None の場合はメモリのみ）
+            touch_interval: 内容が変わらないリクエストでの有効期限の延長を永続化先へ反映する最小間隔（秒）
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.backend = backend
+        self.touch_interval = touch_interval
+        self._entries: 'OrderedDict[str, _CachedSession]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def kind(self) -> str:
+        return 'sqlite' if self.backend is not None else 'memory'
+
+    def get(self, sid: str) -> Optional[str]:
+        """有効なセッションのシリアライズ済みの内容を返す"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                if entry.expiry > now:
+                    self._entries.move_to_end(sid)
+                    self._hits += 1
+                    return entry.data
+                del self._entries[sid]
+            self._misses += 1
+        if self.backend is None:
+            return None
+        entry = self.backend.get(sid, now)
+        if entry is None:
+            return None
+        with self._lock:
+            self._cache(sid, entry)
+        return entry.data
+
+    def _cache(self, sid: str, entry: _CachedSession):
+        """キャッシュに入れる（ロックを保持して呼ぶ）"""
+        self._entries[sid] = entry
+        self._entries.move_to_end(sid)
+        while len(self._entries) > self.max_entries:
+            evicted, _entry = self._entries.popitem(last=False)
+            if self.backend is None:
+                logger.debug(f"Session {evicted[:8]}... evicted from the in-memory session store")
+
+    def save(self, sid: str, data: str, expiry: float):
+        now = time.time()
+        entry = _CachedSession(data, expiry, now)
+        if self.backend is not None:
+            self.backend.put(sid, entry)
+            entry.persisted_expiry = expiry
+        with self._lock:
+            self._cache(sid, entry)
+
+    def touch(self, sid: str, expiry: float):
+        """有効期限を延長（永続化先への書き込みは touch_interval ごと）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return
+            entry.expiry = expiry
+            entry.updated = now
+            if self.backend is None or (entry.persisted_expiry is not None
+                                        and expiry - entry.persisted_expiry < self.touch_interval):
+                return
+            entry.persisted_expiry = expiry
+        self.backend.touch(sid, entry)
+
+    def delete(self, sid: str):
+        with self._lock:
+            self._entries.pop(sid, None)
+        if self.backend is not None:
+            self.backend.delete(sid)
+
+    def delete_expired(self, max_age: Optional[float] = None) -> Tuple[int, int]:
+        """
+        期限切れのセッションを削除
+
+        Args:
+            max_age: 指定した場合、この秒数より長く更新のないセッションも削除する
+
+        Returns:
+            Tuple[削除されたセッション数, 残存セッション数]
+        """
+        now = time.time()
+        updated_before = now - max_age if max_age is not None else None
+        with self._lock:
+            expired = [sid for sid, entry in self._entries.items()
+                       if entry.expiry <= now or (updated_before is not None and entry.updated < updated_before)]
+            for sid in expired:
+                del self._entries[sid]
+            remaining = len(self._entries)
+            # 延長をまだ書き込んでいない有効なセッションは、削除の前に反映して行を残す
+            lagging = [(sid, entry) for sid, entry in self._entries.items() if entry.persisted_expiry != entry.expiry]
+            for _sid, entry in lagging:
+                entry.persisted_expiry = entry.expiry
+        if self.backend is not None:
+            self.backend.touch_many(lagging)
+            return self.backend.delete_expired(now, updated_before)
+        return len(expired), remaining
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            cached = len(self._entries)
+            hits, misses = self._hits, self._misses
+            if self.backend is None:
+                entries = list(self._entries.values())
+        if self.backend is not None:
+            summary = self.backend.stats(now)
+        else:
+            by_age = {name: 0 for name, _low, _high in _AGE_BUCKETS}
+            for entry in entries:
+                age_hours = (now - entry.updated) / 3600
+                for name, low, high in _AGE_BUCKETS:
+                    if age_hours >= low and (high is None or age_hours < high):
+                        by_age[name] += 1
+                        break
+            updated = [entry.updated for entry in entries]
+            summary = {
+                'count': len(entries),
+                'size': sum(len(entry.data.encode('utf-8')) for entry in entries),
+                'oldest': min(updated) if updated else None,
+                'newest': max(updated) if updated else None,
+                'expired': sum(1 for entry in entries if entry.expiry <= now),
+                'by_age': by_age,
+            }
+        summary.update({
+            'cached': cached,
+            'cache_hits': hits,
+            'cache_misses': misses,
+        })
+        return summary
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+def create_session_store(kind: str, db_path: str, max_entries: int = 10000, touch_interval: float = 60.0) -> SessionStore:
+    """
+    設定名からセッションストアを生成
+
+    Args:
+        kind: "memory"（プロセス内のみ）または "sqlite"（SQLite にも保存）
+        db_path: SQLiteデータベースのパス
+    """
+    if kind == 'sqlite':
+        return SessionStore(max_entries, SqliteSessionBackend(db_path), touch_interval=touch_interval)
+    if kind == 'memory':
+        return SessionStore(max_entries, touch_interval=touch_interval)
+    raise ValueError(f"Unknown session backend: {kind}")
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """内容をサーバー側に保存するセッション（クッキーにはセッションIDのみ）"""
+
+    def __init__(self, initial=None, sid: Optional[str] = None, new: bool = False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """SessionStore にセッションを保存する Flask のセッションインターフェース"""
+
+    serializer = session_json_serializer
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def open_session(self, app, request) -> ServerSideSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+                except Exception as e:
+                    logger.warning(f"Could not decode session data: {e}")
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session: ServerSideSession, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if not session:
+            # 空になったセッション（session.clear() 後など）は保存せずに削除する
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       samesite=samesite, httponly=httponly)
+            return
+
+        response.vary.add('Cookie')
+        expiry = time.time() + app.permanent_session_lifetime.total_seconds()
+        if session.modified or session.new:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expiry)
+        elif self.should_set_cookie(app, session):
+            self.store.touch(session.sid, expiry)
+        else:
+            return
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
@@ -0,0 +1,183 @@
+"""
+SFTP Transfer
+=============
+
+SSHタブのトランスポート上でSFTPのファイル転送をストリーミングで行うモジュール
+
+機能:
+- HTTPリクエストのボディを一定サイズごとにリモートファイルへ書き込み（ファイル全体をメモリに載せない）
+- リモートファイルを一定サイズごとに読み取って返すジェネレーター（HTTPレスポンスにそのまま渡す）
+- 書き込みのパイプライン化（サーバーの応答を待たずに次の書き込み要求を送る）
+- 読み取りの先読み（一定バイト数までの読み取り要求をまとめて送り、往復遅延を隠す）
+- 一定間隔での進捗通知
+- アップロードは一時ファイルに書き込んでから置き換える（途中で失敗しても既存のファイルを壊さない）
+
+先読みはバッファするバイト数を read_ahead までに抑えるため、HTTPクライアントの受信が
+遅い場合でもリモートファイル全体がメモリに溜まることはない。
+"""
+
+import errno
+import logging
+import os
+import posixpath
+import time
+from typing import BinaryIO, Callable, Dict, Iterator, Optional
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+
+class TransferProgress:
+    """転送の進捗を一定間隔でまとめて通知する"""
+
+    def __init__(self, callback: Callable[[Dict], None], total: Optional[int] = None, interval: float = 0.25):
+        """
+        TransferProgressを初期化
+
+        Args:
+            callback: {'bytes', 'total', 'done', 'error', 'rate'} を受け取る関数
+            total: 転送する総バイト数（不明な場合は None）
+            interval: 途中経過を通知する最小間隔（秒）
+        """
+        self._callback = callback
+        self.total = total
+        self.interval = interval
+        self.bytes = 0
+        self._started = time.monotonic()
+        self._last_report = 0.0
+        self._finished = False
+
+    def add(self, nbytes: int):
+        self.bytes += nbytes
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self._report(now, done=False)
+
+    def finish(self, error: Optional[str] = None):
+        """完了（または失敗）を通知（2回目以降の呼び出しは無視）"""
+        if self._finished:
+            return
+        self._finished = True
+        self._report(time.monotonic(), done=True, error=error)
+
+    def _report(self, now: float, done: bool, error: Optional[str] = None):
+        elapsed = now - self._started
+        try:
+            self._callback({
+                'bytes': self.bytes,
+                'total': self.total,
+                'done': done,
+                'error': error,
+                'rate': int(self.bytes / elapsed) if elapsed > 0 else None,  # バイト/秒
+            })
+        except Exception as e:
+            logger.error(f"Error in SFTP progress handler: {e}")
+
+
+def iter_remote_file(remote: paramiko.SFTPFile, size: int, chunk_size: int = 262144,
+                     read_ahead: int = 4 * 1024 * 1024,
+                     progress: Optional[TransferProgress] = None) -> Iterator[bytes]:
+    """
+    開いたリモートファイルを先頭から chunk_size ごとに返す
+
+    read_ahead バイト分の読み取り要求をまとめて送り、届いた順に返す。途中でファイルが
+    短くなった場合はそこで終了する（呼び出し側はファイルを閉じること）。
+
+    Args:
+        remote: 読み取りモードで開いた SFTPFile
+        size: 読み取るバイト数（開いた時点のファイルサイズ）
+        chunk_size: 1回に返す最大バイト数
+        read_ahead: 先行して要求する最大バイト数
+        progress: 進捗の通知先
+    """
+    chunk_size = max(1, int(chunk_size))
+    read_ahead = max(chunk_size, int(read_ahead))
+    offset = 0
+    while offset < size:
+        end = min(size, offset + read_ahead)
+        chunks = [(start, min(chunk_size, end - start)) for start in range(offset, end, chunk_size)]
+        for (_start, length), data in zip(chunks, remote.readv(chunks)):
+            if data:
+                offset += len(data)
+                if progress is not None:
+                    progress.add(len(data))
+                yield data
+            if len(data) < length:
+                logger.debug(f"Remote file became shorter while reading ({offset} of {size} bytes)")
+                return
+
+
+def _temporary_path(path: str) -> str:
+    directory, name = posixpath.split(path)
+    return posixpath.join(directory, f".{name}.{os.urandom(4).hex()}.part")
+
+
+def _replace(sftp: paramiko.SFTPClient, source: str, destination: str):
+    """source を destination に置き換える（posix-rename 拡張に対応していないサーバーでは削除してから改名）"""
+    try:
+        sftp.posix_rename(source, destination)
+        return
+    except IOError as e:
+        logger.debug(f"posix-rename is not available, falling back to rename: {e}")
+    try:
+        sftp.remove(destination)
+    except FileNotFoundError:
+        pass
+    sftp.rename(source, destination)
+
+
+def write_remote_file(sftp: paramiko.SFTPClient, path: str, stream: BinaryIO, chunk_size: int = 262144,
+                      expected_size: Optional[int] = None,
+                      progress: Optional[TransferProgress] = None) -> int:
+    """
+    ストリームの内容をリモートファイルに書き込む
+
+    同じディレクトリの一時ファイルにパイプライン化して書き込み、すべての書き込みが
+    成功してから path に置き換える。既存のファイルがあればそのパーミッションを引き継ぐ。
+
+    Args:
+        sftp: SFTPクライアント
+        path: 書き込み先のリモートパス
+        stream: read(size) で読めるストリーム（request.stream など）
+        chunk_size: 1回に読み取る最大バイト数
+        expected_size: 受け取るはずのバイト数（Content-Length。途中で途切れた場合はエラーにする）
+        progress: 進捗の通知先
+
+    Returns:
+        書き込んだバイト数
+
+    Raises:
+        IOError: リモートでの書き込み・置き換えに失敗、またはストリームが途中で途切れた
+    """
+    try:
+        mode = sftp.stat(path).st_mode
+    except FileNotFoundError:
+        mode = None
+    temporary = _temporary_path(path)
+    written = 0
+    try:
+        with sftp.open(temporary, 'wb') as remote:
+            remote.set_pipelined(True)
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                remote.write(data)
+                written += len(data)
+                if progress is not None:
+                    progress.add(len(data))
+        # close() で未確認の書き込み要求の応答をすべて受け取り、失敗していれば例外になる
+        if expected_size is not None and written != expected_size:
+            raise IOError(errno.EIO, f"Upload was interrupted ({written} of {expected_size} bytes received)")
+        if mode is not None:
+            sftp.chmod(temporary, mode & 0o7777)
+        _replace(sftp, temporary, path)
+    except BaseException:
+        try:
+            sftp.remove(temporary)
+        except Exception:
+            pass
+        raise
+    return written
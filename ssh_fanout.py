@@ -0,0 +1,181 @@
+"""
+SSH Fan-out
+===========
+
+同じコマンドを複数のサーバーで並行して実行するモジュール
+
+機能:
+- サーバーごとに exec_command でコマンドを実行（同時実行数の上限つき）
+- サーバーごとのタイムアウト（接続からコマンド終了まで）
+- stdout / stderr の出力を届いた順にイベントとして通知（UTF-8 はチャンク境界をまたいでもデコード）
+- サーバーごとの出力量の上限（超えた分は捨てて truncated を通知）
+
+接続の確立は呼び出し側から渡された関数が行う（プール済みのトランスポートの再利用や
+認証方法の選択は呼び出し側の責務）。接続関数はタイムアウトまでの残り時間（秒）を受け取り、
+その時間内に get_transport() と close() を持つ利用権（SshTransportLease など）を返すこと。
+
+通知するイベント:
+- {'type': 'start', 'server_id': ..., 'name': ...}
+- {'type': 'output', 'server_id': ..., 'stream': 'stdout' | 'stderr', 'data': str}
+- {'type': 'exit', 'server_id': ..., 'exit_status': int | None, 'error': str | None,
+   'duration': 秒, 'truncated': bool}
+"""
+
+import codecs
+import logging
+import select
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _HostTimeout(Exception):
+    pass
+
+
+class SshFanout:
+    """複数サーバーへのコマンド一括実行"""
+
+    def __init__(self, connect: Callable[[Dict, float], object], parallelism: int = 16, max_parallelism: int = 64,
+                 timeout: float = 60.0, max_output: int = 1024 * 1024, read_size: int = 32768):
+        """
+        SshFanoutを初期化
+
+        Args:
+            connect: (サーバー設定, 残り時間（秒）) を受け取り、接続済みトランスポートの利用権を返す関数
+            parallelism: 同時に実行するサーバー数の既定値
+            max_parallelism: 呼び出し側が指定できる同時実行数の上限
+            timeout: サーバーごとのタイムアウトの既定値（秒）
+            max_output: サーバーごとに通知する出力の上限（バイト）
+            read_size: 1回の recv で読み取る最大バイト数
+        """
+        self._connect = connect
+        self.parallelism = max(1, int(parallelism))
+        self.max_parallelism = max(1, int(max_parallelism))
+        self.timeout = timeout
+        self.max_output = max_output
+        self.read_size = read_size
+
+    def run(self, servers: Iterable[Dict], command: str, on_event: Callable[[Dict], None],
+            parallelism: Optional[int] = None, timeout: Optional[float] = None) -> Dict:
+        """
+        コマンドを全サーバーで実行し、すべて終わるまで待つ
+
+        on_event は複数のスレッドから呼ばれる。
+
+        Returns:
+            {'total', 'succeeded', 'failed', 'timed_out', 'duration'} の集計
+        """
+        servers = list(servers)
+        parallelism = min(self.max_parallelism, max(1, int(parallelism or self.parallelism)))
+        timeout = float(timeout or self.timeout)
+        started = time.monotonic()
+        summary = {'total': len(servers), 'succeeded': 0, 'failed': 0, 'timed_out': 0}
+        if servers:
+            with ThreadPoolExecutor(max_workers=min(parallelism, len(servers)), thread_name_prefix='ssh-fanout') as executor:
+                results = executor.map(lambda server: self._run_host(server, command, timeout, on_event), servers)
+                for result in results:
+                    summary[result] += 1
+        summary['duration'] = round(time.monotonic() - started, 3)
+        return summary
+
+    def _emit(self, on_event: Callable[[Dict], None], event: Dict):
+        try:
+            on_event(event)
+        except Exception as e:
+            logger.error(f"Error in fan-out event handler: {e}")
+
+    def _run_host(self, server: Dict, command: str, timeout: float, on_event: Callable[[Dict], None]) -> str:
+        """1台で実行し、結果の分類（'succeeded' / 'failed' / 'timed_out'）を返す"""
+        server_id = server.get('id')
+        self._emit(on_event, {'type': 'start', 'server_id': server_id, 'name': server.get('name', server_id)})
+        started = time.monotonic()
+        deadline = started + timeout
+        lease = None
+        channel = None
+        exit_status = None
+        error = None
+        truncated = False
+        try:
+            lease = self._connect(server, deadline - time.monotonic())
+            if time.monotonic() >= deadline:
+                raise _HostTimeout()
+            channel = lease.get_transport().open_session(timeout=max(0.1, deadline - time.monotonic()))
+            channel.exec_command(command)
+            exit_status, truncated = self._collect(channel, server_id, deadline, on_event)
+        except _HostTimeout:
+            error = 'timeout'
+        except Exception as e:
+            logger.debug(f"Fan-out command failed on {server_id}: {e}")
+            # 接続の待ち時間切れなど、期限を過ぎてから失敗した場合はタイムアウトとして扱う
+            error = 'timeout' if time.monotonic() >= deadline else (str(e) or e.__class__.__name__)
+        finally:
+            if channel is not None:
+                try:
+                    channel.close()
+                except Exception:
+                    pass
+            if lease is not None:
+                lease.close()
+        self._emit(on_event, {
+            'type': 'exit',
+            'server_id': server_id,
+            'exit_status': exit_status,
+            'error': error,
+            'duration': round(time.monotonic() - started, 3),
+            'truncated': truncated,
+        })
+        if error == 'timeout':
+            return 'timed_out'
+        return 'succeeded' if error is None and exit_status == 0 else 'failed'
+
+    def _collect(self, channel, server_id, deadline: float, on_event: Callable[[Dict], None]):
+        """コマンドの出力を読み取りながら通知し、(終了コード, 出力を切り捨てたか) を返す"""
+        decoders = {
+            'stdout': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+            'stderr': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        }
+        readers = {'stdout': channel.recv, 'stderr': channel.recv_stderr}
+        ready = {'stdout': channel.recv_ready, 'stderr': channel.recv_stderr_ready}
+        remaining_output = self.max_output
+        truncated = False
+
+        def drain():
+            nonlocal remaining_output, truncated
+            for stream in ('stdout', 'stderr'):
+                while ready[stream]():
+                    data = readers[stream](self.read_size)
+                    if not data:
+                        break
+                    if remaining_output <= 0:
+                        truncated = True
+                        continue
+                    if len(data) > remaining_output:
+                        data = data[:remaining_output]
+                        truncated = True
+                    remaining_output -= len(data)
+                    text = decoders[stream].decode(data)
+                    if text:
+                        self._emit(on_event, {'type': 'output', 'server_id': server_id, 'stream': stream, 'data': text})
+
+        while True:
+            drain()
+            remaining = deadline - time.monotonic()
+            if channel.eof_received or channel.closed:
+                # 出力は届き終わったので終了コードを待つ（切断された場合は paramiko が -1 を返す）
+                if not channel.status_event.wait(max(0.0, remaining)):
+                    raise _HostTimeout()
+                drain()
+                break
+            if remaining <= 0:
+                raise _HostTimeout()
+            # fileno() のパイプはデータ到着・EOF・クローズで通知状態になる
+            select.select([channel], [], [], remaining)
+
+        for stream, decoder in decoders.items():
+            text = decoder.decode(b'', final=True)
+            if text:
+                self._emit(on_event, {'type': 'output', 'server_id': server_id, 'stream': stream, 'data': text})
+        return channel.recv_exit_status(), truncated
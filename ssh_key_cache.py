@@ -0,0 +1,160 @@
+"""
+SSH Key Cache
+=============
+
+パース済みのSSH秘密鍵（paramiko.PKey）をプロセス内にキャッシュするモジュール
+
+機能:
+- 鍵の形式（RSA / ECDSA / Ed25519）の判定とパースを鍵ファイルごとに一度だけ実行
+- ssh_key_id をキーにした取得（パスまたはファイルの mtime / inode / サイズが変わった時だけ再読み込み）
+- /api/ssh_keys での鍵の編集・削除時の明示的な無効化
+- アップロード時に検証したパース結果を、その鍵を使う最初の接続で再利用
+- パース結果は鍵ファイルのパスごとに1つだけ保持し、どの鍵にも使われないものは一定時間後に破棄
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+# 判定を試す順序（先に一致した形式を採用する）
+KEY_TYPES = (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key)
+
+
+def load_private_key(path: str) -> Tuple[paramiko.PKey, str]:
+    """
+    鍵ファイルの形式を判定してパースする
+
+    Returns:
+        (パース済みの鍵, 形式名（'RSAKey' など）)
+
+    Raises:
+        paramiko.PasswordRequiredException: パスフレーズ付きの鍵
+        paramiko.SSHException: どの形式としても読み込めない
+        OSError: ファイルを読めない
+    """
+    errors = []
+    for key_type in KEY_TYPES:
+        try:
+            return key_type.from_private_key_file(path), key_type.__name__
+        except paramiko.PasswordRequiredException:
+            raise
+        except paramiko.SSHException as e:
+            errors.append(f"{key_type.__name__}: {e}")
+        except ValueError as e:
+            # 形式は合っているが内容を解釈できない鍵（未対応の曲線など）
+            errors.append(f"{key_type.__name__}: {e}")
+    raise paramiko.SSHException('; '.join(errors))
+
+
+def _file_version(path: str):
+    """鍵ファイルの変更検出用キー"""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+class _Parsed:
+    __slots__ = ('version', 'key', 'key_type', 'used')
+
+    def __init__(self, version: Tuple, key: paramiko.PKey, key_type: str, used: float):
+        self.version = version
+        self.key = key
+        self.key_type = key_type
+        self.used = used  # 最後に参照した時刻（time.monotonic）
+
+
+class SshKeyCache:
+    """パース済みSSH秘密鍵のキャッシュ"""
+
+    def __init__(self, unclaimed_ttl: float = 600.0):
+        """
+        SshKeyCacheを初期化
+
+        Args:
+            unclaimed_ttl: どの ssh_key_id からも使われていないパース結果（登録されなかった
+                アップロードの検証結果など）を保持する時間（秒）
+        """
+        self.unclaimed_ttl = unclaimed_ttl
+        self._parsed: Dict[str, _Parsed] = {}  # 鍵ファイルのパス -> パース結果（新しいバージョンで置き換える）
+        self._paths: Dict[str, str] = {}  # ssh_key_id -> 最後に使った鍵ファイルのパス
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def load(self, path: str) -> Tuple[paramiko.PKey, str]:
+        """
+        パスを指定して鍵を取得（キャッシュになければパースして保存）
+
+        アップロードされた鍵の検証に使うと、その鍵を使う最初の接続でパース結果を再利用できる。
+        どの ssh_key_id にも使われなかった場合は unclaimed_ttl 後に破棄する。
+        """
+        return self._load(path, _file_version(path))
+
+    def _load(self, path: str, version: Tuple) -> Tuple[paramiko.PKey, str]:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            cached = self._parsed.get(path)
+            if cached is not None and cached.version == version:
+                self._hits += 1
+                cached.used = now
+                return cached.key, cached.key_type
+        key, key_type = load_private_key(path)
+        with self._lock:
+            self._misses += 1
+            # 同じパスの古いバージョン（上書きされた鍵ファイル）は置き換える
+            self._parsed[path] = _Parsed(version, key, key_type, now)
+        logger.debug(f"Parsed SSH key {path} as {key_type}")
+        return key, key_type
+
+    def _prune(self, now: float):
+        """どの ssh_key_id にも使われず、unclaimed_ttl より長く参照されていないパース結果を捨てる（ロックを保持して呼ぶ）"""
+        claimed = set(self._paths.values())
+        for path in [path for path, parsed in self._parsed.items()
+                     if path not in claimed and now - parsed.used > self.unclaimed_ttl]:
+            del self._parsed[path]
+
+    def _release(self, path: str):
+        """他の ssh_key_id が使っていなければパスのパース結果を捨てる（ロックを保持して呼ぶ）"""
+        if path not in self._paths.values():
+            self._parsed.pop(path, None)
+
+    def get(self, key_id: str, path: str) -> Tuple[paramiko.PKey, str]:
+        """
+        ssh_key_id の鍵を取得
+
+        Args:
+            key_id: SSH鍵のID
+            path: 鍵ファイルのパス（展開済み）
+
+        Returns:
+            (パース済みの鍵, 形式名)
+        """
+        version = _file_version(path)
+        with self._lock:
+            previous = self._paths.get(key_id)
+            self._paths[key_id] = path
+            if previous is not None and previous != path:
+                # 鍵のパスが変更されたので古いパース結果を捨てる
+                self._release(previous)
+        return self._load(path, version)
+
+    def invalidate(self, key_id: Optional[str] = None):
+        """鍵のキャッシュを破棄（key_id が None の場合はすべて）"""
+        with self._lock:
+            if key_id is None:
+                self._parsed.clear()
+                self._paths.clear()
+                return
+            path = self._paths.pop(key_id, None)
+            if path is not None:
+                self._release(path)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'keys': len(self._parsed), 'hits': self._hits, 'misses': self._misses}
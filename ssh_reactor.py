@@ -0,0 +1,350 @@
+"""
+SSH Reactor
+===========
+
+全SSHチャネルの受信を1つのスレッドで多重化するモジュール
+
+機能:
+- paramiko チャネルの fileno() をセレクターに登録し、データ到着時だけ起床
+- チャネルごとの出力バッファ（サイズしきい値か遅延期限のどちらか早い方で送出）
+- 対話的な出力（しばらく無出力だった後の出力・入力直後のエコー）は即時送出
+- クライアントの受信確認（ack）によるフロー制御（未確認バイト数が上限に達したら読み取りを停止）
+- EOF / クローズ / トランスポート切断の検出と通知
+
+paramiko はチャネルのバッファにデータが入ったとき、および EOF やクローズ
+（トランスポートの切断を含む）を受けたときに fileno() のパイプを通知状態にする。
+そのためアイドル中のチャネルはCPUを消費しない。
+
+読み取りを止めたチャネルは paramiko の受信ウィンドウが尽きた時点でリモートへ
+WINDOW_ADJUST を返さなくなるため、リモートの送信も止まる（TCPの背圧が相手まで届く）。
+
+注意: Channel.close() は fileno() のパイプを閉じるため、チャネルを明示的に
+閉じる場合は先に unregister() を呼ぶこと。
+"""
+
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Registration:
+    __slots__ = ('channel', 'fileno', 'on_data', 'on_close', 'closed',
+                 'buffer', 'flush_at', 'last_flush', 'interactive',
+                 'window', 'unacked', 'paused')
+
+    def __init__(self, channel, on_data: Callable[[bytes], None], on_close: Callable[[str], None],
+                 window: Optional[int] = None):
+        self.channel = channel
+        self.fileno = channel.fileno()
+        self.on_data = on_data
+        self.on_close = on_close
+        self.closed = False
+        self.buffer = bytearray()  # 送出待ちの出力
+        self.flush_at: Optional[float] = None  # 送出待ちの出力を送る期限
+        self.last_flush = 0.0
+        self.interactive = False  # 入力直後で、次の出力を即時送出する
+        self.window = window  # 未確認のまま送ってよい最大バイト数（None の場合は無制限）
+        self.unacked = 0  # 送出済みでクライアントの受信確認がないバイト数
+        self.paused = False  # ウィンドウが尽きて読み取りを停止中
+
+
+class SshReactor:
+    """paramiko チャネルの受信を待ち受けるI/Oリアクター"""
+
+    def __init__(self, read_size: int = 32768, max_read_per_wakeup: int = 262144,
+                 flush_bytes: int = 65536, flush_delay: float = 0.008):
+        """
+        SshReactorを初期化
+
+        Args:
+            read_size: 1回の recv で読み取る最大バイト数
+            max_read_per_wakeup: 1回の起床で1チャネルから読み取る最大バイト数
+                （大量出力のチャネルが他のチャネルを待たせないための上限）
+            flush_bytes: 出力バッファがこのサイズに達したら即時送出
+            flush_delay: 連続する出力をまとめる最大遅延（秒）
+        """
+        self.read_size = read_size
+        self.max_read_per_wakeup = max_read_per_wakeup
+        self.flush_bytes = flush_bytes
+        self.flush_delay = flush_delay
+        self._flush_heap = []  # (送出期限, 連番, 登録情報)。期限が変わったエントリは取り出し時に捨てる
+        self._counter = itertools.count()
+        self._selector = selectors.DefaultSelector()
+        self._registrations: Dict[int, _Registration] = {}  # id(channel) をキーにした登録情報
+        self._pending = []  # リアクタースレッドで反映する ('add' / 'resume' / 'remove', 登録情報)
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._registrations)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ssh-reactor', daemon=True)
+            self._thread.start()
+
+    def register(self, channel, on_data: Callable[[bytes], None], on_close: Callable[[str], None],
+                 window: Optional[int] = None):
+        """
+        チャネルを登録
+
+        Args:
+            channel: paramiko.Channel（settimeout(0.0) 済みであること）
+            on_data: まとめた出力（bytes）を受け取る関数（リアクタースレッドから呼ばれる）
+            on_close: チャネル終了時に理由（'eof' / 'closed' / 'error'）を受け取る関数
+            window: クライアントの受信確認なしに送ってよい最大バイト数（None の場合はフロー制御なし）
+        """
+        self.start()
+        registration = _Registration(channel, on_data, on_close, window)
+        with self._lock:
+            self._registrations[id(channel)] = registration
+            self._pending.append(('add', registration))
+        self._wake()
+
+    def unregister(self, channel):
+        """チャネルの登録を解除（on_close は呼ばれない）"""
+        with self._lock:
+            registration = self._registrations.pop(id(channel), None)
+            if registration is None:
+                return
+            registration.closed = True
+            self._pending.append(('remove', registration))
+        self._wake()
+
+    def mark_interactive(self, channel):
+        """ユーザー入力があったことを通知（次の出力はまとめずに即時送出する）"""
+        with self._lock:
+            registration = self._registrations.get(id(channel))
+        if registration is not None:
+            registration.interactive = True
+
+    def ack(self, channel, nbytes: int):
+        """
+        クライアントが処理し終えたバイト数を通知
+
+        未確認バイト数がウィンドウの半分まで減ったら、停止していた読み取りを再開する。
+        """
+        with self._lock:
+            registration = self._registrations.get(id(channel))
+            if registration is None or registration.window is None:
+                return
+            registration.unacked = max(0, registration.unacked - max(0, int(nbytes)))
+            if not registration.paused or registration.unacked > registration.window // 2:
+                return
+            registration.paused = False
+            self._pending.append(('resume', registration))
+        self._wake()
+
+    def set_window(self, channel, window: Optional[int]):
+        """
+        送信ウィンドウを変更し、未確認バイト数をリセット
+
+        クライアントが切断された（受信確認が届かない）チャネルは None にして読み取りを続け、
+        再接続したクライアントの分から改めてフロー制御する。
+        """
+        with self._lock:
+            registration = self._registrations.get(id(channel))
+            if registration is None:
+                return
+            registration.window = window
+            registration.unacked = 0
+            if not registration.paused:
+                return
+            registration.paused = False
+            self._pending.append(('resume', registration))
+        self._wake()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            registrations = list(self._registrations.values())
+        return {
+            'channels': len(registrations),
+            'paused': sum(1 for r in registrations if r.paused),
+            'unacked_bytes': sum(r.unacked for r in registrations),
+            'buffered_bytes': sum(len(r.buffer) for r in registrations),
+        }
+
+    def _wake(self):
+        try:
+            self._wakeup_w.send(b'\x00')
+        except (BlockingIOError, OSError):
+            # 既に起床待ちのデータが溜まっている
+            pass
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for action, registration in pending:
+            if action == 'add':
+                if registration.closed:
+                    continue
+                try:
+                    self._selector.register(registration.fileno, selectors.EVENT_READ, registration)
+                except (KeyError, ValueError, OSError) as e:
+                    logger.error(f"Could not register SSH channel with reactor: {e}")
+                    self._close(registration, 'error')
+                    continue
+                # 登録前に届いていたデータや終了を取りこぼさない
+                self._service(registration)
+            elif action == 'resume':
+                if registration.closed or registration.paused:
+                    continue
+                try:
+                    self._selector.register(registration.fileno, selectors.EVENT_READ, registration)
+                except (KeyError, ValueError, OSError) as e:
+                    logger.error(f"Could not resume SSH channel: {e}")
+                    self._close(registration, 'error')
+                    continue
+                self._service(registration)
+            else:
+                self._unregister_fileno(registration)
+
+    def _unregister_fileno(self, registration: _Registration):
+        key = self._selector.get_map().get(registration.fileno)
+        if key is not None and key.data is registration:
+            try:
+                self._selector.unregister(registration.fileno)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _close(self, registration: _Registration, reason: str):
+        self._unregister_fileno(registration)
+        self._flush(registration, time.monotonic())
+        with self._lock:
+            if registration.closed:
+                return
+            registration.closed = True
+            self._registrations.pop(id(registration.channel), None)
+        try:
+            registration.on_close(reason)
+        except Exception as e:
+            logger.error(f"Error in SSH channel close handler: {e}")
+        try:
+            # fileno() のパイプを解放する（終了コードなどはクローズ後も参照できる）
+            registration.channel.close()
+        except Exception:
+            pass
+
+    def _service(self, registration: _Registration):
+        """受信可能なデータを読み取ってコールバックに渡し、終了していれば通知"""
+        if registration.closed:
+            return
+        channel = registration.channel
+        limit = self.max_read_per_wakeup
+        if registration.window is not None:
+            with self._lock:
+                credit = registration.window - registration.unacked - len(registration.buffer)
+                if credit <= 0:
+                    # ウィンドウが尽きたので ack が届くまで読み取りを止める
+                    registration.paused = True
+            if credit <= 0:
+                self._unregister_fileno(registration)
+                return
+            limit = min(limit, credit)
+        chunks = []
+        size = 0
+        try:
+            while size < limit:
+                read_size = min(self.read_size, limit - size)
+                if channel.recv_ready():
+                    data = channel.recv(read_size)
+                elif channel.recv_stderr_ready():
+                    data = channel.recv_stderr(read_size)
+                else:
+                    break
+                if not data:
+                    break
+                chunks.append(data)
+                size += len(data)
+        except socket.timeout:
+            pass
+        except Exception as e:
+            logger.debug(f"SSH channel read error: {e}")
+            self._buffer(registration, chunks)
+            self._close(registration, 'error')
+            return
+
+        self._buffer(registration, chunks)
+        if (channel.closed or channel.eof_received) and not channel.recv_ready():
+            self._close(registration, 'closed' if channel.closed else 'eof')
+
+    def _buffer(self, registration: _Registration, chunks):
+        """
+        受信データを出力バッファに追加し、送出するか期限を設定する
+
+        しばらく無出力だったチャネルの出力（キー入力のエコーなど）と入力直後の出力は
+        即時に送出し、続けて届く大量出力はサイズか期限に達するまでまとめる。
+        """
+        if not chunks:
+            return
+        now = time.monotonic()
+        idle = not registration.buffer and now - registration.last_flush >= self.flush_delay
+        for chunk in chunks:
+            registration.buffer += chunk
+        if registration.interactive or idle or len(registration.buffer) >= self.flush_bytes:
+            self._flush(registration, now)
+        elif registration.flush_at is None:
+            registration.flush_at = now + self.flush_delay
+            heapq.heappush(self._flush_heap, (registration.flush_at, next(self._counter), registration))
+
+    def _flush(self, registration: _Registration, now: float):
+        registration.flush_at = None
+        registration.interactive = False
+        if not registration.buffer:
+            return
+        data = bytes(registration.buffer)
+        registration.buffer.clear()
+        registration.last_flush = now
+        if registration.closed:
+            return
+        if registration.window is not None:
+            with self._lock:
+                registration.unacked += len(data)
+        try:
+            registration.on_data(data)
+        except Exception as e:
+            logger.error(f"Error in SSH channel data handler: {e}")
+
+    def _flush_due(self, now: float) -> Optional[float]:
+        """期限に達した出力を送出し、次の期限までの秒数を返す"""
+        while self._flush_heap:
+            flush_at, _count, registration = self._flush_heap[0]
+            if registration.flush_at != flush_at:
+                heapq.heappop(self._flush_heap)
+                continue
+            if flush_at > now:
+                return flush_at - now
+            heapq.heappop(self._flush_heap)
+            self._flush(registration, now)
+        return None
+
+    def _run(self):
+        while True:
+            try:
+                self._apply_pending()
+                timeout = self._flush_due(time.monotonic())
+                for key, _mask in self._selector.select(timeout):
+                    if key.data is None:
+                        try:
+                            while self._wakeup_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    self._service(key.data)
+            except Exception as e:
+                logger.error(f"SSH reactor loop error: {e}")
@@ -0,0 +1,309 @@
+"""
+SSH Transport Pool
+==================
+
+接続先と認証情報が同じSSH接続（paramiko.Transport）を複数のタブで共有するモジュール
+
+機能:
+- (ホスト, ポート, ユーザー名, 認証情報) をキーにした接続済み SSHClient のプール
+- 既存のトランスポート上に新しいチャネルを開くことで鍵交換と認証を省略
+- 参照数（開いているチャネル数）の管理と、参照がなくなった接続のアイドル期限切れでの切断
+- トランスポートあたりのチャネル数の上限（サーバー側 MaxSessions を超えないため）
+- 同じキーへの接続が進行中の場合はその完了を待って再利用（同時に開いた複数タブの鍵交換を1回にまとめる）
+- タブのトランスポートを共有したSFTPチャネル（ファイル転送用）
+
+プールから取得した SshTransportLease は SSHClient の代わりに保持し、close() で
+自身が開いたチャネルを閉じて参照を返す。切断済みのトランスポートはプールから取り除く。
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+
+def transport_pool_key(hostname: str, port: int, username: str, ssh_key_id: Optional[str] = None,
+                       password: Optional[str] = None, ssh_options: str = '') -> Tuple:
+    """
+    プールのキーを作成
+
+    パスワードはキーに平文で残さないようハッシュ化する。接続方法を変える SSH オプション
+    （ProxyCommand など）が異なる接続は共有しない。
+    """
+    if ssh_key_id:
+        identity = ('key', ssh_key_id)
+    elif password:
+        identity = ('password', hashlib.sha256(password.encode('utf-8')).hexdigest())
+    else:
+        identity = ('none', None)
+    return (hostname, int(port or 22), username, identity, (ssh_options or '').strip())
+
+
+class _PooledTransport:
+    __slots__ = ('key', 'client', 'refcount', 'idle_since', 'timer', 'closed')
+
+    def __init__(self, key: Tuple, client: paramiko.SSHClient):
+        self.key = key
+        self.client = client
+        self.refcount = 0
+        self.idle_since: Optional[float] = None
+        self.timer: Optional[threading.Timer] = None
+        self.closed = False
+
+    def is_active(self) -> bool:
+        transport = self.client.get_transport()
+        return not self.closed and transport is not None and transport.is_active()
+
+
+class SshTransportLease:
+    """プール内のトランスポートの利用権（タブ1つ分）"""
+
+    def __init__(self, pool: 'SshTransportPool', entry: _PooledTransport, reused: bool):
+        self._pool = pool
+        self._entry = entry
+        self.reused = reused  # 既存のトランスポートを再利用した場合は True
+        self.channel: Optional[paramiko.Channel] = None
+        self.sftp: Optional[paramiko.SFTPClient] = None
+        self._released = False
+
+    @property
+    def client(self) -> paramiko.SSHClient:
+        return self._entry.client
+
+    def get_transport(self) -> Optional[paramiko.Transport]:
+        return self._entry.client.get_transport()
+
+    def open_shell(self, window_size: Optional[int] = None, term: str = 'vt100',
+                   width: int = 80, height: int = 24) -> paramiko.Channel:
+        """
+        トランスポート上にPTY付きのシェルチャネルを開く
+
+        Args:
+            window_size: チャネルの受信ウィンドウ（None の場合は paramiko の既定値）
+        """
+        transport = self.get_transport()
+        if transport is None or not transport.is_active():
+            raise paramiko.SSHException('SSH transport is not active')
+        channel = transport.open_session(window_size=window_size)
+        try:
+            channel.get_pty(term, width, height)
+            channel.invoke_shell()
+        except Exception:
+            channel.close()
+            raise
+        self.channel = channel
+        return channel
+
+    def open_sftp(self, window_size: Optional[int] = None) -> paramiko.SFTPClient:
+        """トランスポート上にSFTPチャネルを開く"""
+        transport = self.get_transport()
+        if transport is None or not transport.is_active():
+            raise paramiko.SSHException('SSH transport is not active')
+        self.sftp = paramiko.SFTPClient.from_transport(transport, window_size=window_size)
+        return self.sftp
+
+    def share(self) -> 'SshTransportLease':
+        """
+        同じトランスポートの利用権をもう1つ取得
+
+        ファイル転送など一時的なチャネル用。元の利用権が先に閉じられてもトランスポートは
+        維持される。チャネル数の上限は適用しないため、サーバーの MaxSessions には
+        max_channels を超える分の余裕を残しておくこと。
+        """
+        return self._pool._share(self._entry)
+
+    def close(self):
+        """開いたチャネルを閉じて参照を返す（複数回呼んでもよい）"""
+        if self._released:
+            return
+        self._released = True
+        if self.sftp is not None:
+            try:
+                self.sftp.close()
+            except Exception:
+                pass
+        if self.channel is not None:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+        self._pool._release(self._entry)
+
+
+class SshTransportPool:
+    """接続済みSSHトランスポートのプール"""
+
+    def __init__(self, idle_timeout: float = 60.0, max_channels: int = 8):
+        """
+        SshTransportPoolを初期化
+
+        Args:
+            idle_timeout: 参照がなくなった接続を維持する時間（秒、0で即時切断）
+            max_channels: 1つのトランスポートで同時に開くチャネルの最大数
+        """
+        self.idle_timeout = idle_timeout
+        self.max_channels = max(1, int(max_channels))
+        self._entries: Dict[Tuple, List[_PooledTransport]] = {}
+        self._connecting: Dict[Tuple, Tuple[threading.Event, int]] = {}  # キー -> (接続完了通知, 接続中のスレッドID)
+        self._lock = threading.Lock()
+        self._connects = 0
+        self._reuses = 0
+
+    def acquire(self, key: Tuple, wait: float = 0.0) -> Optional[SshTransportLease]:
+        """
+        キーに一致する接続済みトランスポートの利用権を取得
+
+        Args:
+            wait: 同じキーへの接続を別のスレッドが進めている場合に、その完了を待つ最大時間（秒）。
+                0 より大きい場合、None を返した呼び出し元がそのキーの接続担当になるため、
+                接続後に add() を呼ぶこと（失敗した場合は end_connect() を呼ぶ）。待ち時間が
+                切れた場合は担当を引き継がずに None を返す（接続して add() してよい）
+
+        Returns:
+            再利用できるトランスポートがない場合は None（呼び出し側で接続して add() する）
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            with self._lock:
+                lease, dead = self._lease_existing(key)
+                pending = self._connecting.get(key)
+                if (lease is not None or not wait or pending is None
+                        or pending[1] == threading.get_ident() or time.monotonic() >= deadline):
+                    if lease is None and wait and pending is None:
+                        self._connecting[key] = (threading.Event(), threading.get_ident())
+                    break
+            for entry in dead:
+                self._close(entry)
+            # 別のスレッドが接続中なので、完了を待ってからもう一度探す
+            pending[0].wait(max(0.0, deadline - time.monotonic()))
+        for entry in dead:
+            self._close(entry)
+        return lease
+
+    def _lease_existing(self, key: Tuple):
+        """利用できるトランスポートの利用権と、切断済みで取り除いたエントリを返す（ロックを保持して呼ぶ）"""
+        dead = []
+        lease = None
+        for entry in self._entries.get(key, []):
+            if not entry.is_active():
+                dead.append(entry)
+                continue
+            if entry.refcount >= self.max_channels:
+                continue
+            entry.refcount += 1
+            entry.idle_since = None
+            if entry.timer is not None:
+                entry.timer.cancel()
+                entry.timer = None
+            self._reuses += 1
+            lease = SshTransportLease(self, entry, reused=True)
+            break
+        for entry in dead:
+            self._remove(entry)
+        return lease, dead
+
+    def end_connect(self, key: Optional[Tuple] = None):
+        """
+        このスレッドが担当していた接続を終了扱いにし、待っているスレッドを起こす
+
+        Args:
+            key: 対象のキー（None の場合はこのスレッドが担当しているすべてのキー）
+        """
+        ident = threading.get_ident()
+        with self._lock:
+            keys = [k for k, (_event, owner) in self._connecting.items()
+                    if owner == ident and (key is None or k == key)]
+            events = [self._connecting.pop(k)[0] for k in keys]
+        for event in events:
+            event.set()
+
+    def add(self, key: Tuple, client: paramiko.SSHClient) -> SshTransportLease:
+        """接続したばかりの SSHClient をプールに加え、その利用権を返す"""
+        entry = _PooledTransport(key, client)
+        entry.refcount = 1
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self._connects += 1
+            # 担当が別のスレッド（待ち時間切れで並行して接続した場合）なら、その完了時に起こす
+            pending = self._connecting.get(key)
+            if pending is not None and pending[1] == threading.get_ident():
+                del self._connecting[key]
+            else:
+                pending = None
+        if pending is not None:
+            pending[0].set()
+        return SshTransportLease(self, entry, reused=False)
+
+    def _share(self, entry: _PooledTransport) -> SshTransportLease:
+        with self._lock:
+            if not entry.is_active():
+                raise paramiko.SSHException('SSH transport is not active')
+            entry.refcount += 1
+            entry.idle_since = None
+            if entry.timer is not None:
+                entry.timer.cancel()
+                entry.timer = None
+        return SshTransportLease(self, entry, reused=True)
+
+    def _remove(self, entry: _PooledTransport):
+        """プールから取り除く（ロックを保持して呼ぶ）"""
+        entries = self._entries.get(entry.key)
+        if entries and entry in entries:
+            entries.remove(entry)
+            if not entries:
+                del self._entries[entry.key]
+
+    def _close(self, entry: _PooledTransport):
+        entry.closed = True
+        try:
+            entry.client.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled SSH transport: {e}")
+
+    def _release(self, entry: _PooledTransport):
+        with self._lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            if entry.refcount > 0:
+                return
+            if self.idle_timeout and entry.is_active():
+                entry.idle_since = time.monotonic()
+                entry.timer = threading.Timer(self.idle_timeout, self._expire, args=(entry, entry.idle_since))
+                entry.timer.daemon = True
+                entry.timer.start()
+                return
+            self._remove(entry)
+        self._close(entry)
+
+    def _expire(self, entry: _PooledTransport, idle_since: float):
+        with self._lock:
+            if entry.refcount > 0 or entry.idle_since != idle_since:
+                return
+            self._remove(entry)
+        self._close(entry)
+        logger.debug(f"Idle SSH transport to {entry.key[0]}:{entry.key[1]} closed")
+
+    def close_all(self):
+        with self._lock:
+            entries = [entry for entries in self._entries.values() for entry in entries]
+            self._entries.clear()
+        for entry in entries:
+            if entry.timer is not None:
+                entry.timer.cancel()
+            self._close(entry)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = [entry for entries in self._entries.values() for entry in entries]
+            return {
+                'transports': len(entries),
+                'idle': sum(1 for entry in entries if entry.refcount == 0),
+                'channels': sum(entry.refcount for entry in entries),
+                'connects': self._connects,
+                'reuses': self._reuses,
+                'connecting': len(self._connecting),
+            }
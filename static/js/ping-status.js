@@ -6,8 +6,14 @@ window.PingStatus = {
     initialize: function() {
         this.socket = io();
 
-        this.socket.on('ping_status_update', (data) => {
-            this.updatePingStatus(data.server_id, data);
+        // Ping状態は変化のあったサーバー分だけまとめて届く
+        this.socket.on('ping_status_batch', (data) => {
+            (data.updates || []).forEach(status => this.updatePingStatus(status.server_id, status));
+        });
+
+        // 接続直後に全サーバーの最新状態が届く
+        this.socket.on('ping_status_snapshot', (data) => {
+            (data.statuses || []).forEach(status => this.updatePingStatus(status.server_id, status));
         });
 
         this.socket.on('extra_import_finished', () => {
@@ -20,8 +26,7 @@ window.PingStatus = {
             }
         });
 
-        // 初回ロード時にPingステータスを更新
-        this.updatePingStatus();
+        // 初回ロード時のPingステータスは ping_status_snapshot で受け取る
     },
 
     // Pingステータスの更新関数
@@ -100,8 +100,14 @@ document.addEventListener('DOMContentLoaded', function() {
     // Socket.IOクライアントの初期化
     const socket = io();
 
-    socket.on('ping_status_update', function(data) {
-        updatePingStatus(data.server_id, data);
+    // Ping状態は変化のあったサーバー分だけまとめて届く
+    socket.on('ping_status_batch', function(data) {
+        (data.updates || []).forEach(status => updatePingStatus(status.server_id, status));
+    });
+
+    // 接続直後に全サーバーの最新状態が届く
+    socket.on('ping_status_snapshot', function(data) {
+        (data.statuses || []).forEach(status => updatePingStatus(status.server_id, status));
     });
 
     socket.on('extra_import_finished', function() {
@@ -110,8 +116,7 @@ document.addEventListener('DOMContentLoaded', function() {
         updateMainPageServerCards(); // メインページも更新
     });
 
-    // 初回ロード時にPingステータスを更新
-    updatePingStatus();
+    // 初回ロード時のPingステータスは ping_status_snapshot で受け取る
 
     // メインページのサーバーカードを更新する関数
     window.updateMainPageServerCards = function updateMainPageServerCards() {
@@ -268,6 +273,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (pingEnabledElement) {
                     pingEnabledElement.checked = server.ping_enabled || false;
                 }
+                const probeModeElement = document.getElementById('editProbeMode');
+                if (probeModeElement) {
+                    probeModeElement.value = server.probe_mode || 'icmp';
+                }
 
                 // 認証方法を設定
                 const authMethodSelect = document.getElementById('editAuthMethod');
@@ -1045,6 +1054,8 @@ document.addEventListener('DOMContentLoaded', function() {
                         if (editServerDescriptionElement) editServerDescriptionElement.value = server.description || '';
                         if (editServerTagsElement) editServerTagsElement.value = server.tags ? server.tags.join(', ') : '';
                         editPingEnabledElement.checked = server.ping_enabled || false;
+                        const editProbeModeElement = document.getElementById('editProbeMode');
+                        if (editProbeModeElement) editProbeModeElement.value = server.probe_mode || 'icmp';
 
                         const authMethodSelect = document.getElementById('editAuthMethod');
                         const usernameInput = document.getElementById('editServerUsername');
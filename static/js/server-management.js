@@ -192,6 +192,10 @@ window.ServerManagement = {
         if (pingEnabledElement) {
             pingEnabledElement.checked = server.ping_enabled || false;
         }
+        const probeModeElement = document.getElementById('editProbeMode');
+        if (probeModeElement) {
+            probeModeElement.value = server.probe_mode || 'icmp';
+        }
 
         // 親ホスト設定
         this.setupParentHostField(server);
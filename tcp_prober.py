@@ -0,0 +1,233 @@
+"""
+TCP Prober
+==========
+
+TCPポートへの接続可否で疎通確認を行うモジュール
+
+機能:
+- 1つのセレクタースレッドでノンブロッキング connect を多数同時に待機
+- 接続完了までの時間を応答時間として計測
+- SSHモードでは接続後にサーバーのバナー（"SSH-"）の受信まで確認
+- 同時に開くソケット数の上限（超えた分は待ち行列で順番待ち）
+
+ICMP を遮断しているホストでも、SSH ポートに到達できればオンラインと判定できる。
+結果は ping_host() と同じ形式の辞書でコールバックに渡す。
+"""
+
+import errno
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SSH_BANNER_PREFIX = b'SSH-'
+
+# ノンブロッキング connect が「接続中」を示すエラー番号（10035 は Windows の WSAEWOULDBLOCK）
+_CONNECT_PENDING = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035}
+
+
+class _TcpProbe:
+    __slots__ = ('host', 'address', 'port', 'read_banner', 'callback', 'timeout',
+                 'sock', 'started_at', 'deadline', 'rtt', 'done')
+
+    def __init__(self, host: str, port: int, read_banner: bool, callback: Callable[[Dict], None], timeout: float):
+        self.host = host
+        self.address = None
+        self.port = port
+        self.read_banner = read_banner
+        self.callback = callback
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self.started_at = 0.0
+        self.deadline = 0.0
+        self.rtt: Optional[float] = None
+        self.done = False
+
+
+class TcpProber:
+    """セレクターでノンブロッキング connect を多重化するプローバー"""
+
+    def __init__(self, timeout: float = 2.0, max_in_flight: int = 1024, resolver_workers: int = 8,
+                 getaddrinfo: Callable = socket.getaddrinfo):
+        """
+        TcpProberを初期化
+
+        Args:
+            timeout: 接続（とバナー受信）を待つ最大時間（秒）
+            max_in_flight: 同時に開くソケットの最大数
+            resolver_workers: 名前解決を行うスレッド数
+            getaddrinfo: 名前解決に使う関数（socket.getaddrinfo と同じ形式。DnsCache.getaddrinfo など）
+        """
+        self.timeout = timeout
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._getaddrinfo = getaddrinfo
+        self._resolver = ThreadPoolExecutor(max_workers=max(1, int(resolver_workers)), thread_name_prefix='tcp-probe-resolve')
+        self._selector = selectors.DefaultSelector()
+        self._queue = deque()  # 名前解決済みで connect 待ちのプローブ
+        self._lock = threading.Lock()
+        self._deadlines = []  # (期限, 連番, プローブ)
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='tcp-prober', daemon=True)
+            self._thread.start()
+
+    def submit(self, host: str, port: int, callback: Callable[[Dict], None],
+               read_banner: bool = False, timeout: Optional[float] = None):
+        """
+        TCPプローブを開始（結果は callback に渡される）
+
+        Args:
+            host: ホスト名またはIPアドレス
+            port: 接続するポート
+            callback: ping_host() と同じ形式の辞書を受け取る関数
+            read_banner: 接続後にSSHバナーの受信まで確認するか
+            timeout: このプローブのタイムアウト（秒）。None の場合は既定値
+        """
+        self.start()
+        probe = _TcpProbe(host, int(port), read_banner, callback, self.timeout if timeout is None else timeout)
+        self._resolver.submit(self._resolve, probe)
+
+    def _resolve(self, probe: _TcpProbe):
+        try:
+            family, _type, _proto, _canonname, sockaddr = self._getaddrinfo(
+                probe.host, probe.port, socket.AF_UNSPEC, socket.SOCK_STREAM)[0]
+        except (socket.gaierror, UnicodeError) as e:
+            logger.debug(f"Could not resolve {probe.host}: {e}")
+            self._deliver(probe, 'offline')
+            return
+        probe.address = (family, sockaddr)
+        with self._lock:
+            self._queue.append(probe)
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeup_w.send(b'\x00')
+        except (BlockingIOError, OSError):
+            # 既に起床待ちのデータが溜まっている
+            pass
+
+    def _deliver(self, probe: _TcpProbe, status: str):
+        if probe.done:
+            return
+        probe.done = True
+        result_data = {
+            'status': status,
+            'response_time': round(probe.rtt, 3) if status == 'online' and probe.rtt is not None else None,
+            'packet_loss': 0.0 if status == 'online' else 100.0,
+        }
+        try:
+            probe.callback(result_data)
+        except Exception as e:
+            logger.error(f"Error handling TCP probe result for {probe.host}:{probe.port}: {e}")
+
+    def _finish(self, probe: _TcpProbe, status: str):
+        """ソケットを閉じて結果を通知（セレクタースレッドから呼ぶ）"""
+        if probe.sock is not None:
+            try:
+                self._selector.unregister(probe.sock)
+            except (KeyError, ValueError):
+                pass
+            probe.sock.close()
+            probe.sock = None
+            self._in_flight -= 1
+        self._deliver(probe, status)
+
+    def _start_connects(self, now: float):
+        while self._in_flight < self.max_in_flight:
+            with self._lock:
+                if not self._queue:
+                    return
+                probe = self._queue.popleft()
+            family, sockaddr = probe.address
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+            except OSError as e:
+                logger.error(f"Could not create socket for {probe.host}: {e}")
+                self._deliver(probe, 'unknown')
+                continue
+            sock.setblocking(False)
+            probe.sock = sock
+            probe.started_at = now
+            probe.deadline = now + probe.timeout
+            self._in_flight += 1
+            error = sock.connect_ex(sockaddr)
+            if error not in _CONNECT_PENDING:
+                self._finish(probe, 'offline')
+                continue
+            self._selector.register(sock, selectors.EVENT_WRITE, probe)
+            heapq.heappush(self._deadlines, (probe.deadline, next(self._counter), probe))
+
+    def _handle_event(self, probe: _TcpProbe, events: int, now: float):
+        if probe.rtt is None:
+            # connect の完了（成否は SO_ERROR で判定）
+            error = probe.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error != 0:
+                self._finish(probe, 'offline')
+                return
+            probe.rtt = (now - probe.started_at) * 1000.0
+            if not probe.read_banner:
+                self._finish(probe, 'online')
+                return
+            self._selector.modify(probe.sock, selectors.EVENT_READ, probe)
+            return
+        try:
+            banner = probe.sock.recv(256)
+        except BlockingIOError:
+            return
+        except OSError:
+            banner = b''
+        self._finish(probe, 'online' if banner.startswith(SSH_BANNER_PREFIX) else 'offline')
+
+    def _expire(self, now: float):
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _deadline, _count, probe = heapq.heappop(self._deadlines)
+            if not probe.done:
+                self._finish(probe, 'offline')
+
+    def _run(self):
+        while True:
+            try:
+                now = time.monotonic()
+                self._start_connects(now)
+                while self._deadlines and self._deadlines[0][2].done:
+                    heapq.heappop(self._deadlines)
+                timeout = max(0.0, self._deadlines[0][0] - now) if self._deadlines else None
+                events = self._selector.select(timeout)
+                now = time.monotonic()
+                for key, mask in events:
+                    if key.data is None:
+                        try:
+                            while self._wakeup_r.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                        continue
+                    self._handle_event(key.data, mask, now)
+                self._expire(now)
+            except Exception as e:
+                logger.error(f"TCP prober loop error: {e}")
+                time.sleep(0.1)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            queued = len(self._queue)
+        return {'in_flight': self._in_flight, 'queued': queued, 'max_in_flight': self.max_in_flight}